@@ -86,6 +86,48 @@ export async function getMLPredictions(data: {
   }
 }
 
+export async function getMLPredictionsBatch(items: {
+  category: string;
+  restaurant_type: string;
+  quantity: number;
+  purchase_date: string;
+  expiry_date: string;
+}[]): Promise<(MLPrediction | null)[]> {
+  if (items.length === 0) return [];
+  try {
+    // Validate and format every item the same way as getMLPredictions
+    const validatedItems = items.map(data => ({
+      category: validateCategory(data.category),
+      restaurant_type: validateRestaurantType(data.restaurant_type),
+      quantity: Math.max(0, parseFloat(data.quantity.toString()) || 0),
+      purchase_date: formatDateForML(data.purchase_date),
+      expiry_date: formatDateForML(data.expiry_date),
+    }));
+
+    const response = await fetch(`${ML_API_URL}/predict/batch`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ items: validatedItems }),
+    });
+
+    if (!response.ok) {
+      return items.map(() => null);
+    }
+
+    const result = await response.json();
+    if (!result.success || !Array.isArray(result.results)) {
+      return items.map(() => null);
+    }
+    // Results come back in input order; failed items map to null
+    return result.results.map((r: { success: boolean; predictions?: MLPrediction }) =>
+      r && r.success && r.predictions ? r.predictions : null
+    );
+  } catch (error) {
+    console.error('ML API batch error:', error);
+    return items.map(() => null);
+  }
+}
+
 export async function predictExpiration(data: {
   category: string;
   restaurant_type: string;
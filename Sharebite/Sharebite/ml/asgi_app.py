@@ -0,0 +1,424 @@
+"""
+ASGI serving mode with request micro-batching
+
+Every /predict/* request is queued instead of being scored on its own. A
+background batcher takes what has arrived, waits up to ML_MAX_WAIT_MS for
+more (or until ML_MAX_BATCH items are pending), scores the combined batch
+with one call per model (ml_api.score_items) in a worker thread and hands
+each waiting request its own row. While a batch is being scored the next one
+builds up in the queue, so bursts from many restaurants share model calls.
+A /predict/batch request is already a batch: it is scored as one unit on the
+same scoring thread, in turn with the micro-batches.
+
+Responses match the Flask endpoints. GET /batcher/stats reports p50/p99
+request latency and batch sizes, and GET /metrics the per-stage timings
+(metrics.py) of requests and of the scored micro-batches. Each micro-batch is
+scored by one model version, reported in the X-Model-Version header; POST
+/models/reload swaps versions without dropping queued requests.
+
+POST /predict/stream bypasses the batcher: newline-delimited JSON items are
+scored in ML_STREAM_CHUNK chunks as the body arrives and each chunk's result
+lines are sent before the next one is read. POST /match/donations also
+bypasses it and runs ngo_matching in a worker thread, as do the /inventory
+routes, which keep the urgency queue of inventory_queue.py.
+
+Usage (from ml/, after training):
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from urllib.parse import parse_qs
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import numpy as np
+
+import metrics
+import ml_api
+
+# Most items scored by one model call
+MAX_BATCH = int(os.environ.get('ML_MAX_BATCH', '64'))
+
+# How long the first queued request waits for others to join its batch
+MAX_WAIT_MS = float(os.environ.get('ML_MAX_WAIT_MS', '2'))
+
+# Recent requests/batches kept for the latency and batch size percentiles
+STATS_WINDOW = 10000
+
+CORS_HEADERS = [
+    (b'access-control-allow-origin', b'*'),
+    (b'access-control-allow-headers', b'Content-Type'),
+    (b'access-control-allow-methods', b'GET, POST, DELETE, OPTIONS'),
+    (b'access-control-expose-headers', b'X-Model-Version'),
+]
+
+def percentiles(values, qs=(50, 99)):
+    """Percentiles in milliseconds of a window of durations in seconds"""
+    if not values:
+        return {f'p{q}': None for q in qs}
+    result = np.percentile(np.fromiter(values, dtype=np.float64), qs) * 1000
+    return {f'p{q}': float(v) for q, v in zip(qs, result)}
+
+class MicroBatcher:
+    """Collects single items from concurrent requests and scores them together"""
+
+    def __init__(self, score, max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS):
+        self.score = score
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.latencies = deque(maxlen=STATS_WINDOW)
+        self.score_times = deque(maxlen=STATS_WINDOW)
+        self.batch_sizes = deque(maxlen=STATS_WINDOW)
+        self.requests = 0
+        self.items = 0
+        self.batches = 0
+        self._pending = deque()
+        self._task = None
+        self._executor = None
+
+    def start(self):
+        if self._task is None:
+            # Scoring runs off the event loop; one thread keeps the model calls serialized
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='batcher')
+            # Events are created here so they belong to the running loop
+            self._has_items = asyncio.Event()
+            self._full = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._executor.shutdown(wait=False)
+
+    async def submit(self, item):
+        """Queue one item and wait for its score_items result"""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((item, future))
+        self._has_items.set()
+        if len(self._pending) >= self.max_batch:
+            self._full.set()
+        return await future
+
+    async def submit_batch(self, items):
+        """Score an explicit batch as one unit, in turn with the micro-batches; one result per item"""
+        self.start()
+        start = time.perf_counter()
+        results = await asyncio.get_running_loop().run_in_executor(self._executor, self.score, items)
+        self.score_times.append(time.perf_counter() - start)
+        self.batch_sizes.append(len(items))
+        self.batches += 1
+        self.items += len(items)
+        return results
+
+    def record(self, seconds):
+        """Record the end-to-end latency of one request"""
+        self.requests += 1
+        self.latencies.append(seconds)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._has_items.wait()
+            if len(self._pending) < self.max_batch and self.max_wait > 0:
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.max_wait)
+                except asyncio.TimeoutError:
+                    pass
+
+            batch = [self._pending.popleft() for _ in range(min(len(self._pending), self.max_batch))]
+            if not self._pending:
+                self._has_items.clear()
+            if len(self._pending) < self.max_batch:
+                self._full.clear()
+            # Requests whose client went away are not scored
+            batch = [(item, future) for item, future in batch if not future.done()]
+            if not batch:
+                continue
+
+            start = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(self._executor, self.score, [item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.score_times.append(time.perf_counter() - start)
+            self.batch_sizes.append(len(batch))
+            self.batches += 1
+            self.items += len(batch)
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self):
+        sizes = np.fromiter(self.batch_sizes, dtype=np.float64)
+        return {
+            'max_batch': self.max_batch,
+            'max_wait_ms': self.max_wait * 1000,
+            'requests': self.requests,
+            'items': self.items,
+            'batches': self.batches,
+            'pending': len(self._pending),
+            'mean_batch_size': float(sizes.mean()) if len(sizes) else None,
+            'max_batch_size': int(sizes.max()) if len(sizes) else None,
+            'latency_ms': percentiles(self.latencies),
+            'score_ms': percentiles(self.score_times),
+        }
+
+def score_batch(items):
+    """(model version, score_items result) per item of one micro-batch, timed as its own pseudo-endpoint"""
+    metrics.start('micro_batch')
+    status = 500
+    try:
+        # The whole batch is scored by the version active when it starts
+        serving = ml_api.active
+        results = ml_api.score_items(items, serving=serving)
+        status = 200
+        return [(serving.version, result) for result in results]
+    finally:
+        metrics.finish(status)
+
+batcher = MicroBatcher(score_batch)
+
+# Shape of each single-prediction endpoint's response, built from the /predict/all result
+ENDPOINT_RESPONSES = {
+    '/predict/expiration': lambda p: ml_api.expiration_response(p['expiration_days']),
+    '/predict/waste-risk': lambda p: ml_api.waste_risk_response(p['waste_risk'], p['waste_risk_level']),
+    '/predict/donation': lambda p: ml_api.donation_response(p['should_donate'], p['donation_probability']),
+    '/predict/priority': lambda p: ml_api.priority_response(p['priority_score'], p['priority_level']),
+    '/predict/all': lambda p: {'success': True, 'predictions': p},
+}
+
+async def read_body(receive):
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise ConnectionError('Client disconnected')
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+    return body
+
+async def send_body(send, status, body, content_type=None, version=None):
+    headers = [(b'content-length', str(len(body)).encode())] + CORS_HEADERS
+    if content_type is not None:
+        headers.append((b'content-type', content_type.encode()))
+    if version is None and ml_api.active is not None:
+        version = ml_api.active.version
+    if version is not None:
+        headers.append((b'x-model-version', version.encode()))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+async def send_json(send, status, payload=None, version=None):
+    if payload is None:
+        await send_body(send, status, b'', version=version)
+    else:
+        await send_body(send, status, json.dumps(payload).encode(), 'application/json', version)
+
+async def predict(path, data):
+    """(status, payload, model version) for one /predict/* request"""
+    if not ml_api.models_loaded():
+        return 500, {'success': False, 'error': 'Models not loaded. Please restart the API server.'}, None
+
+    if path == '/predict/batch':
+        items = data.get('items') if isinstance(data, dict) else data
+        if not isinstance(items, list):
+            return 400, {'success': False, 'error': 'Request body must be a list of items or {"items": [...]}'}, None
+        if len(items) > ml_api.MAX_BATCH_SIZE:
+            return 400, {'success': False, 'error': f'Batch too large: {len(items)} items (max {ml_api.MAX_BATCH_SIZE})'}, None
+        # Already a batch: one vectorized score_items call instead of max-batch-sized pieces
+        scored = await batcher.submit_batch(items)
+        results = [result for _, result in scored]
+        version = scored[0][0] if scored else None
+        return 200, {'success': True, 'count': len(results), 'results': results}, version
+
+    version, result = await batcher.submit(data)
+    if not result['success']:
+        return 400, result, version
+    return 200, ENDPOINT_RESPONSES[path](result['predictions']), version
+
+async def reload_models(data):
+    """(status, payload) for POST /models/reload; the load runs off the event loop"""
+    version = data.get('version') if isinstance(data, dict) else None
+    result = await asyncio.get_running_loop().run_in_executor(None, ml_api.reload_models, version)
+    if result is None:
+        return 409, {'success': False, 'error': 'A reload is already in progress'}
+    if not result['success']:
+        return 500, {'success': False, 'error': 'Failed to load models', 'reload': result}
+    return 200, {'success': True, 'reload': result}
+
+async def stream_predictions(receive, send):
+    """POST /predict/stream: score NDJSON body lines chunk by chunk while the body is still arriving"""
+    serving = ml_api.active
+    if not ml_api.models_loaded(serving):
+        await send_json(send, 500, {'success': False, 'error': 'Models not loaded. Please restart the API server.'})
+        return 500
+    headers = CORS_HEADERS + [(b'content-type', ml_api.NDJSON_CONTENT_TYPE.encode()),
+                              (b'x-model-version', serving.version.encode())]
+    await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+
+    loop = asyncio.get_running_loop()
+    today = date.today()
+    chunk_size = ml_api.STREAM_CHUNK_SIZE
+    lines = []
+    partial = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return 499
+        more_body = message.get('more_body', False)
+        *complete, partial = (partial + message.get('body', b'')).split(b'\n')
+        lines.extend(complete)
+        if not more_body:
+            lines.append(partial)
+        while len(lines) >= chunk_size or (lines and not more_body):
+            chunk, lines = lines[:chunk_size], lines[chunk_size:]
+            body = await loop.run_in_executor(None, ml_api.score_ndjson, chunk, today, serving)
+            await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+    await send({'type': 'http.response.body', 'body': b''})
+    return 200
+
+async def handle_http(scope, receive, send):
+    method, path = scope['method'], scope['path']
+    if method == 'OPTIONS':
+        await send_json(send, 204)
+        return
+    if path == '/health' and method == 'GET':
+        serving = ml_api.active
+        await send_json(send, 200, {
+            'status': 'healthy',
+            'models_loaded': ml_api.models_loaded(serving),
+            'model_version': serving.version if serving is not None else None,
+        }, serving.version if serving is not None else None)
+    elif path == '/models' and method == 'GET':
+        await send_json(send, 200, {
+            'success': True,
+            'active': ml_api.active.describe() if ml_api.active is not None else None,
+            'versions': ml_api.model_registry.list_versions(ml_api.MODELS_DIR),
+            'last_reload': ml_api.last_reload,
+            'reloading': ml_api.reload_lock.locked(),
+        })
+    elif path == '/models/reload' and method == 'POST':
+        try:
+            body = await read_body(receive)
+        except ConnectionError:
+            return
+        try:
+            data = json.loads(body) if body else {}
+        except ValueError:
+            data = {}
+        status, payload = await reload_models(data)
+        await send_json(send, status, payload)
+    elif path == '/metrics' and method == 'GET':
+        await send_body(send, 200, metrics.registry.render().encode(), metrics.CONTENT_TYPE)
+    elif path == '/batcher/stats' and method == 'GET':
+        await send_json(send, 200, {'success': True, 'batcher': batcher.stats()})
+    elif path == '/cache/stats' and method == 'GET':
+        await send_json(send, 200, {'success': True, 'cache': ml_api.prediction_cache.stats()})
+    elif path == '/cache/flush' and method == 'POST':
+        ml_api.prediction_cache.flush()
+        await send_json(send, 200, {'success': True, 'cache': ml_api.prediction_cache.stats()})
+    elif path == '/match/donations' and method == 'POST':
+        # Not micro-batched: the matching is one request's work, run off the event loop
+        metrics.start(path)
+        serving = ml_api.active
+        try:
+            data = json.loads(await read_body(receive))
+        except ConnectionError:
+            return
+        except ValueError:
+            data = None
+        metrics.lap('parse')
+        status, payload = await asyncio.get_running_loop().run_in_executor(
+            None, ml_api.match_request, data, None, serving)
+        metrics.lap('match')
+        await send_json(send, status, payload, serving.version if serving is not None else None)
+        metrics.finish(status, 'serialize')
+    elif path == '/inventory/items' and method in ('POST', 'DELETE'):
+        metrics.start(path)
+        try:
+            data = json.loads(await read_body(receive) or b'null')
+        except ConnectionError:
+            return
+        except ValueError:
+            data = None
+        metrics.lap('parse')
+        handler = ml_api.inventory_upsert_request if method == 'POST' else ml_api.inventory_delete_request
+        status, payload = await asyncio.get_running_loop().run_in_executor(None, handler, data)
+        await send_json(send, status, payload)
+        metrics.finish(status, 'serialize')
+    elif path == '/inventory/urgent' and method == 'GET':
+        # Usually a heap read; in the executor because the first read of a new day may rescore
+        query = parse_qs(scope.get('query_string', b'').decode())
+        status, payload = await asyncio.get_running_loop().run_in_executor(
+            None, ml_api.inventory_urgent_request, query.get('restaurant_id', [None])[0], query.get('k', [None])[0])
+        await send_json(send, status, payload)
+    elif path == '/inventory/stats' and method == 'GET':
+        status, payload = ml_api.inventory_stats_request()
+        await send_json(send, status, payload)
+    elif path == '/predict/stream' and method == 'POST':
+        metrics.start(path)
+        status = await stream_predictions(receive, send)
+        metrics.finish(status)
+    elif path in ENDPOINT_RESPONSES or path == '/predict/batch':
+        if method != 'POST':
+            await send_json(send, 405, {'success': False, 'error': 'Method not allowed'})
+            return
+        start = time.perf_counter()
+        metrics.start(path)
+        try:
+            data = json.loads(await read_body(receive))
+            metrics.lap('parse')
+            status, payload, version = await predict(path, data)
+            # Queueing plus the shared micro-batch (whose own stages are under micro_batch)
+            metrics.lap('batch')
+        except ConnectionError:
+            return
+        except Exception as e:
+            status, payload, version = 400, {'success': False, 'error': str(e)}, None
+        await send_json(send, status, payload, version)
+        metrics.finish(status, 'serialize')
+        batcher.record(time.perf_counter() - start)
+    else:
+        await send_json(send, 404, {'success': False, 'error': 'Not found'})
+
+async def handle_lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # Blocking load before the server accepts connections
+            if not ml_api.models_loaded():
+                print("Loading ML models...")
+                if not ml_api.load_models():
+                    await send({'type': 'lifespan.startup.failed',
+                                'message': 'Failed to load models. Please train models first.'})
+                    return
+            batcher.start()
+            ml_api.start_model_watcher()
+            ml_api.start_inventory_rollover()
+            print(f"Micro-batching: max batch {batcher.max_batch}, max wait {batcher.max_wait * 1000:g} ms")
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await batcher.stop()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    """ASGI application"""
+    if scope['type'] == 'lifespan':
+        await handle_lifespan(receive, send)
+    elif scope['type'] == 'http':
+        await handle_http(scope, receive, send)
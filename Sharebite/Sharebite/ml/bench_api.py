@@ -0,0 +1,221 @@
+"""
+Latency and throughput benchmark for the ml_api endpoints
+
+Drives the Flask app in-process through its test client (no network) with
+payloads built from generate_dataset.py. Every single-item endpoint and
+/predict/batch with several batch sizes are run at each concurrency level
+(client threads sharing the app, as in the threaded server) for a fixed
+time. Each scenario records p50/p95/p99 latency, requests and predictions per
+second and process CPU time per prediction. Results are saved as JSON with
+the commit and settings they were measured at; --baseline compares a run
+against an earlier one and exits non-zero on regressions.
+
+The prediction cache is disabled unless --cache is given, so every request
+is scored. Other ML_* settings are taken from the environment and recorded.
+
+Usage (from the directory containing models/):
+    python ml/bench_api.py [--duration 2] [--concurrency 1,4,16] [--json bench_api.json]
+    python ml/bench_api.py --baseline bench_api_before.json [--threshold 0.1]
+    python ml/bench_api.py --compare bench_api_before.json bench_api_after.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+ML_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Single-item endpoints (path suffix after /predict/)
+ENDPOINTS = ['expiration', 'waste-risk', 'donation', 'priority', 'all']
+
+# Settings that change what is measured, recorded with every run
+RECORDED_ENV = ['ML_MODEL_BACKEND', 'ML_USE_FUSED', 'ML_USE_LOOKUP', 'ML_COMPACT', 'ML_CACHE_SIZE', 'ML_MMAP']
+
+def build_payloads(n, seed):
+    """Request items from generated rows, with dates around today like live traffic"""
+    from generate_dataset import generate_dataset
+    df = generate_dataset(n, seed=seed, now=datetime.combine(datetime.now().date(), datetime.min.time()))
+    return [
+        {
+            'category': category,
+            'restaurant_type': restaurant_type,
+            'quantity': int(quantity),
+            'purchase_date': purchase.date().isoformat(),
+            'expiry_date': expiry.date().isoformat(),
+        }
+        for category, restaurant_type, quantity, purchase, expiry in zip(
+            df['category'], df['restaurant_type'], df['quantity'], df['purchase_date'], df['expiry_date'])
+    ]
+
+def request_bodies(payloads, batch_size):
+    """Pre-encoded JSON bodies: single items, or {'items': [...]} batches of batch_size"""
+    if batch_size is None:
+        return [json.dumps(item) for item in payloads]
+    return [json.dumps({'items': payloads[i:i + batch_size]})
+            for i in range(0, len(payloads) - batch_size + 1, batch_size)]
+
+def run_scenario(app, path, bodies, items_per_request, concurrency, duration):
+    """Post bodies round-robin from `concurrency` client threads for `duration` seconds"""
+    latencies = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+    start_barrier = threading.Barrier(concurrency + 1)
+    deadline = [0.0]
+
+    def client(i):
+        client = app.test_client()
+        # Warm up this client's code paths before the clock starts
+        client.post(path, data=bodies[i % len(bodies)], content_type='application/json')
+        start_barrier.wait()
+        n = i
+        while time.perf_counter() < deadline[0]:
+            body = bodies[n % len(bodies)]
+            n += concurrency
+            start = time.perf_counter()
+            response = client.post(path, data=body, content_type='application/json')
+            latencies[i].append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors[i] += 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    # Every client is warm; start the clock for all of them at once
+    deadline[0] = time.perf_counter() + duration
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    start_barrier.wait()
+    for thread in threads:
+        thread.join()
+    cpu, wall = time.process_time() - cpu_start, time.perf_counter() - wall_start
+
+    times_ms = np.concatenate([np.array(l) for l in latencies]) * 1000
+    predictions = len(times_ms) * items_per_request
+    return {
+        'path': path,
+        'items_per_request': items_per_request,
+        'concurrency': concurrency,
+        'requests': int(len(times_ms)),
+        'errors': int(sum(errors)),
+        'p50_ms': float(np.percentile(times_ms, 50)),
+        'p95_ms': float(np.percentile(times_ms, 95)),
+        'p99_ms': float(np.percentile(times_ms, 99)),
+        'mean_ms': float(times_ms.mean()),
+        'requests_per_s': len(times_ms) / wall,
+        'predictions_per_s': predictions / wall,
+        'cpu_ms_per_prediction': cpu * 1000 / max(1, predictions),
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ML_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(args):
+    if not args.cache:
+        os.environ['ML_CACHE_SIZE'] = '0'
+    import ml_api
+    if not ml_api.load_models():
+        raise SystemExit(1)
+    app = ml_api.create_app()
+    payloads = build_payloads(args.payloads, args.seed)
+
+    scenarios = [(f'{endpoint}/single', f'/predict/{endpoint}', None) for endpoint in args.endpoints]
+    scenarios += [(f'batch/{size}', '/predict/batch', size) for size in args.batch_sizes]
+
+    results = {}
+    for label, path, batch_size in scenarios:
+        bodies = request_bodies(payloads, batch_size)
+        if not bodies:
+            print(f"Skipping {label}: fewer than {batch_size} payloads")
+            continue
+        for concurrency in args.concurrency:
+            key = f'{label}/c{concurrency}'
+            result = run_scenario(app, path, bodies, batch_size or 1, concurrency, args.duration)
+            results[key] = result
+            print(f"{key:24s} p50 {result['p50_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms  "
+                  f"p99 {result['p99_ms']:8.2f} ms  {result['requests_per_s']:8.1f} req/s  "
+                  f"{result['predictions_per_s']:9.1f} pred/s  {result['cpu_ms_per_prediction']:7.3f} ms CPU/pred"
+                  + (f"  {result['errors']} errors" if result['errors'] else ''))
+
+    import sklearn
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'sklearn': sklearn.__version__,
+            'cpu_count': os.cpu_count(),
+            'env': {name: os.environ.get(name) for name in RECORDED_ENV},
+            'settings': {'duration': args.duration, 'payloads': args.payloads, 'seed': args.seed},
+        },
+        'scenarios': results,
+    }
+
+def compare(baseline, current, threshold):
+    """Print per-scenario changes; returns the scenarios that regressed by more than threshold"""
+    regressions = []
+    print(f"\nBaseline {baseline['meta'].get('commit')} -> current {current['meta'].get('commit')}")
+    for key, result in current['scenarios'].items():
+        before = baseline['scenarios'].get(key)
+        if before is None:
+            continue
+        p50 = result['p50_ms'] / before['p50_ms'] - 1
+        p99 = result['p99_ms'] / before['p99_ms'] - 1
+        throughput = result['predictions_per_s'] / before['predictions_per_s'] - 1
+        regressed = p50 > threshold or throughput < -threshold
+        if regressed:
+            regressions.append(key)
+        print(f"{key:24s} p50 {p50:+7.1%}  p99 {p99:+7.1%}  throughput {throughput:+7.1%}"
+              + ('  REGRESSION' if regressed else ''))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark ml_api endpoint latency and throughput')
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS),
+                        type=lambda s: [e for e in s.split(',') if e])
+    parser.add_argument('--batch-sizes', default='10,100,1000',
+                        type=lambda s: [int(b) for b in s.split(',') if b])
+    parser.add_argument('--concurrency', default='1,4,16', type=lambda s: [int(c) for c in s.split(',') if c])
+    parser.add_argument('--duration', type=float, default=2.0, help='seconds per scenario')
+    parser.add_argument('--payloads', type=int, default=5000, help='generated request items')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--cache', action='store_true', help='keep the prediction cache enabled')
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--baseline', help='compare the run against this earlier result file')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help='only compare two result files')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='relative p50 or throughput change counted as a regression')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        with open(args.compare[1]) as f:
+            current = json.load(f)
+    else:
+        current = run_benchmarks(args)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(current, f, indent=2)
+            print(f"Saved: {args.json}")
+        if not args.baseline:
+            return
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    regressions = compare(baseline, current, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} scenario(s) regressed by more than {args.threshold:.0%}")
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Training data load benchmark: CSV vs typed Parquet
+
+Writes one generated dataset as CSV and as Parquet, then loads it in a fresh
+process per mode: the old full CSV read with date parsing, and the Parquet
+read of all columns or only the columns train_models.py uses. Reports load
+time and peak resident memory (and the part added by the load itself).
+
+Usage (from ml/):
+    python bench_dataset_io.py [--rows 2000000] [--json dataset_io_report.json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+MODES = {
+    'csv': ('food_waste_dataset.csv', False),
+    'csv_training_columns': ('food_waste_dataset.csv', True),
+    'parquet': ('food_waste_dataset.parquet', False),
+    'parquet_training_columns': ('food_waste_dataset.parquet', True),
+}
+
+def status_mb(key):
+    """A memory counter of this process from /proc (Linux only)"""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(key + ':'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+def reset_peak_rss():
+    # Writing 5 to clear_refs resets VmHWM, so the peak covers only what follows
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+def measure_child(path, training_columns):
+    """Run inside a fresh process: load the dataset once and print JSON"""
+    from dataset_io import read_dataset
+    from train_models import DATASET_COLUMNS
+    before = status_mb('VmRSS')
+    reset_peak_rss()
+    start = time.perf_counter()
+    df = read_dataset(path, columns=DATASET_COLUMNS if training_columns else None)
+    load_s = time.perf_counter() - start
+    print(json.dumps({
+        'rows': len(df),
+        'columns': df.shape[1],
+        'load_s': load_s,
+        'peak_rss_mb': status_mb('VmHWM'),
+        'load_rss_mb': status_mb('VmHWM') - before,
+        'frame_mb': df.memory_usage(deep=True).sum() / 1e6,
+    }))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark training data loading')
+    parser.add_argument('--child', nargs=2, help=argparse.SUPPRESS)
+    parser.add_argument('--rows', type=int, default=2_000_000)
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args(argv)
+
+    if args.child:
+        measure_child(args.child[0], args.child[1] == '1')
+        return
+
+    from generate_dataset import generate_dataset
+    from dataset_io import write_dataset
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        df = generate_dataset(args.rows, now=datetime(2026, 1, 1, 12))
+        df.to_csv(os.path.join(tmp, 'food_waste_dataset.csv'), index=False)
+        write_dataset(df, os.path.join(tmp, 'food_waste_dataset.parquet'))
+        del df
+
+        for mode, (name, training_columns) in MODES.items():
+            path = os.path.join(tmp, name)
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--child', path, '1' if training_columns else '0'],
+                capture_output=True, text=True, check=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            result['file_mb'] = os.path.getsize(path) / 1e6
+            results[mode] = result
+            print(f"{mode:26s} {result['columns']:3d} columns  load {result['load_s']:7.2f} s  "
+                  f"peak RSS {result['peak_rss_mb']:7.1f} MB (+{result['load_rss_mb']:6.1f} MB)  "
+                  f"file {result['file_mb']:7.1f} MB")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'rows': args.rows, 'results': results}, f, indent=2)
+        print(f"Saved: {args.json}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Dataset generation throughput: row-by-row generator vs the columnar one
+
+Times generate_dataset_legacy (one generate_food_item call per row) and the
+vectorized generate_dataset at each size and reports rows per second. The
+legacy generator is only run up to --legacy-max-rows.
+
+Usage (from ml/):
+    python bench_generate.py [--rows 15000,100000,1000000,10000000] [--json generate_report.json]
+"""
+import argparse
+import json
+import time
+
+from generate_dataset import generate_dataset, generate_dataset_legacy
+
+def time_generator(generate, n_rows, repeats):
+    """Best wall time of `repeats` runs"""
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        generate(n_rows)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark synthetic dataset generation')
+    parser.add_argument('--rows', default='15000,100000,1000000',
+                        type=lambda s: [int(n) for n in s.split(',')])
+    parser.add_argument('--legacy-max-rows', type=int, default=100000)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args(argv)
+
+    results = []
+    for n_rows in args.rows:
+        result = {'rows': n_rows}
+        for name, generate in (('legacy', generate_dataset_legacy), ('vectorized', generate_dataset)):
+            if name == 'legacy' and n_rows > args.legacy_max_rows:
+                continue
+            seconds = time_generator(generate, n_rows, args.repeats)
+            result[f'{name}_s'] = seconds
+            result[f'{name}_rows_per_s'] = n_rows / seconds
+        results.append(result)
+
+        line = f"{n_rows:>10d} rows  vectorized {result['vectorized_rows_per_s']:>12,.0f} rows/s"
+        if 'legacy_s' in result:
+            line += (f"  legacy {result['legacy_rows_per_s']:>10,.0f} rows/s"
+                     f"  speedup {result['legacy_s'] / result['vectorized_s']:6.1f}x")
+        print(line)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved: {args.json}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Most urgent items per restaurant: inventory queue vs rescoring on every load
+
+Fills an inventory_queue.InventoryQueue with generated items spread over
+restaurants, then times what a dashboard load costs both ways: reading the
+top k from the queue, and scoring all of the restaurant's items with
+ml_api.score_items and sorting them (what the dashboard does today). Also
+times single-item edits and the midnight rescore of everything, and checks
+that both ways rank the same urgency values.
+
+Usage (from ml/, after training):
+    python bench_inventory.py [--items 20000] [--restaurants 50] [--k 10] [--json inventory_report.json]
+"""
+import argparse
+import json
+import random
+import time
+from datetime import date, timedelta
+
+import ml_api
+from inventory_queue import InventoryQueue, urgency_key
+
+CATEGORIES = ['Fruits', 'Vegetables', 'Dairy', 'Meat', 'Seafood', 'Bakery', 'Grains']
+RESTAURANT_TYPES = ['Fast Food', 'Fine Dining', 'Cafe', 'Buffet', 'Casual Dining']
+
+def generate(n_items, n_restaurants, seed):
+    rng = random.Random(seed)
+    today = date.today()
+    items = []
+    for i in range(n_items):
+        purchased = today - timedelta(days=rng.randint(0, 7))
+        items.append({
+            'id': f'i{i}',
+            'restaurant_id': f'r{i % n_restaurants}',
+            'category': rng.choice(CATEGORIES),
+            'restaurant_type': rng.choice(RESTAURANT_TYPES),
+            'quantity': rng.randint(1, 60),
+            'purchase_date': purchased.isoformat(),
+            'expiry_date': (purchased + timedelta(days=rng.randint(1, 21))).isoformat(),
+        })
+    return items
+
+def rescore_top(items, k):
+    """Urgency keys of the k most urgent items, scoring every item"""
+    results = ml_api.score_items(items, cache=False)
+    return sorted(urgency_key(r['predictions']) for r in results)[:k]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the inventory priority queue')
+    parser.add_argument('--items', type=int, default=20000)
+    parser.add_argument('--restaurants', type=int, default=50)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--loads', type=int, default=200, help='dashboard loads timed per method')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args(argv)
+
+    if not ml_api.load_models():
+        raise SystemExit('Failed to load models. Please train models first.')
+    serving = ml_api.active
+    # The queue's clock, moved to the next day to time the midnight rescore
+    day = [date.today()]
+    queue = InventoryQueue(lambda items, today, serving: ml_api.score_items(items, today, serving, cache=False),
+                           today=lambda: day[0])
+    items = generate(args.items, args.restaurants, args.seed)
+    by_restaurant = {}
+    for item in items:
+        by_restaurant.setdefault(item['restaurant_id'], []).append(item)
+    rng = random.Random(args.seed)
+
+    start = time.perf_counter()
+    for offset in range(0, len(items), ml_api.MAX_BATCH_SIZE):
+        queue.upsert(items[offset:offset + ml_api.MAX_BATCH_SIZE], serving)
+    insert_s = time.perf_counter() - start
+
+    restaurants = [f'r{rng.randrange(args.restaurants)}' for _ in range(args.loads)]
+    start = time.perf_counter()
+    for restaurant_id in restaurants:
+        queue.top(restaurant_id, args.k)
+    queue_ms = (time.perf_counter() - start) / args.loads * 1000
+
+    rescore_loads = restaurants[:max(1, args.loads // 10)]
+    start = time.perf_counter()
+    for restaurant_id in rescore_loads:
+        rescore_top(by_restaurant[restaurant_id], args.k)
+    rescore_ms = (time.perf_counter() - start) / len(rescore_loads) * 1000
+
+    same = all([urgency_key(r['predictions']) for r in queue.top(restaurant_id, args.k)]
+               == rescore_top(by_restaurant[restaurant_id], args.k) for restaurant_id in set(rescore_loads))
+
+    edits = [dict(items[rng.randrange(len(items))], quantity=rng.randint(1, 60)) for _ in range(args.loads)]
+    start = time.perf_counter()
+    for item in edits:
+        queue.upsert([item], serving)
+    edit_ms = (time.perf_counter() - start) / len(edits) * 1000
+
+    day[0] += timedelta(days=1)
+    start = time.perf_counter()
+    queue.refresh(serving)
+    rollover_s = time.perf_counter() - start
+
+    results = {
+        'items': args.items,
+        'restaurants': args.restaurants,
+        'k': args.k,
+        'insert_s': insert_s,
+        'queue_top_ms': queue_ms,
+        'rescore_top_ms': rescore_ms,
+        'speedup': rescore_ms / queue_ms,
+        'edit_ms': edit_ms,
+        'rollover_s': rollover_s,
+        'same_ranking': same,
+    }
+    print(f"{args.items:,d} items in {args.restaurants} restaurants, top {args.k}")
+    print(f"  initial scoring      {insert_s:8.2f} s")
+    print(f"  dashboard load       queue {queue_ms:8.3f} ms   rescore {rescore_ms:8.2f} ms   "
+          f"speedup {results['speedup']:,.0f}x" + ('' if same else '   RANKINGS DIFFER'))
+    print(f"  single-item edit     {edit_ms:8.2f} ms")
+    print(f"  midnight rescore     {rollover_s:8.2f} s")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved: {args.json}")
+
+if __name__ == '__main__':
+    main()
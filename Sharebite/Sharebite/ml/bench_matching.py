@@ -0,0 +1,117 @@
+"""
+Donation matching: ball tree and expiry heap vs a full items x NGOs scan
+
+Generates donations and NGOs spread over a city, runs ngo_matching.
+match_donations and a reference matcher that computes every donation-NGO
+distance and takes the donations in the same order, checks that both make
+the same assignments and reports the time of each.
+
+Usage (from ml/):
+    python bench_matching.py [--items 2000,10000] [--ngos 200,2000,5000] [--json matching_report.json]
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from ngo_matching import DEFAULT_MAX_DISTANCE_KM, DEFAULT_RATING, EARTH_RADIUS_KM, RATING_WEIGHT, match_donations
+from postprocess import SAFE_DAYS_PAST_EXPIRY
+
+# Points are spread over roughly 60 x 60 km around this center
+CENTER = (28.61, 77.21)
+SPREAD_DEGREES = 0.27
+
+def generate(n_items, n_ngos, seed):
+    """(donations, ngos) as the dicts match_donations takes"""
+    rng = np.random.default_rng(seed)
+    def points(n):
+        return rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES, size=(n, 2)) + CENTER
+    donations = [
+        {'id': f'd{i}', 'latitude': lat, 'longitude': lon, 'quantity': int(q),
+         'expiration_days': int(days), 'priority_score': float(score)}
+        for i, ((lat, lon), q, days, score) in enumerate(zip(
+            points(n_items), rng.integers(1, 60, n_items), rng.integers(-4, 10, n_items),
+            rng.uniform(0, 100, n_items)))
+    ]
+    # Total capacity below the total quantity, so NGOs fill up and donations go unmatched
+    capacity = rng.integers(20, 2 * 30 * max(1, n_items // n_ngos), n_ngos)
+    ngos = [
+        {'id': f'n{j}', 'latitude': lat, 'longitude': lon, 'capacity': int(c), 'rating': float(r)}
+        for j, ((lat, lon), c, r) in enumerate(zip(points(n_ngos), capacity, rng.uniform(1, 5, n_ngos)))
+    ]
+    return donations, ngos
+
+def match_scan(donations, ngos, max_distance_km=DEFAULT_MAX_DISTANCE_KM):
+    """Reference matcher: the full distance matrix and a scan of every NGO per donation"""
+    def radians(records):
+        return np.radians([[r['latitude'], r['longitude']] for r in records])
+    items, centers = radians(donations), radians(ngos)
+    # Haversine distance of every (donation, NGO) pair
+    dlat = items[:, None, 0] - centers[None, :, 0]
+    dlon = items[:, None, 1] - centers[None, :, 1]
+    a = np.sin(dlat / 2) ** 2 + np.cos(items[:, None, 0]) * np.cos(centers[None, :, 0]) * np.sin(dlon / 2) ** 2
+    distance_km = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+    remaining = np.array([n.get('capacity', np.inf) for n in ngos], dtype=np.float64)
+    ratings = np.array([n.get('rating', DEFAULT_RATING) for n in ngos], dtype=np.float64)
+    cost_factor = 1 + RATING_WEIGHT * (5 - ratings) / 4
+    order = sorted(range(len(donations)), key=lambda i: (
+        donations[i]['expiration_days'], -donations[i]['priority_score'], -donations[i]['quantity'], i))
+    assignments = {}
+    for i in order:
+        donation = donations[i]
+        if donation['expiration_days'] < -SAFE_DAYS_PAST_EXPIRY:
+            continue
+        feasible = (distance_km[i] <= max_distance_km) & (remaining >= donation['quantity'])
+        if not feasible.any():
+            continue
+        best = int(np.argmin(np.where(feasible, distance_km[i] * cost_factor, np.inf)))
+        remaining[best] -= donation['quantity']
+        assignments[donation['id']] = ngos[best]['id']
+    return assignments
+
+def best_time(match, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = match()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark donation-to-NGO matching')
+    parser.add_argument('--items', default='2000,10000', type=lambda s: [int(n) for n in s.split(',')])
+    parser.add_argument('--ngos', default='200,2000,5000', type=lambda s: [int(n) for n in s.split(',')])
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args(argv)
+
+    results = []
+    for n_ngos in args.ngos:
+        for n_items in args.items:
+            donations, ngos = generate(n_items, n_ngos, args.seed)
+            indexed_s, (matches, unmatched, _) = best_time(lambda: match_donations(donations, ngos), args.repeats)
+            scan_s, reference = best_time(lambda: match_scan(donations, ngos), args.repeats)
+            same = {m['donation_id']: m['ngo_id'] for m in matches} == reference
+            results.append({
+                'items': n_items,
+                'ngos': n_ngos,
+                'matched': len(matches),
+                'unmatched': len(unmatched),
+                'indexed_ms': indexed_s * 1000,
+                'scan_ms': scan_s * 1000,
+                'same_assignments': same,
+            })
+            print(f"{n_items:>7d} items x {n_ngos:>5d} NGOs  indexed {indexed_s * 1000:9.1f} ms  "
+                  f"scan {scan_s * 1000:9.1f} ms  speedup {scan_s / indexed_s:5.1f}x  "
+                  f"matched {len(matches):>6d}" + ('' if same else '  ASSIGNMENTS DIFFER'))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved: {args.json}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Startup benchmark for ml_api: model load time and memory per worker process
+
+Each loading mode runs in a fresh process (as a gunicorn worker would) and
+reports the time to load models, the latency of the first /predict/all call
+and the process's resident memory. RssAnon is private to the process; RssFile
+is backed by the page cache and shared by every worker mapping the same files.
+
+Usage (from ml/, after training):
+    python bench_startup.py [--json startup_report.json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+MODES = {
+    'pickles': {'ML_MODEL_BACKEND': 'sklearn', 'ML_MMAP': '0', 'ML_LAZY_LOAD': '0'},
+    'compiled': {'ML_MODEL_BACKEND': 'compiled', 'ML_MMAP': '0', 'ML_LAZY_LOAD': '0'},
+    'compiled_mmap': {'ML_MODEL_BACKEND': 'compiled', 'ML_MMAP': '1', 'ML_LAZY_LOAD': '0'},
+    'compiled_mmap_lazy': {'ML_MODEL_BACKEND': 'compiled', 'ML_MMAP': '1', 'ML_LAZY_LOAD': '1'},
+}
+
+SAMPLE_ITEM = {
+    'category': 'Dairy',
+    'restaurant_type': 'Cafe',
+    'quantity': 25,
+    'purchase_date': '2024-01-01',
+    'expiry_date': '2024-01-10',
+}
+
+def memory_kb():
+    """Resident memory breakdown of this process from /proc (Linux only)"""
+    usage = {}
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in ('VmRSS', 'RssAnon', 'RssFile', 'RssShmem'):
+                    usage[key] = int(value.split()[0])
+    except OSError:
+        pass
+    return usage
+
+def measure_child():
+    """Run inside a fresh process: load models, score one item, print JSON"""
+    start = time.perf_counter()
+    import ml_api
+    import_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    loaded = ml_api.load_models()
+    load_s = time.perf_counter() - start
+    after_load = memory_kb()
+
+    client = ml_api.create_app(load=False).test_client()
+    start = time.perf_counter()
+    response = client.post('/predict/all', json=SAMPLE_ITEM)
+    first_request_s = time.perf_counter() - start
+
+    print(json.dumps({
+        'loaded': loaded and response.status_code == 200,
+        'import_s': import_s,
+        'load_s': load_s,
+        'first_request_s': first_request_s,
+        'memory_after_load_kb': after_load,
+        'memory_after_first_request_kb': memory_kb(),
+    }))
+
+def run_mode(env_overrides):
+    env = dict(os.environ, **env_overrides)
+    # Keep the cache and lookup table out of the measurement
+    env.update({'ML_CACHE_SIZE': '0', 'ML_USE_LOOKUP': '0'})
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child'],
+        env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark ml_api model loading')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args(argv)
+
+    if args.child:
+        measure_child()
+        return
+
+    results = {}
+    for mode, env in MODES.items():
+        runs = [run_mode(env) for _ in range(args.repeats)]
+        best = min(runs, key=lambda r: r['load_s'])
+        results[mode] = best
+        memory = best['memory_after_first_request_kb']
+        print(f"{mode:20s} load {best['load_s'] * 1000:8.1f} ms  first request {best['first_request_s'] * 1000:7.1f} ms  "
+              f"RSS {memory.get('VmRSS', 0) / 1024:7.1f} MB  "
+              f"(private {memory.get('RssAnon', 0) / 1024:7.1f} MB, shared file {memory.get('RssFile', 0) / 1024:7.1f} MB)")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved: {args.json}")
+
+if __name__ == '__main__':
+    main()
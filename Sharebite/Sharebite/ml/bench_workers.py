@@ -0,0 +1,139 @@
+"""
+Per-worker memory and throughput of the gunicorn deployment
+
+Starts gunicorn (gunicorn.conf.py) with each worker count, with and without
+preload_app. It drives /predict/all from concurrent clients for a fixed time,
+then reads each worker's memory from /proc/<pid>/smaps_rollup. PSS splits
+shared pages fairly between processes; private memory is what every extra
+worker really costs.
+
+Usage (from the directory containing models/):
+    python ml/bench_workers.py --workers 1,2,4 [--duration 10] [--json workers_report.json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+ML_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SAMPLE_ITEM = json.dumps({
+    'category': 'Dairy',
+    'restaurant_type': 'Cafe',
+    'quantity': 25,
+    'purchase_date': '2024-01-01',
+    'expiry_date': '2024-01-10',
+}).encode()
+
+def smaps_rollup_kb(pid):
+    """Memory counters of one process (Linux only)"""
+    usage = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                usage[parts[0].rstrip(':')] = int(parts[1])
+    return usage
+
+def worker_pids(master_pid):
+    with open(f'/proc/{master_pid}/task/{master_pid}/children') as f:
+        return [int(pid) for pid in f.read().split()]
+
+def wait_ready(url, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f'{url}/health', timeout=1) as response:
+                if json.load(response).get('models_loaded'):
+                    return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+def drive_load(url, clients, duration):
+    """Post /predict/all from `clients` threads for `duration` seconds; returns (requests, errors)"""
+    counts = [0] * clients
+    errors = [0] * clients
+    deadline = time.time() + duration
+
+    def client(i):
+        while time.time() < deadline:
+            request = urllib.request.Request(f'{url}/predict/all', data=SAMPLE_ITEM,
+                                             headers={'Content-Type': 'application/json'})
+            try:
+                with urllib.request.urlopen(request, timeout=10) as response:
+                    response.read()
+                counts[i] += 1
+            except OSError:
+                errors[i] += 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts), sum(errors)
+
+def run_config(workers, preload, port, duration):
+    env = dict(os.environ, ML_WORKERS=str(workers), ML_PRELOAD='1' if preload else '0',
+               PYTHONPATH=ML_DIR, ML_CACHE_SIZE='0', ML_USE_LOOKUP='0')
+    url = f'http://127.0.0.1:{port}'
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(ML_DIR, 'gunicorn.conf.py'),
+         '--bind', f'127.0.0.1:{port}', 'wsgi:app'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        if not wait_ready(url, timeout=120):
+            raise RuntimeError('gunicorn did not become ready')
+        requests, errors = drive_load(url, clients=workers * 2, duration=duration)
+        memory = [smaps_rollup_kb(pid) for pid in worker_pids(server.pid)]
+        master = smaps_rollup_kb(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+
+    def mean(key):
+        return sum(m.get(key, 0) for m in memory) / max(1, len(memory)) / 1024
+
+    return {
+        'workers': workers,
+        'preload': preload,
+        'requests_per_s': requests / duration,
+        'errors': errors,
+        'worker_rss_mb': mean('Rss'),
+        'worker_pss_mb': mean('Pss'),
+        'worker_private_mb': mean('Private_Clean') + mean('Private_Dirty'),
+        'master_pss_mb': master.get('Pss', 0) / 1024,
+        'total_pss_mb': (sum(m.get('Pss', 0) for m in memory) + master.get('Pss', 0)) / 1024,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark gunicorn worker memory and throughput')
+    parser.add_argument('--workers', default=f'1,{os.cpu_count()}',
+                        type=lambda s: sorted({int(w) for w in s.split(',')}))
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args(argv)
+
+    results = []
+    for workers in args.workers:
+        for preload in (True, False):
+            result = run_config(workers, preload, args.port, args.duration)
+            results.append(result)
+            print(f"workers={workers} preload={str(preload):5s} {result['requests_per_s']:8.1f} req/s  "
+                  f"per worker: RSS {result['worker_rss_mb']:6.1f} MB, PSS {result['worker_pss_mb']:6.1f} MB, "
+                  f"private {result['worker_private_mb']:6.1f} MB  total PSS {result['total_pss_mb']:7.1f} MB")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'cpu_count': os.cpu_count(), 'results': results}, f, indent=2)
+        print(f"Saved: {args.json}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+"""
+Post-training compaction of the served forests
+
+Rewrites each compiled forest (forest_engine.py) in a smaller form:
+
+- thresholds are stored as float32. Requests are compared as float32 values
+  (as sklearn does), and every threshold is rounded down to the largest
+  float32 not above it, so each split still sends every input the same way;
+- feature ids are stored as uint8 and leaf values as int16 with a per-output
+  scale, unless that moves a prediction by more than --max-delta of the
+  output range (then float32);
+- subtrees whose leaves all predict the same value are collapsed into one
+  leaf and nodes no longer reachable are dropped. --prune-tolerance also
+  collapses subtrees whose leaves lie within that fraction of the output
+  range (into the subtree's mean), which bounds each tree's change, and so
+  the forest's, by the tolerance;
+- --distill N first fits an N-tree forest on each model's own predictions
+  (class probabilities for the classifier) and compacts that instead.
+
+Artifacts are written as models/<name>.compact.forest and served by ml_api.py
+with ML_COMPACT=1 (the fused forest is left as is). Retraining removes them,
+so rerun this after every training. The report compares size,
+load time, latency and test-split accuracy of the original and compact forests.
+
+Usage (from ml/, after training):
+    python compact_models.py [--prune-tolerance 0.001] [--distill 20] [--report models/compaction_report.json]
+"""
+import argparse
+import json
+import os
+import time
+
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+
+from forest_engine import CompiledForest, compact_path, compile_forest, compile_models, compiled_path
+from train_models import (CLASSIFIERS, FOREST_PARAMS, TARGET_COLUMNS, load_dataset, measure_latency,
+                          prepare_features, split_indices)
+
+# Largest int16 code; leaf values map to [-INT16_MAX, INT16_MAX]
+INT16_MAX = np.iinfo(np.int16).max
+
+def float32_thresholds(threshold):
+    """Largest float32 not above each float64 threshold: float32 inputs branch exactly as before"""
+    rounded = threshold.astype(np.float32)
+    above = rounded.astype(np.float64) > threshold
+    rounded[above] = np.nextafter(rounded[above], np.float32(-np.inf))
+    return rounded
+
+def quantize_values(value):
+    """int16 codes plus per-output (scale, offset); the rounding error is at most scale / 2"""
+    lo, hi = value.min(axis=0), value.max(axis=0)
+    offset = (hi + lo) / 2
+    scale = np.where(hi > lo, (hi - lo) / (2 * INT16_MAX), 1.0)
+    codes = np.round((value - offset) / scale).astype(np.int16)
+    return codes, scale, offset
+
+def tree_levels(forest):
+    """Node ids at each depth of every tree, roots first; leaves point to themselves"""
+    is_leaf = forest.children_left == np.arange(len(forest.children_left))
+    levels = []
+    level = np.asarray(forest.roots, dtype=np.intp)
+    while len(level):
+        levels.append(level)
+        internal = level[~is_leaf[level]]
+        level = np.concatenate([forest.children_left[internal], forest.children_right[internal]]).astype(np.intp)
+    return levels, is_leaf
+
+def subtree_spans(forest, levels, is_leaf):
+    """Per node, the largest difference between two leaf values below it (over all outputs)"""
+    value = np.asarray(forest.value, dtype=np.float64)
+    lo, hi = value.copy(), value.copy()
+    for level in reversed(levels):
+        internal = level[~is_leaf[level]]
+        left, right = forest.children_left[internal], forest.children_right[internal]
+        lo[internal] = np.minimum(lo[left], lo[right])
+        hi[internal] = np.maximum(hi[left], hi[right])
+    return (hi - lo).max(axis=1)
+
+def prune(forest, tolerance):
+    """Collapse subtrees whose leaf values lie within tolerance and drop unreachable nodes"""
+    levels, is_leaf = tree_levels(forest)
+    collapse = is_leaf | (subtree_spans(forest, levels, is_leaf) <= tolerance)
+
+    # Walk down again, stopping at collapsed nodes (their own value is the subtree mean)
+    keep = np.zeros(len(is_leaf), dtype=bool)
+    level = np.asarray(forest.roots, dtype=np.intp)
+    depth = -1
+    while len(level):
+        keep[level] = True
+        depth += 1
+        internal = level[~collapse[level]]
+        level = np.concatenate([forest.children_left[internal], forest.children_right[internal]]).astype(np.intp)
+
+    old = np.flatnonzero(keep)
+    new_id = np.cumsum(keep) - 1
+    leaf = collapse[old]
+    return CompiledForest(
+        feature=np.where(leaf, 0, forest.feature[old]),
+        threshold=np.where(leaf, 0.0, forest.threshold[old]),
+        children_left=np.where(leaf, new_id[old], new_id[forest.children_left[old]]),
+        children_right=np.where(leaf, new_id[old], new_id[forest.children_right[old]]),
+        value=np.asarray(forest.value, dtype=np.float64)[old],
+        roots=new_id[forest.roots],
+        max_depth=depth,
+        n_features=forest.n_features,
+        classes=forest.classes_,
+    )
+
+def raw_output(forest, X):
+    """The averaged leaf values: class probabilities for a classifier, predictions otherwise"""
+    return forest.predict_proba(X) if forest.is_classifier else forest.predict(X).reshape(len(X), -1)
+
+def compact_forest(forest, prune_tolerance, max_delta, X_check):
+    """Pruned forest in compact dtypes; leaf values are int16 if that stays within max_delta of the range"""
+    value_range = float((forest.value.max(axis=0) - forest.value.min(axis=0)).max()) or 1.0
+    pruned = prune(forest, prune_tolerance * value_range)
+
+    n_nodes = len(pruned.feature)
+    index_dtype = np.int32 if n_nodes < np.iinfo(np.int32).max else np.int64
+    arrays = dict(
+        feature=pruned.feature.astype(np.uint8 if forest.n_features <= 256 else np.uint16),
+        threshold=float32_thresholds(pruned.threshold),
+        children_left=pruned.children_left.astype(index_dtype),
+        children_right=pruned.children_right.astype(index_dtype),
+        roots=pruned.roots.astype(index_dtype),
+        max_depth=pruned.max_depth,
+        n_features=pruned.n_features,
+        classes=pruned.classes_,
+    )
+    codes, scale, offset = quantize_values(pruned.value)
+    quantized = CompiledForest(value=codes, value_scale=scale, value_offset=offset, **arrays)
+    unquantized = CompiledForest(value=pruned.value.astype(np.float32), **arrays)
+    delta = np.abs(raw_output(quantized, X_check) - raw_output(unquantized, X_check)).max()
+    if delta <= max_delta * value_range:
+        return quantized
+    return unquantized
+
+def distill(teacher, X_train, trees):
+    """Forest of `trees` trees fitted on the teacher's outputs (class probabilities for a classifier)"""
+    target = raw_output(teacher, X_train)
+    params = dict(FOREST_PARAMS, n_estimators=trees)
+    student = RandomForestRegressor(n_jobs=-1, **params).fit(X_train, target if target.shape[1] > 1 else target[:, 0])
+    compiled = compile_forest(student)
+    # A multi-output regressor over class probabilities serves as the classifier
+    compiled.classes_ = teacher.classes_
+    return compiled
+
+def directory_mb(path):
+    files = [os.path.join(path, f) for f in os.listdir(path)] if os.path.isdir(path) else [path]
+    return sum(os.path.getsize(f) for f in files) / 1e6
+
+def score(name, forest, X_test, y_test):
+    """Test-split metric: accuracy for the classifier, MAE otherwise"""
+    pred = forest.predict(X_test)
+    if name in CLASSIFIERS:
+        return {'accuracy': float((pred == y_test).mean())}
+    return {'mae': float(np.abs(pred - y_test).mean())}
+
+def forest_stats(name, path, X_test, y_test):
+    """Size, load time, latency and accuracy of a saved forest"""
+    load_ms = []
+    for _ in range(5):
+        start = time.perf_counter()
+        forest = CompiledForest.load(path)
+        load_ms.append((time.perf_counter() - start) * 1000)
+    stats = {
+        'size_mb': directory_mb(path),
+        'nodes': int(len(forest.feature)),
+        'trees': int(forest.n_estimators),
+        'max_depth': forest.max_depth,
+        'load_ms': float(np.median(load_ms)),
+        'single_row_ms': measure_latency(forest.predict, X_test[:1], 200),
+        'batch_us_per_row': measure_latency(forest.predict, X_test[:1000], 5) * 1000 / len(X_test[:1000]),
+    }
+    stats.update(score(name, forest, X_test, y_test))
+    return stats, forest
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write compact versions of the trained forests')
+    parser.add_argument('--models-dir', default='models')
+    parser.add_argument('--data', default=None, help='dataset the models were trained on (default: as train_models.py)')
+    parser.add_argument('--prune-tolerance', type=float, default=0.0,
+                        help='collapse subtrees whose leaves differ by at most this fraction of the output range')
+    parser.add_argument('--max-delta', type=float, default=1e-3,
+                        help='largest prediction change (fraction of the output range) accepted for int16 leaves')
+    parser.add_argument('--distill', type=int, default=0, metavar='TREES',
+                        help='first distill each forest into this many trees (0: keep the trees)')
+    parser.add_argument('--distill-rows', type=int, default=200_000, help='training rows used for distillation')
+    parser.add_argument('--eval-rows', type=int, default=20_000, help='test rows used for the report')
+    parser.add_argument('--report', default=None, help='default: <models-dir>/compaction_report.json')
+    args = parser.parse_args(argv)
+
+    df = load_dataset(args.data)
+    if df is None:
+        return
+    feature_info = joblib.load(os.path.join(args.models_dir, 'feature_info.joblib'))
+    X = prepare_features(df, feature_info.get('encodings'))[feature_info['feature_columns']].to_numpy()
+    train_idx, test_idx = split_indices(len(X))
+    rng = np.random.default_rng(0)
+    test_idx = np.sort(rng.permutation(test_idx)[:args.eval_rows])
+    train_idx = np.sort(rng.permutation(train_idx)[:args.distill_rows])
+    X_test = X[test_idx]
+
+    report = {'settings': {key: value for key, value in vars(args).items() if key != 'report'}, 'models': {}}
+    for name, target in TARGET_COLUMNS.items():
+        path = compiled_path(args.models_dir, name)
+        if not os.path.isdir(path):
+            compile_models(args.models_dir, [name])
+        y_test = df[target].to_numpy()[test_idx]
+        original_stats, original = forest_stats(name, path, X_test, y_test)
+
+        start = time.perf_counter()
+        source = distill(original, X[train_idx], args.distill) if args.distill else original
+        compact = compact_forest(source, args.prune_tolerance, args.max_delta, X_test[:2000])
+        small_path = compact_path(args.models_dir, name)
+        compact.save(small_path)
+        compact_s = time.perf_counter() - start
+        compact_stats, compact = forest_stats(name, small_path, X_test, y_test)
+
+        delta = np.abs(raw_output(compact, X_test) - raw_output(original, X_test))
+        entry = {
+            'pickle_mb': directory_mb(os.path.join(args.models_dir, f'{name}.joblib')),
+            'original': original_stats,
+            'compact': compact_stats,
+            'value_dtype': str(compact.value.dtype),
+            'max_prediction_delta': float(delta.max()),
+            'mean_prediction_delta': float(delta.mean()),
+            'seconds': compact_s,
+        }
+        if name in CLASSIFIERS:
+            entry['label_agreement'] = float((compact.predict(X_test) == original.predict(X_test)).mean())
+        report['models'][name] = entry
+
+        metric = 'accuracy' if name in CLASSIFIERS else 'mae'
+        print(f"{name:22s} {original_stats['size_mb']:7.1f} -> {compact_stats['size_mb']:6.1f} MB  "
+              f"nodes {original_stats['nodes']:8d} -> {compact_stats['nodes']:8d}  "
+              f"load {original_stats['load_ms']:6.1f} -> {compact_stats['load_ms']:6.1f} ms  "
+              f"batch {original_stats['batch_us_per_row']:6.2f} -> {compact_stats['batch_us_per_row']:6.2f} us/row  "
+              f"{metric} {original_stats[metric]:.4f} -> {compact_stats[metric]:.4f}")
+        print(f"Saved: {small_path} ({entry['value_dtype']} leaves, max delta {entry['max_prediction_delta']:.2e})")
+
+    report_path = args.report or os.path.join(args.models_dir, 'compaction_report.json')
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved: {report_path}")
+    print("Serve the compact forests with ML_COMPACT=1")
+
+if __name__ == '__main__':
+    main()
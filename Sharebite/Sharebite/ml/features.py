@@ -0,0 +1,295 @@
+"""
+Feature pipeline shared by training and serving
+
+train_models.py builds its training matrix and ml_api.py builds request
+features with the same FeatureBuilder, so a model sees the same values for
+the same item whichever side computes them. The feature math is written once
+(_feature_values) and runs on scalars for a single request row or on NumPy
+columns for a whole batch.
+
+Category and restaurant type codes are fitted at training time (alphabetical,
+as pandas assigns Categorical codes) and stored in feature_info['encodings'].
+Models saved before that were trained on the same alphabetical codes, so
+default_encodings() rebuilds them for legacy artifacts.
+"""
+from datetime import date, datetime
+
+import numpy as np
+
+from postprocess import PERISHABLE_CATEGORIES
+
+# Feature order used by train_models.prepare_features
+FEATURE_COLUMNS = [
+    'category_encoded',
+    'restaurant_type_encoded',
+    'quantity',
+    'days_remaining',
+    'shelf_life',
+    'month',
+    'day_of_week',
+    'is_weekend',
+    'waste_probability',
+    'quantity_expiry_interaction',
+    'category_waste_interaction',
+    'is_perishable',
+    'high_quantity',
+    'very_high_quantity',
+    'quantity_perishable_interaction',
+    'is_expired',
+    'expiring_today',
+    'expiring_soon',
+]
+
+# Waste probability per category (matching original training data format)
+WASTE_PROBABILITIES = {
+    'Fruits': 0.15, 'Vegetables': 0.20, 'Dairy': 0.10, 'Meat': 0.25,
+    'Bakery': 0.30, 'Grains': 0.05, 'Beverages': 0.08,
+    'Prepared Foods': 0.35, 'Frozen Foods': 0.05, 'Canned Goods': 0.02,
+}
+
+# Restaurant waste factors of the training data (generate_dataset.RESTAURANT_TYPES); the
+# waste_probability feature is the category probability scaled by (1 + factor)
+RESTAURANT_WASTE_FACTORS = {
+    'Fast Food': 0.15, 'Fine Dining': 0.25, 'Cafe': 0.20,
+    'Buffet': 0.30, 'Food Truck': 0.18, 'Bakery': 0.25,
+}
+
+# Values used for missing fields; unknown names are featurized like the defaults
+DEFAULT_CATEGORY = 'Fruits'
+DEFAULT_RESTAURANT_TYPE = 'Fast Food'
+DEFAULT_QUANTITY = 10
+
+# Shelf life and days remaining used when dates are missing or invalid
+DEFAULT_DAYS = 7
+
+def parse_date(value):
+    """Parse an ISO date or datetime string into a date"""
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        # Full timestamps such as 2024-01-05T00:00:00Z
+        return datetime.fromisoformat(value).date()
+
+def _parse_optional_date(value):
+    if not value:
+        return None
+    try:
+        return parse_date(value)
+    except (TypeError, ValueError):
+        return None
+
+def _names(values):
+    # Distinct names of a column; a pandas categorical lists all of its categories
+    cat = getattr(values, 'cat', None)
+    if cat is not None:
+        return [str(name) for name in cat.categories]
+    return np.unique(np.asarray(values, dtype=object).astype(str)).tolist()
+
+def fit_encodings(categories, restaurant_types):
+    """Alphabetical integer codes for the category and restaurant type names seen in training"""
+    return {
+        'category': {name: code for code, name in enumerate(sorted(_names(categories)))},
+        'restaurant_type': {name: code for code, name in enumerate(sorted(_names(restaurant_types)))},
+    }
+
+def default_encodings():
+    """Encodings of artifacts trained before they were stored: alphabetical over the known names"""
+    return fit_encodings(list(WASTE_PROBABILITIES), list(RESTAURANT_WASTE_FACTORS))
+
+def _encode(names, mapping, default):
+    # Map a column of names through a dict, once per distinct value
+    cat = getattr(names, 'cat', None)
+    if cat is not None:
+        # Categorical codes index the per-category values; -1 (missing) picks the trailing default
+        values = np.array([mapping.get(str(name), default) for name in cat.categories] + [default], dtype=np.float64)
+        return values[np.asarray(cat.codes)]
+    if isinstance(names, (list, tuple)):
+        # Request batches: plain lookups beat sorting an object array
+        return np.array([mapping.get(name, default) for name in names], dtype=np.float64)
+    uniques, inverse = np.unique(np.asarray(names, dtype=object).astype(str), return_inverse=True)
+    return np.array([mapping.get(name, default) for name in uniques], dtype=np.float64)[inverse]
+
+def _feature_values(category_encoded, restaurant_type_encoded, quantity, days_remaining, shelf_life,
+                    month, day_of_week, waste_probability, is_perishable):
+    """Feature values in FEATURE_COLUMNS order; works on Python scalars and on NumPy columns alike"""
+    return (
+        category_encoded,
+        restaurant_type_encoded,
+        quantity,
+        days_remaining,
+        shelf_life,
+        month,
+        day_of_week,
+        day_of_week >= 5,
+        waste_probability,
+        quantity * days_remaining,
+        category_encoded * waste_probability,
+        is_perishable,
+        quantity >= 30,
+        quantity >= 50,
+        quantity * is_perishable,
+        days_remaining < 0,
+        days_remaining <= 1,
+        days_remaining <= 7,
+    )
+
+class FeatureBuilder:
+    """Builds feature rows in the column order the models were trained with"""
+
+    def __init__(self, encodings=None, feature_columns=None):
+        self.encodings = encodings or default_encodings()
+        self.category_codes = self.encodings['category']
+        self.restaurant_type_codes = self.encodings['restaurant_type']
+        self.default_category_code = self.category_codes.get(DEFAULT_CATEGORY, 0)
+        self.default_restaurant_type_code = self.restaurant_type_codes.get(DEFAULT_RESTAURANT_TYPE, 0)
+        self.feature_columns = list(feature_columns or FEATURE_COLUMNS)
+        missing = set(self.feature_columns) - set(FEATURE_COLUMNS)
+        if missing:
+            raise ValueError(f'Unknown feature columns: {sorted(missing)}')
+        # Position of each FEATURE_COLUMNS value in the model's column order
+        self._positions = np.array([self.feature_columns.index(name) for name in FEATURE_COLUMNS], dtype=np.intp)
+
+    @property
+    def n_features(self):
+        return len(self.feature_columns)
+
+    def empty(self, n_rows):
+        """Allocate a feature matrix for n_rows items"""
+        return np.empty((n_rows, self.n_features), dtype=np.float64)
+
+    def resolve(self, data, today):
+        """Resolve one request item's raw fields and dates
+
+        Returns (category, restaurant_type, quantity, days_remaining, shelf_life,
+        month, day_of_week, actual_days_remaining).
+        """
+        category = str(data.get('category', DEFAULT_CATEGORY))
+        restaurant_type = str(data.get('restaurant_type', DEFAULT_RESTAURANT_TYPE))
+        quantity = float(data.get('quantity', DEFAULT_QUANTITY))
+        purchase = _parse_optional_date(data.get('purchase_date'))
+        expiry = _parse_optional_date(data.get('expiry_date'))
+
+        # Days remaining from TODAY (not from purchase date) and total shelf life
+        total_shelf_life = DEFAULT_DAYS
+        days_remaining = DEFAULT_DAYS
+        if purchase is not None and expiry is not None:
+            total_shelf_life = (expiry - purchase).days
+            days_remaining = (expiry - today).days
+        shelf_life = total_shelf_life if total_shelf_life > 0 else DEFAULT_DAYS
+
+        # Month and weekday describe the purchase, as in the training data (today if it is unknown)
+        purchased = purchase or today
+        actual_days_remaining = (expiry - today).days if expiry is not None else np.nan
+        return (category, restaurant_type, quantity, days_remaining, shelf_life,
+                purchased.month, purchased.weekday(), actual_days_remaining)
+
+    def build_row(self, data, today=None, out=None):
+        """Write the features for one item into out (a 1-D row) and return (row, metadata)"""
+        if out is None:
+            out = np.empty(self.n_features, dtype=np.float64)
+        if today is None:
+            today = date.today()
+
+        (category, restaurant_type, quantity, days_remaining, shelf_life,
+         month, day_of_week, actual_days_remaining) = self.resolve(data, today)
+        waste_probability = WASTE_PROBABILITIES.get(category, WASTE_PROBABILITIES[DEFAULT_CATEGORY])
+        waste_factor = RESTAURANT_WASTE_FACTORS.get(restaurant_type, RESTAURANT_WASTE_FACTORS[DEFAULT_RESTAURANT_TYPE])
+        is_perishable = 1 if category in PERISHABLE_CATEGORIES else 0
+
+        out[self._positions] = _feature_values(
+            self.category_codes.get(category, self.default_category_code),
+            self.restaurant_type_codes.get(restaurant_type, self.default_restaurant_type_code),
+            quantity,
+            days_remaining,
+            shelf_life,
+            month,
+            day_of_week,
+            waste_probability * (1 + waste_factor),
+            is_perishable,
+        )
+
+        # Inputs for the rule-based post-processing
+        metadata = {
+            'days_remaining': days_remaining,
+            'quantity': quantity,
+            'waste_probability': waste_probability,
+            'is_perishable': is_perishable,
+            'actual_days_remaining': actual_days_remaining,
+        }
+        return out, metadata
+
+    def build_matrix(self, category, restaurant_type, quantity, days_remaining, shelf_life, month, day_of_week,
+                     out=None):
+        """Vectorized feature matrix from per-item columns; days_remaining/shelf_life are already resolved"""
+        quantity = np.asarray(quantity, dtype=np.float64)
+        days_remaining = np.asarray(days_remaining, dtype=np.float64)
+        day_of_week = np.asarray(day_of_week, dtype=np.float64)
+
+        category_encoded = _encode(category, self.category_codes, self.default_category_code)
+        waste_probability = (
+            _encode(category, WASTE_PROBABILITIES, WASTE_PROBABILITIES[DEFAULT_CATEGORY])
+            * (1 + _encode(restaurant_type, RESTAURANT_WASTE_FACTORS, RESTAURANT_WASTE_FACTORS[DEFAULT_RESTAURANT_TYPE]))
+        )
+        is_perishable = _encode(category, dict.fromkeys(PERISHABLE_CATEGORIES, 1), 0)
+
+        values = _feature_values(
+            category_encoded,
+            _encode(restaurant_type, self.restaurant_type_codes, self.default_restaurant_type_code),
+            quantity,
+            days_remaining,
+            np.asarray(shelf_life, dtype=np.float64),
+            np.asarray(month, dtype=np.float64),
+            day_of_week,
+            waste_probability,
+            is_perishable,
+        )
+        if out is None:
+            out = self.empty(len(quantity))
+        for position, column in zip(self._positions, values):
+            out[:, position] = column
+        return out
+
+    def resolve_columns(self, category, restaurant_type, quantity, purchase_date, expiry_date, today):
+        """resolve() for whole columns of items; dates are datetime64[D] arrays with NaT where missing
+
+        Returns the same tuple as resolve(), with NumPy columns in place of scalars.
+        """
+        today = np.datetime64(today, 'D')
+        purchase = np.asarray(purchase_date, dtype='datetime64[D]')
+        expiry = np.asarray(expiry_date, dtype='datetime64[D]')
+        has_purchase = ~np.isnat(purchase)
+        has_expiry = ~np.isnat(expiry)
+        has_dates = has_purchase & has_expiry
+
+        until_expiry = (expiry - today).astype(np.int64)
+        total_shelf_life = np.where(has_dates, (expiry - purchase).astype(np.int64), DEFAULT_DAYS)
+        days_remaining = np.where(has_dates, until_expiry, DEFAULT_DAYS)
+        shelf_life = np.where(total_shelf_life > 0, total_shelf_life, DEFAULT_DAYS)
+
+        purchased = np.where(has_purchase, purchase, today)
+        month = purchased.astype('datetime64[M]').astype(np.int64) % 12 + 1
+        # Day 0 of datetime64 (1970-01-01) was a Thursday, weekday() == 3
+        day_of_week = (purchased.astype(np.int64) + 3) % 7
+        actual_days_remaining = np.where(has_expiry, until_expiry, np.nan)
+
+        quantity = np.asarray(quantity, dtype=np.float64)
+        return (category, restaurant_type, np.where(np.isnan(quantity), DEFAULT_QUANTITY, quantity),
+                days_remaining, shelf_life, month, day_of_week, actual_days_remaining)
+
+    def build_resolved(self, resolved, out=None):
+        """Vectorized (features, metadata arrays) for items already passed through resolve()"""
+        return self.build_columns(*zip(*resolved), out=out)
+
+    def build_columns(self, category, restaurant_type, quantity, days_remaining, shelf_life, month, day_of_week,
+                      actual_days_remaining, out=None):
+        """Vectorized (features, metadata arrays) from resolved columns (see resolve_columns())"""
+        features = self.build_matrix(category, restaurant_type, quantity, days_remaining, shelf_life,
+                                     month, day_of_week, out=out)
+        metadata = {
+            'days_remaining': np.array(days_remaining, dtype=np.float64),
+            'quantity': np.array(quantity, dtype=np.float64),
+            'waste_probability': _encode(category, WASTE_PROBABILITIES, WASTE_PROBABILITIES[DEFAULT_CATEGORY]),
+            'is_perishable': _encode(category, dict.fromkeys(PERISHABLE_CATEGORIES, 1), 0),
+            'actual_days_remaining': np.array(actual_days_remaining, dtype=np.float64),
+        }
+        return features, metadata
@@ -0,0 +1,245 @@
+"""
+Flat-array inference engine for trained RandomForest models
+
+compile_forest() packs every tree of a fitted sklearn forest into shared
+feature/threshold/child/value arrays. CompiledForest walks all trees of all
+rows at once with plain NumPy, avoiding sklearn's per-call validation and
+thread dispatch. Compiled forests are stored as directories of raw .npy
+arrays so workers can memory-map them and share the pages. Run this file to
+compile the pickles in models/.
+
+Arrays may also come in compact dtypes (compact_models.py): float32
+thresholds, small integer feature ids and int16 leaf values that are
+dequantized with a per-output scale and offset.
+"""
+import json
+import os
+import sys
+
+import numpy as np
+
+# Rows traversed together; bounds the (rows x trees) index arrays for big batches
+BLOCK_ROWS = 4096
+
+class CompiledForest:
+    """A random forest packed into flat node arrays"""
+
+    def __init__(self, feature, threshold, children_left, children_right, value, roots, max_depth,
+                 n_features, classes=None, value_scale=None, value_offset=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.children_left = children_left
+        self.children_right = children_right
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.n_features = int(n_features)
+        self.classes_ = classes
+        self.n_estimators = len(roots)
+        # Quantized leaf values: value * value_scale + value_offset per output
+        self.value_scale = None if value_scale is None else np.asarray(value_scale, dtype=np.float64)
+        self.value_offset = None if value_offset is None else np.asarray(value_offset, dtype=np.float64)
+
+    @property
+    def is_classifier(self):
+        return self.classes_ is not None
+
+    @property
+    def n_outputs(self):
+        return self.value.shape[1]
+
+    def _leaves(self, X):
+        """Leaf node index reached by every (row, tree) pair, shape (n_rows, n_trees)"""
+        # sklearn compares float32 inputs against float64 thresholds; float32 thresholds are
+        # rounded so that comparing in float32 takes the same branches
+        X = np.ascontiguousarray(X, dtype=np.float32).astype(self.threshold.dtype, copy=False)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f'Expected input with {self.n_features} features, got shape {X.shape}')
+        n_rows = X.shape[0]
+        flat_x = X.ravel()
+        row_offset = np.repeat(np.arange(n_rows, dtype=np.intp) * self.n_features, self.n_estimators)
+        node = np.tile(self.roots.astype(np.intp), n_rows)
+        feature, threshold = self.feature, self.threshold
+        left, right = self.children_left, self.children_right
+        # Leaves point to themselves, so every path can run for max_depth steps
+        for _ in range(self.max_depth):
+            go_left = flat_x.take(row_offset + feature.take(node)) <= threshold.take(node)
+            node = np.where(go_left, left.take(node), right.take(node))
+        return node.reshape(n_rows, self.n_estimators)
+
+    def _mean_value(self, X):
+        X = np.asarray(X)
+        out = np.empty((X.shape[0], self.n_outputs), dtype=np.float64)
+        for start in range(0, X.shape[0], BLOCK_ROWS):
+            leaves = self._leaves(X[start:start + BLOCK_ROWS])
+            # Accumulate trees in order (cumsum, not pairwise sum) so results match sklearn bit for bit
+            leaf_values = self.value.take(leaves, axis=0)
+            if self.value_scale is not None:
+                # Integer sums are exact; dequantize the mean once
+                total = leaf_values.sum(axis=1, dtype=np.int64)
+                out[start:start + BLOCK_ROWS] = total * (self.value_scale / self.n_estimators) + self.value_offset
+                continue
+            out[start:start + BLOCK_ROWS] = leaf_values.cumsum(axis=1)[:, -1] / self.n_estimators
+        return out
+
+    def predict(self, X):
+        """Same output as the source estimator's predict"""
+        values = self._mean_value(X)
+        if self.is_classifier:
+            return self.classes_[np.argmax(values, axis=1)]
+        return values[:, 0] if self.n_outputs == 1 else values
+
+    def predict_proba(self, X):
+        """Same output as the source classifier's predict_proba"""
+        if not self.is_classifier:
+            raise AttributeError('predict_proba is only available for classifiers')
+        return self._mean_value(X)
+
+    def _arrays(self):
+        arrays = {
+            'feature': self.feature,
+            'threshold': self.threshold,
+            'children_left': self.children_left,
+            'children_right': self.children_right,
+            'value': self.value,
+            'roots': self.roots,
+        }
+        if self.classes_ is not None:
+            arrays['classes'] = self.classes_
+        if self.value_scale is not None:
+            arrays['value_scale'] = self.value_scale
+            arrays['value_offset'] = self.value_offset
+        return arrays
+
+    def save(self, path):
+        """Save as a directory of raw .npy arrays (mmap-able), or as one .npz file if path ends in .npz"""
+        arrays = self._arrays()
+        if path.endswith('.npz'):
+            np.savez(path, max_depth=np.array(self.max_depth), n_features=np.array(self.n_features), **arrays)
+            return
+        os.makedirs(path, exist_ok=True)
+        # Optional arrays left over from an earlier save would otherwise be loaded back
+        for name in ('classes', 'value_scale', 'value_offset'):
+            stale = os.path.join(path, f'{name}.npy')
+            if name not in arrays and os.path.exists(stale):
+                os.remove(stale)
+        for name, array in arrays.items():
+            np.save(os.path.join(path, f'{name}.npy'), np.ascontiguousarray(array))
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump({'max_depth': self.max_depth, 'n_features': self.n_features}, f)
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        """Load a forest saved with save(); mmap_mode='r' maps .npy arrays from the page cache"""
+        if os.path.isdir(path):
+            def array(name):
+                return np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode, allow_pickle=False)
+            def optional(name):
+                optional_path = os.path.join(path, f'{name}.npy')
+                return np.load(optional_path) if os.path.exists(optional_path) else None
+            with open(os.path.join(path, 'meta.json')) as f:
+                meta = json.load(f)
+            return cls(
+                array('feature'),
+                array('threshold'),
+                array('children_left'),
+                array('children_right'),
+                array('value'),
+                array('roots'),
+                meta['max_depth'],
+                meta['n_features'],
+                optional('classes'),
+                optional('value_scale'),
+                optional('value_offset'),
+            )
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                data['feature'],
+                data['threshold'],
+                data['children_left'],
+                data['children_right'],
+                data['value'],
+                data['roots'],
+                data['max_depth'],
+                data['n_features'],
+                data['classes'] if 'classes' in data else None,
+                data['value_scale'] if 'value_scale' in data else None,
+                data['value_offset'] if 'value_offset' in data else None,
+            )
+
+def compile_forest(model):
+    """Pack a fitted RandomForestRegressor/RandomForestClassifier into a CompiledForest"""
+    is_classifier = hasattr(model, 'classes_')
+    if is_classifier and getattr(model, 'n_outputs_', 1) != 1:
+        raise ValueError('Multi-output classifiers are not supported')
+
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        n_nodes = tree.node_count
+        node_ids = np.arange(offset, offset + n_nodes)
+        is_leaf = tree.children_left == -1
+
+        # Leaves loop back to themselves; their feature/threshold are never used to branch
+        features.append(np.where(is_leaf, 0, tree.feature))
+        thresholds.append(np.where(is_leaf, 0.0, tree.threshold))
+        lefts.append(np.where(is_leaf, node_ids, tree.children_left + offset))
+        rights.append(np.where(is_leaf, node_ids, tree.children_right + offset))
+
+        if is_classifier:
+            value = tree.value[:, 0, :]
+            value = value / value.sum(axis=1, keepdims=True)
+        else:
+            value = tree.value[:, :, 0]
+        values.append(value)
+
+        roots.append(offset)
+        offset += n_nodes
+        max_depth = max(max_depth, tree.max_depth)
+
+    index_dtype = np.int32 if offset < np.iinfo(np.int32).max else np.int64
+    return CompiledForest(
+        feature=np.concatenate(features).astype(np.int32),
+        threshold=np.concatenate(thresholds).astype(np.float64),
+        children_left=np.concatenate(lefts).astype(index_dtype),
+        children_right=np.concatenate(rights).astype(index_dtype),
+        value=np.concatenate(values).astype(np.float64),
+        roots=np.array(roots, dtype=index_dtype),
+        max_depth=max_depth,
+        n_features=model.n_features_in_,
+        classes=np.asarray(model.classes_) if is_classifier else None,
+    )
+
+def compiled_path(models_dir, name):
+    """Location of the compiled artifact for a model (a directory of .npy arrays)"""
+    return os.path.join(models_dir, f'{name}.forest')
+
+def compact_path(models_dir, name):
+    """Location of the compacted artifact written by compact_models.py"""
+    return os.path.join(models_dir, f'{name}.compact.forest')
+
+def compile_models(models_dir='models', names=None):
+    """Compile the pickled forests in models_dir and check them against sklearn"""
+    import joblib
+
+    if names is None:
+        names = sorted(f[:-len('.joblib')] for f in os.listdir(models_dir)
+                       if f.endswith('.joblib') and f != 'feature_info.joblib')
+    for name in names:
+        model = joblib.load(os.path.join(models_dir, f'{name}.joblib'))
+        compiled = compile_forest(model)
+        path = compiled_path(models_dir, name)
+        compiled.save(path)
+
+        # Sanity check on random inputs
+        X = np.random.default_rng(0).uniform(-10, 100, size=(256, compiled.n_features))
+        if compiled.is_classifier:
+            error = np.abs(compiled.predict_proba(X) - model.predict_proba(X)).max()
+        else:
+            error = np.abs(compiled.predict(X) - model.predict(X)).max()
+        print(f"Saved: {path} ({compiled.n_estimators} trees, {len(compiled.feature)} nodes, max error {error:.2e})")
+
+if __name__ == '__main__':
+    compile_models(sys.argv[1] if len(sys.argv) > 1 else 'models')
@@ -4,11 +4,19 @@ Generate synthetic food waste management dataset for ML training
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import json
+import os
 import random
 
-# Set random seed for reproducibility
-np.random.seed(42)
-random.seed(42)
+from dataset_io import MANIFEST_FILE, to_arrow, write_dataset
+
+# Seed for reproducible datasets
+DEFAULT_SEED = 42
+
+# Rows generated and written per Parquet row group in streaming mode
+DEFAULT_CHUNK_ROWS = 1_000_000
 
 # Food categories and their typical shelf lives
 FOOD_CATEGORIES = {
@@ -34,6 +42,9 @@ RESTAURANT_TYPES = {
     'Bakery': {'avg_quantity': 60, 'waste_factor': 0.25},
 }
 
+# Categories treated as perishable by the donation target
+PERISHABLE = ['Fruits', 'Vegetables', 'Dairy', 'Meat', 'Bakery', 'Prepared Foods']
+
 def generate_food_item(category, restaurant_type, purchase_date):
     """Generate a single food item with realistic attributes"""
     category_info = FOOD_CATEGORIES[category]
@@ -119,8 +130,10 @@ def generate_food_item(category, restaurant_type, purchase_date):
         'shelf_life': shelf_life,
     }
 
-def generate_dataset(n_samples=10000):
-    """Generate complete dataset"""
+def generate_dataset_legacy(n_samples=10000, seed=DEFAULT_SEED):
+    """Original row-by-row generator (one generate_food_item call per row), kept for bench_generate.py"""
+    np.random.seed(seed)
+    random.seed(seed)
     data = []
     
     # Generate dates over the past year
@@ -166,7 +179,7 @@ def generate_dataset(n_samples=10000):
     # 3. They have high quantity (>=30) and are perishable, OR
     # 4. They have very high quantity (>=50) regardless of expiry
     # 5. They are already expired (days_remaining < 0) - should be donated if still safe
-    perishable = df['category'].isin(['Fruits', 'Vegetables', 'Dairy', 'Meat', 'Bakery', 'Prepared Foods'])
+    perishable = df['category'].isin(PERISHABLE)
     high_quantity = df['quantity'] >= 30
     very_high_quantity = df['quantity'] >= 50
     expiring_soon = df['days_remaining'] <= 7
@@ -200,16 +213,232 @@ def generate_dataset(n_samples=10000):
     
     return df
 
-def main():
+def _sorted_categorical(codes, names):
+    """Categorical with alphabetically ordered categories (the codes train_models.py has always used)
+
+    Returns (categorical, sorted codes) so the *_encoded columns equal the categorical's own codes.
+    """
+    order = np.argsort(names)
+    rank = np.argsort(order).astype(np.int8)
+    sorted_codes = rank[codes]
+    return pd.Categorical.from_codes(sorted_codes, [names[i] for i in order]), sorted_codes
+
+def generate_dataset(n_samples=10000, seed=DEFAULT_SEED, now=None):
+    """Generate complete dataset with whole-column NumPy operations
+
+    Rows follow the same distributions as generate_food_item; the output is
+    fully determined by seed, n_samples and now (the reference time, default
+    datetime.now()).
+    """
+    rng = np.random.default_rng(seed)
+    now = now or datetime.now()
+    
+    categories = list(FOOD_CATEGORIES)
+    restaurant_types = list(RESTAURANT_TYPES)
+    min_shelf_life = np.array([FOOD_CATEGORIES[c]['min_shelf_life'] for c in categories])
+    max_shelf_life = np.array([FOOD_CATEGORIES[c]['max_shelf_life'] for c in categories])
+    category_waste = np.array([FOOD_CATEGORIES[c]['waste_probability'] for c in categories])
+    avg_quantity = np.array([RESTAURANT_TYPES[r]['avg_quantity'] for r in restaurant_types], dtype=np.float64)
+    waste_factor = np.array([RESTAURANT_TYPES[r]['waste_factor'] for r in restaurant_types])
+    
+    # Random purchase date in the past year, category and restaurant type
+    days_ago = rng.integers(0, 366, n_samples)
+    category = rng.integers(0, len(categories), n_samples)
+    restaurant_type = rng.integers(0, len(restaurant_types), n_samples)
+    
+    # Shelf life uniform over the category's range (inclusive)
+    shelf_life = rng.integers(min_shelf_life[category], max_shelf_life[category] + 1)
+    
+    # Quantity (normal distribution around restaurant average, truncated like int())
+    base_quantity = avg_quantity[restaurant_type]
+    quantity = np.maximum(1, np.trunc(rng.normal(base_quantity, base_quantity * 0.3))).astype(np.int64)
+    
+    waste_prob = category_waste[category] * (1 + waste_factor[restaurant_type])
+    
+    # Wasted items expire 70% of the time and are donated otherwise
+    will_be_wasted = rng.random(n_samples) < waste_prob
+    expired = will_be_wasted & (rng.random(n_samples) < 0.7)
+    was_donated = will_be_wasted & ~expired
+    
+    # 15% of high-quantity items with good shelf life are proactively donated
+    was_donated |= ~was_donated & (quantity >= 30) & (shelf_life >= 5) & (rng.random(n_samples) < 0.15)
+    expired &= ~was_donated
+    final_status = np.where(was_donated, 1, np.where(expired, 0, 2))
+    
+    # Priority score (higher for items expiring soon with high quantity)
+    quantity_bonus = np.minimum(quantity / 10, 10)
+    priority_score = np.minimum(np.select(
+        [shelf_life <= 0, shelf_life <= 1, shelf_life <= 3, shelf_life <= 7],
+        [100, 90 + quantity_bonus, 70 + quantity_bonus, 50 + quantity_bonus],
+        30 + quantity_bonus,
+    ), 100)
+    
+    start = np.datetime64(now - timedelta(days=365), 'us')
+    purchase_date = start + days_ago.astype('timedelta64[D]')
+    expiry_date = purchase_date + shelf_life.astype('timedelta64[D]')
+    
+    category_column, category_encoded = _sorted_categorical(category, categories)
+    restaurant_type_column, restaurant_type_encoded = _sorted_categorical(restaurant_type, restaurant_types)
+    
+    df = pd.DataFrame({
+        'category': category_column,
+        'restaurant_type': restaurant_type_column,
+        'purchase_date': purchase_date,
+        'expiry_date': expiry_date,
+        'days_until_expiry': shelf_life,
+        'quantity': quantity,
+        'status': pd.Categorical.from_codes((shelf_life > 3).astype(np.int8), ['expiring_soon', 'active']),
+        'final_status': pd.Categorical.from_codes(final_status, ['expired', 'donated', 'consumed']),
+        'was_donated': was_donated,
+        'priority_score': priority_score,
+        'waste_probability': waste_prob,
+        'shelf_life': shelf_life,
+    })
+    
+    # Add derived features
+    purchase_day = purchase_date.astype('datetime64[D]')
+    day_of_week = ((purchase_day.view(np.int64) + 3) % 7).astype(np.int32)  # 1970-01-01 was a Thursday
+    df['month'] = (purchase_day.astype('datetime64[M]').view(np.int64) % 12 + 1).astype(np.int32)
+    df['day_of_week'] = day_of_week
+    df['is_weekend'] = (day_of_week >= 5).astype(int)
+    
+    # Days remaining from TODAY (not from purchase date); expiry times fall within the day, so whole days are floored
+    today = np.datetime64(now.date(), 'D')
+    days_remaining = (expiry_date.astype('datetime64[D]') - today).astype(np.int64)
+    df['days_remaining'] = days_remaining
+    
+    # Encode categorical variables
+    df['category_encoded'] = category_encoded
+    df['restaurant_type_encoded'] = restaurant_type_encoded
+    
+    # Target variables
+    df['will_expire'] = expired.astype(int)
+    
+    # Items should be donated if they were donated, expire within 7 days, are high-quantity
+    # perishables, have very high quantity, or are expired perishables (see generate_dataset_legacy)
+    perishable = np.array([c in PERISHABLE for c in categories])[category]
+    df['should_donate'] = (
+        was_donated
+        | (days_remaining <= 7)
+        | ((quantity >= 30) & perishable)
+        | (quantity >= 50)
+        | ((days_remaining < 0) & perishable)
+    ).astype(int)
+    
+    # Waste risk considers days_remaining and quantity, not just probability
+    urgency_multiplier = np.select(
+        [days_remaining < 0, days_remaining <= 1, days_remaining <= 3, days_remaining <= 7],
+        [2.0, 1.5, 1.3, 1.2],
+        1.0,
+    )
+    quantity_factor = 1 + (quantity / 100) * 0.3
+    df['waste_risk'] = np.clip(waste_prob * 100 * urgency_multiplier * quantity_factor, 0, 100)
+    
+    return df
+
+def split_rows(n_rows, n_parts):
+    """Row counts of n_parts near-equal parts"""
+    base, extra = divmod(n_rows, n_parts)
+    return [base + (1 if i < extra else 0) for i in range(n_parts)]
+
+def write_shard(path, n_rows, chunk_rows, seed_sequence, now):
+    """Generate one shard chunk by chunk into a Parquet file; returns its summary"""
+    import pyarrow.parquet as pq
+    
+    chunk_sizes = split_rows(n_rows, max(1, -(-n_rows // chunk_rows)))
+    chunk_seeds = seed_sequence.spawn(len(chunk_sizes))
+    tmp_path = f'{path}.tmp'
+    writer = None
+    totals = {'rows': 0, 'will_expire': 0, 'was_donated': 0}
+    try:
+        for size, chunk_seed in zip(chunk_sizes, chunk_seeds):
+            df = generate_dataset(size, seed=chunk_seed, now=now)
+            table = to_arrow(df)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, table.schema)
+            writer.write_table(table)
+            totals['rows'] += size
+            totals['will_expire'] += int(df['will_expire'].sum())
+            totals['was_donated'] += int(df['was_donated'].sum())
+            # Only one chunk per worker is alive at a time
+            del df, table
+    finally:
+        if writer is not None:
+            writer.close()
+    os.replace(tmp_path, path)
+    return dict(totals, file=os.path.basename(path), chunks=len(chunk_sizes))
+
+def generate_shards(output_dir, n_rows, n_shards, chunk_rows=DEFAULT_CHUNK_ROWS, seed=DEFAULT_SEED,
+                    workers=None, now=None):
+    """Stream the dataset into n_shards Parquet files across a process pool and write a manifest
+
+    Each shard (and each chunk within it) gets its own child of the seed's
+    SeedSequence, so the files depend only on seed, n_rows, n_shards,
+    chunk_rows and the reference time, never on the number of workers.
+    Peak memory is about one chunk per worker.
+    """
+    now = now or datetime.now()
+    os.makedirs(output_dir, exist_ok=True)
+    shard_rows = split_rows(n_rows, n_shards)
+    shard_seeds = np.random.SeedSequence(seed).spawn(n_shards)
+    paths = [os.path.join(output_dir, f'part-{i:05d}.parquet') for i in range(n_shards)]
+    
+    with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count(), n_shards)) as pool:
+        shards = list(pool.map(write_shard, paths, shard_rows, [chunk_rows] * n_shards, shard_seeds,
+                               [now] * n_shards))
+    
+    manifest = {
+        'format': 'parquet',
+        'rows': n_rows,
+        'seed': seed,
+        'chunk_rows': chunk_rows,
+        'reference_time': now.isoformat(),
+        'shards': shards,
+        'created_at': datetime.now().strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    with open(os.path.join(output_dir, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+def main(argv=None):
     """Main function to generate and save dataset"""
+    parser = argparse.ArgumentParser(description='Generate the synthetic food waste dataset')
+    parser.add_argument('--rows', type=int, default=15000)
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--output', default=None,
+                        help='output file (default food_waste_dataset.parquet), or the shard directory with --shards')
+    parser.add_argument('--format', choices=['parquet', 'csv'], default='parquet',
+                        help='single-file format; parquet keeps categorical and date types for train_models.py')
+    parser.add_argument('--shards', type=int, default=0,
+                        help='stream the dataset into this many Parquet shards instead of one file')
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument('--workers', type=int, default=None, help='generator processes (default: all cores)')
+    parser.add_argument('--reference-time', type=datetime.fromisoformat, default=None,
+                        help='ISO time the dates are generated relative to (default: now)')
+    args = parser.parse_args(argv)
+    
     print("Generating synthetic food waste dataset...")
     
+    if args.shards:
+        output_dir = args.output or 'food_waste_dataset'
+        manifest = generate_shards(output_dir, args.rows, args.shards, args.chunk_rows, args.seed, args.workers,
+                                   args.reference_time)
+        print(f"Dataset generated successfully!")
+        print(f"Total samples: {manifest['rows']} in {len(manifest['shards'])} shards")
+        print(f"\nWaste rate: {sum(s['will_expire'] for s in manifest['shards']) / manifest['rows'] * 100:.2f}%")
+        print(f"Donation rate: {sum(s['was_donated'] for s in manifest['shards']) / manifest['rows'] * 100:.2f}%")
+        print(f"\nDataset saved to: {os.path.join(output_dir, MANIFEST_FILE)}")
+        return manifest
+    
     # Generate dataset
-    df = generate_dataset(n_samples=15000)
+    df = generate_dataset(n_samples=args.rows, seed=args.seed, now=args.reference_time)
     
-    # Save to CSV
-    output_file = 'food_waste_dataset.csv'
-    df.to_csv(output_file, index=False)
+    # Save as Parquet (typed, columnar) or CSV
+    output_file = args.output or f'food_waste_dataset.{args.format}'
+    if args.format == 'csv':
+        df.to_csv(output_file, index=False)
+    else:
+        write_dataset(df, output_file)
     
     print(f"Dataset generated successfully!")
     print(f"Total samples: {len(df)}")
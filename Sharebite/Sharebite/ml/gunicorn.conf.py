@@ -0,0 +1,38 @@
+"""
+Gunicorn settings for the ML API (run from ml/: gunicorn -c gunicorn.conf.py wsgi:app)
+
+Models are loaded once in the master (preload_app) and shared copy-on-write
+by the forked workers; compiled forests are memory-mapped, so their pages are
+shared through the page cache as well. Inference is CPU-bound, so one sync
+worker per core gives the best throughput without oversubscribing; see
+bench_workers.py for the per-worker memory and throughput measurements.
+
+POST /models/reload swaps models in the worker that answers it only; set
+ML_WATCH_MODELS to a poll interval so every worker follows models/CURRENT.
+The /inventory queue lives in one process's memory, so with more than one
+worker its routes answer 503; serve it from an instance with ML_WORKERS=1.
+"""
+import gc
+import multiprocessing
+import os
+
+# Lazy loading would defer loads into each worker and defeat preloading
+os.environ.setdefault('ML_LAZY_LOAD', '0')
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('ML_WORKERS', multiprocessing.cpu_count()))
+worker_class = 'sync'
+preload_app = os.environ.get('ML_PRELOAD', '1') == '1'
+timeout = 60
+keepalive = 5
+
+def when_ready(server):
+    # Move the preloaded objects out of GC tracking so collections in workers don't dirty shared pages
+    gc.freeze()
+
+def post_fork(server, worker):
+    # Threads do not survive fork: each worker starts its own models/CURRENT watcher and inventory rollover
+    import ml_api
+    ml_api.server_workers = server.cfg.workers
+    ml_api.start_model_watcher()
+    ml_api.start_inventory_rollover()
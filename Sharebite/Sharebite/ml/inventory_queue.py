@@ -0,0 +1,250 @@
+"""
+Incremental priority queue of live inventory items
+
+Holds the /predict/all predictions of every live item with a heap per
+restaurant, ordered by urgency: highest priority_score first, then fewest
+expiration_days. Reading a restaurant's k most urgent items walks only the
+top of its heap, O(k log k), and scores nothing. Items are scored when they
+are added or edited, in one batch per call, and deletes only drop them.
+
+Predictions change only with the date and the model version. On the first
+use after midnight or after a model reload, every item is rescored once in
+batches and the heaps are rebuilt. Readers keep getting the previous order
+while that runs. A background thread does the midnight rescore ahead of the
+first dashboard load of the day.
+
+An edit does not reorder the heap in place. It pushes a new entry, and the
+old one is skipped when read. A restaurant's heap is rebuilt once it holds
+more stale entries than live ones.
+
+The queue lives in the serving process. Several gunicorn workers would each
+keep their own copy, so ml_api answers the /inventory routes with 503 when
+the server runs more than one worker (ML_WORKERS=1 or the ASGI app serve it).
+"""
+import heapq
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+# Items with these statuses (lib/types.ts FoodItemStatus) are no longer in stock
+INACTIVE_STATUSES = {'consumed', 'donated'}
+
+# Items per scoring call when every item is rescored
+RESCORE_BATCH = 5000
+
+def urgency_key(predictions):
+    """Heap order of an item, most urgent first"""
+    return (-predictions['priority_score'], predictions['expiration_days'])
+
+class _Entry:
+    __slots__ = ('restaurant_id', 'item', 'predictions', 'seq')
+
+    def __init__(self, restaurant_id, item, predictions, seq):
+        self.restaurant_id = restaurant_id
+        self.item = item
+        self.predictions = predictions
+        self.seq = seq
+
+class InventoryQueue:
+    """Live items by id with a lazy-deletion urgency heap per restaurant
+
+    score(items, today, serving) must return one {'success', 'predictions'} or
+    {'success': False, 'error'} dict per item (ml_api.score_items). Writers
+    (upsert, delete, rescoring) run one at a time and score outside the lock
+    that readers take.
+    """
+
+    def __init__(self, score, today=date.today):
+        self._score = score
+        self._today = today
+        self._write_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._items = {}
+        self._heaps = {}
+        self._live = {}
+        self._stale = {}
+        self._seq = 0
+        # (date, model version) the predictions were made for
+        self.scored_for = None
+        self.rescores = 0
+        self.last_rescore = None
+
+    def __len__(self):
+        return len(self._items)
+
+    def _due(self, serving):
+        return serving is not None and self.scored_for != (self._today(), serving.version)
+
+    def refresh(self, serving, wait=True):
+        """Rescore every item if the date or model version changed; returns whether it did
+
+        With wait=False the call returns at once when another writer is busy.
+        """
+        if not self._due(serving) or not self._write_lock.acquire(blocking=wait):
+            return False
+        try:
+            if not self._due(serving):
+                return False
+            self._rescore_all(serving)
+            return True
+        finally:
+            self._write_lock.release()
+
+    def _rescore_all(self, serving):
+        # Called with the write lock held; readers see the old heaps until the swap
+        today = self._today()
+        start = time.perf_counter()
+        entries = list(self._items.items())
+        items, heaps, live = {}, {}, {}
+        for offset in range(0, len(entries), RESCORE_BATCH):
+            batch = entries[offset:offset + RESCORE_BATCH]
+            results = self._score([entry.item for _, entry in batch], today, serving)
+            for (item_id, entry), result in zip(batch, results):
+                # Items were valid when added; if one no longer scores, keep its last predictions
+                predictions = result['predictions'] if result['success'] else entry.predictions
+                self._seq += 1
+                items[item_id] = _Entry(entry.restaurant_id, entry.item, predictions, self._seq)
+                heaps.setdefault(entry.restaurant_id, []).append((urgency_key(predictions), self._seq, item_id))
+                live[entry.restaurant_id] = live.get(entry.restaurant_id, 0) + 1
+        for heap in heaps.values():
+            heapq.heapify(heap)
+        with self._lock:
+            self._items, self._heaps, self._live, self._stale = items, heaps, live, {}
+            self.scored_for = (today, serving.version)
+        self.rescores += 1
+        self.last_rescore = {
+            'items': len(items),
+            'date': today.isoformat(),
+            'model_version': serving.version,
+            'seconds': time.perf_counter() - start,
+            'finished_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+
+    def _drop(self, item_id):
+        # Called with both locks held
+        entry = self._items.pop(item_id, None)
+        if entry is None:
+            return False
+        restaurant_id = entry.restaurant_id
+        self._live[restaurant_id] -= 1
+        if not self._live[restaurant_id]:
+            del self._live[restaurant_id], self._heaps[restaurant_id]
+            self._stale.pop(restaurant_id, None)
+        else:
+            self._stale[restaurant_id] = self._stale.get(restaurant_id, 0) + 1
+            self._compact(restaurant_id)
+        return True
+
+    def _is_live(self, heap_entry):
+        entry = self._items.get(heap_entry[2])
+        return entry is not None and entry.seq == heap_entry[1]
+
+    def _compact(self, restaurant_id):
+        if self._stale.get(restaurant_id, 0) <= self._live[restaurant_id]:
+            return
+        heap = [e for e in self._heaps[restaurant_id] if self._is_live(e)]
+        heapq.heapify(heap)
+        self._heaps[restaurant_id] = heap
+        self._stale[restaurant_id] = 0
+
+    def upsert(self, items, serving):
+        """Add or replace items, scoring them in one batch; returns one result dict per item
+
+        Items need id and restaurant_id plus the /predict/all fields. An item
+        whose status is consumed or donated is removed instead.
+        """
+        results = [None] * len(items)
+        with self._write_lock:
+            if self._due(serving):
+                self._rescore_all(serving)
+            today, _ = self.scored_for
+            to_score, positions, removed = [], [], []
+            for i, item in enumerate(items):
+                if not isinstance(item, dict) or item.get('id') is None or item.get('restaurant_id') is None:
+                    results[i] = {'success': False, 'error': 'Item must be a JSON object with id and restaurant_id'}
+                elif item.get('status') in INACTIVE_STATUSES:
+                    removed.append(i)
+                else:
+                    positions.append(i)
+                    to_score.append(item)
+            scored = self._score(to_score, today, serving) if to_score else []
+
+            with self._lock:
+                for i in removed:
+                    self._drop(str(items[i]['id']))
+                    results[i] = {'id': str(items[i]['id']), 'success': True, 'removed': True}
+                for i, result in zip(positions, scored):
+                    item_id = str(items[i]['id'])
+                    if not result['success']:
+                        results[i] = {'id': item_id, 'success': False, 'error': result['error']}
+                        continue
+                    self._drop(item_id)
+                    restaurant_id = str(items[i]['restaurant_id'])
+                    predictions = result['predictions']
+                    self._seq += 1
+                    self._items[item_id] = _Entry(restaurant_id, items[i], predictions, self._seq)
+                    heapq.heappush(self._heaps.setdefault(restaurant_id, []),
+                                   (urgency_key(predictions), self._seq, item_id))
+                    self._live[restaurant_id] = self._live.get(restaurant_id, 0) + 1
+                    results[i] = {'id': item_id, 'success': True, 'predictions': predictions}
+        return results
+
+    def delete(self, item_ids):
+        """Remove items; returns how many were in the queue"""
+        with self._write_lock, self._lock:
+            return sum(self._drop(str(item_id)) for item_id in item_ids)
+
+    def top(self, restaurant_id, k):
+        """The k most urgent live items of a restaurant as {'id', 'item', 'predictions'} dicts"""
+        with self._lock:
+            heap = self._heaps.get(str(restaurant_id), [])
+            result = []
+            # Best-first walk of the heap's tree: a child is never more urgent than its parent
+            frontier = [(heap[0], 0)] if heap else []
+            while frontier and len(result) < k:
+                heap_entry, i = heapq.heappop(frontier)
+                if self._is_live(heap_entry):
+                    entry = self._items[heap_entry[2]]
+                    result.append({'id': heap_entry[2], 'item': entry.item, 'predictions': entry.predictions})
+                for child in (2 * i + 1, 2 * i + 2):
+                    if child < len(heap):
+                        heapq.heappush(frontier, (heap[child], child))
+            return result
+
+    def stats(self):
+        with self._lock:
+            scored_date, version = self.scored_for or (None, None)
+            return {
+                'items': len(self._items),
+                'restaurants': len(self._heaps),
+                'heap_entries': sum(len(heap) for heap in self._heaps.values()),
+                'scored_for_date': scored_date.isoformat() if scored_date else None,
+                'model_version': version,
+                'rescores': self.rescores,
+                'last_rescore': self.last_rescore,
+            }
+
+class RolloverThread(threading.Thread):
+    """Daemon thread calling refresh(serving()) just after midnight (and at least every max_sleep seconds)"""
+
+    def __init__(self, queue, serving, max_sleep=3600.0):
+        super().__init__(name='inventory-rollover', daemon=True)
+        self.queue = queue
+        self.serving = serving
+        self.max_sleep = max_sleep
+        self._stop_event = threading.Event()
+
+    def _sleep_seconds(self):
+        now = datetime.now()
+        midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+        return min(self.max_sleep, (midnight - now).total_seconds() + 1)
+
+    def run(self):
+        while not self._stop_event.wait(self._sleep_seconds()):
+            try:
+                self.queue.refresh(self.serving())
+            except Exception as e:
+                print(f"Inventory rollover: {e}")
+
+    def stop(self):
+        self._stop_event.set()
@@ -0,0 +1,267 @@
+"""
+Precomputed model outputs for the discrete input grid
+
+Apart from quantity, every model input comes from a small discrete set:
+category, restaurant type, month, weekday and integer days_remaining /
+shelf_life. The materialize step scores the dense grid of common inputs
+(with a fixed list of quantity values) once, offline, and writes the raw
+model outputs to a memory-mapped .npy array. At serving time a row that
+lands exactly on the grid is answered with one array read; anything else
+falls back to live inference. Outputs are stored as float64, exactly what
+the models return, so an answer does not depend on whether it came from the
+table.
+
+Usage (from ml/, after training):
+    python lookup_table.py                 # weekdays/months of purchase dates within 7 days of today
+    python lookup_table.py --all-dates     # all 7 weekdays x 12 months
+"""
+import argparse
+import json
+import os
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+from features import DEFAULT_CATEGORY, DEFAULT_RESTAURANT_TYPE, RESTAURANT_WASTE_FACTORS, WASTE_PROBABILITIES
+from model_store import artifact_path
+from postprocess import PERISHABLE_CATEGORIES
+
+# Raw model outputs stored per grid cell, in this order
+LOOKUP_OUTPUTS = ['expiration', 'waste_risk', 'donation_probability', 'priority']
+
+DEFAULT_DAYS_REMAINING = (-3, 21)
+DEFAULT_SHELF_LIFE = (1, 21)
+DEFAULT_QUANTITIES = [1, 2, 5, 10, 15, 20, 25, 30, 40, 50, 75, 100]
+
+# Rows scored per chunk while materializing
+MATERIALIZE_CHUNK = 65536
+
+def table_paths(models_dir):
+    """(.npy array, .json metadata) locations"""
+    return os.path.join(models_dir, 'lookup_table.npy'), os.path.join(models_dir, 'lookup_table.json')
+
+def models_signature(models_dir, model_names, backend='compiled', compact=False):
+    """Size and mtime of the artifacts served for model_names, used to detect a stale table
+
+    Only the artifacts the table is scored from count (compact or full, fused or
+    separate), so writing other artifacts next to them does not invalidate it.
+    """
+    signature = {}
+    for name in sorted(model_names):
+        path = artifact_path(models_dir, name, backend, compact)
+        if path is None:
+            continue
+        # Compiled forests are directories of .npy files
+        files = [os.path.join(path, f) for f in sorted(os.listdir(path))] if os.path.isdir(path) else [path]
+        stats = [os.stat(f) for f in files]
+        signature[os.path.basename(path)] = [sum(st.st_size for st in stats), int(max(st.st_mtime for st in stats))]
+    return signature
+
+class LookupTable:
+    """Memory-mapped grid of raw model outputs indexed straight from feature rows"""
+
+    def __init__(self, values, meta, feature_columns):
+        self.values = values.reshape(-1, len(LOOKUP_OUTPUTS))
+        self.meta = meta
+        self.shape = tuple(values.shape[:-1])
+        self.n_categories = len(meta['categories'])
+        self.n_restaurant_types = len(meta['restaurant_types'])
+        self.days_min, self.days_max = meta['days_remaining']
+        self.shelf_min, self.shelf_max = meta['shelf_life']
+        self.quantities = np.array(meta['quantities'], dtype=np.float64)
+
+        # (month, weekday) -> slot, -1 where not materialized
+        self.slot_of = np.full((13, 7), -1, dtype=np.intp)
+        for slot, (month, weekday) in enumerate(meta['date_slots']):
+            self.slot_of[month, weekday] = slot
+
+        # Name-derived features a grid row must carry, computed as features.FeatureBuilder does
+        category_waste = np.array([WASTE_PROBABILITIES.get(c, WASTE_PROBABILITIES[DEFAULT_CATEGORY])
+                                   for c in meta['categories']])
+        waste_factor = np.array([RESTAURANT_WASTE_FACTORS.get(r, RESTAURANT_WASTE_FACTORS[DEFAULT_RESTAURANT_TYPE])
+                                 for r in meta['restaurant_types']])
+        self.waste_probability = category_waste[:, None] * (1 + waste_factor[None, :])
+        self.is_perishable = np.array([1.0 if c in PERISHABLE_CATEGORIES else 0.0 for c in meta['categories']])
+
+        column = {name: i for i, name in enumerate(feature_columns)}
+        self._cols = [column[name] for name in (
+            'category_encoded', 'restaurant_type_encoded', 'quantity', 'days_remaining',
+            'shelf_life', 'month', 'day_of_week', 'waste_probability', 'is_perishable',
+        )]
+
+    @classmethod
+    def load(cls, models_dir, feature_columns, model_names, backend='compiled', compact=False):
+        """Open the table read-only with mmap; returns None if missing or built from other artifacts
+
+        model_names are the models run_models scores with: the fused forest or the four separate ones.
+        """
+        values_path, meta_path = table_paths(models_dir)
+        if not (os.path.exists(values_path) and os.path.exists(meta_path)):
+            return None
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get('models_signature') != models_signature(models_dir, model_names, backend, compact):
+            print("Lookup table is out of date for the loaded models; ignoring it")
+            return None
+        values = np.load(values_path, mmap_mode='r')
+        if values.dtype != np.float64:
+            # Tables from before outputs were stored at full precision would round them
+            print("Lookup table stores rounded outputs; rebuild it with lookup_table.py. Ignoring it")
+            return None
+        return cls(values, meta, feature_columns)
+
+    def lookup(self, features):
+        """Return (outputs, hit) where hit marks the rows answered from the table"""
+        (category, restaurant_type, quantity, days, shelf,
+         month, weekday, waste_probability, is_perishable) = (features[:, c] for c in self._cols)
+
+        cat = category.astype(np.intp)
+        rt = restaurant_type.astype(np.intp)
+        q = np.searchsorted(self.quantities, quantity)
+        hit = (
+            (cat == category) & (cat >= 0) & (cat < self.n_categories)
+            & (rt == restaurant_type) & (rt >= 0) & (rt < self.n_restaurant_types)
+            & (days >= self.days_min) & (days <= self.days_max)
+            & (shelf >= self.shelf_min) & (shelf <= self.shelf_max)
+            & (q < len(self.quantities))
+        )
+        cat = np.where(hit, cat, 0)
+        rt = np.where(hit, rt, 0)
+        q = np.where(hit, q, 0)
+        hit &= (
+            (self.quantities[q] == quantity)
+            & (self.waste_probability[cat, rt] == waste_probability)
+            & (self.is_perishable[cat] == is_perishable)
+        )
+        slot = self.slot_of[np.where(hit, month, 0).astype(np.intp), np.where(hit, weekday, 0).astype(np.intp)]
+        hit &= slot >= 0
+
+        rows = np.flatnonzero(hit)
+        index = np.ravel_multi_index((
+            slot[rows],
+            cat[rows],
+            rt[rows],
+            (days[rows] - self.days_min).astype(np.intp),
+            (shelf[rows] - self.shelf_min).astype(np.intp),
+            q[rows],
+        ), self.shape)
+        outputs = np.full((len(features), len(LOOKUP_OUTPUTS)), np.nan)
+        outputs[rows] = self.values[index]
+        return outputs, hit
+
+def date_slots(all_dates, horizon_days, start=None):
+    """(month, weekday) pairs to materialize
+
+    Month and weekday are features of the purchase date, so the default covers
+    purchases from horizon_days before until horizon_days after start.
+    """
+    if all_dates:
+        return [(month, weekday) for month in range(1, 13) for weekday in range(7)]
+    start = start or date.today()
+    slots = []
+    for offset in range(-horizon_days, horizon_days):
+        day = start + timedelta(days=offset)
+        if (day.month, day.weekday()) not in slots:
+            slots.append((day.month, day.weekday()))
+    return slots
+
+def materialize(run_models, builder, categories, restaurant_types, slots, days_range, shelf_range,
+                quantities, values_path):
+    """Score every grid cell with run_models and write the outputs to values_path"""
+    days_values = np.arange(days_range[0], days_range[1] + 1)
+    shelf_values = np.arange(shelf_range[0], shelf_range[1] + 1)
+    shape = (len(slots), len(categories), len(restaurant_types), len(days_values), len(shelf_values), len(quantities))
+    n_cells = int(np.prod(shape))
+
+    values = np.lib.format.open_memmap(values_path, mode='w+', dtype=np.float64,
+                                       shape=shape + (len(LOOKUP_OUTPUTS),))
+    flat = values.reshape(-1, len(LOOKUP_OUTPUTS))
+    slots = np.array(slots)
+    categories = np.array(categories, dtype=object)
+    restaurant_types = np.array(restaurant_types, dtype=object)
+    quantities = np.array(quantities, dtype=np.float64)
+
+    for start in range(0, n_cells, MATERIALIZE_CHUNK):
+        index = np.unravel_index(np.arange(start, min(start + MATERIALIZE_CHUNK, n_cells)), shape)
+        slot, cat, rt, days, shelf, q = index
+        features = builder.build_matrix(
+            category=categories[cat],
+            restaurant_type=restaurant_types[rt],
+            quantity=quantities[q],
+            days_remaining=days_values[days],
+            shelf_life=shelf_values[shelf],
+            month=slots[slot, 0],
+            day_of_week=slots[slot, 1],
+        )
+        outputs = run_models(features)
+        flat[start:start + len(features)] = np.column_stack([outputs[name] for name in LOOKUP_OUTPUTS])
+        print(f"  {min(start + MATERIALIZE_CHUNK, n_cells)}/{n_cells} cells")
+    values.flush()
+    return shape
+
+def main(argv=None):
+    """Materialize the lookup table for the models in models/"""
+    parser = argparse.ArgumentParser(description='Precompute model outputs for the discrete input grid')
+    parser.add_argument('--models-dir', default='models')
+    parser.add_argument('--all-dates', action='store_true', help='all 12 months x 7 weekdays')
+    parser.add_argument('--horizon-days', type=int, default=7,
+                        help='without --all-dates, cover the (month, weekday) pairs of purchase dates '
+                             'within N days of today')
+    parser.add_argument('--days-remaining', type=int, nargs=2, default=DEFAULT_DAYS_REMAINING, metavar=('MIN', 'MAX'))
+    parser.add_argument('--shelf-life', type=int, nargs=2, default=DEFAULT_SHELF_LIFE, metavar=('MIN', 'MAX'))
+    parser.add_argument('--quantities', type=lambda s: [float(q) for q in s.split(',')], default=DEFAULT_QUANTITIES)
+    args = parser.parse_args(argv)
+
+    # Score with live inference only
+    os.environ['ML_USE_LOOKUP'] = '0'
+    import ml_api
+    if not ml_api.load_models(path=args.models_dir):
+        return
+
+    # Grid axes follow the serving encodings so table indexes are the encoded feature values
+    category_codes = ml_api.active.feature_builder.category_codes
+    restaurant_type_codes = ml_api.active.feature_builder.restaurant_type_codes
+    categories = sorted(category_codes, key=category_codes.get)
+    restaurant_types = sorted(restaurant_type_codes, key=restaurant_type_codes.get)
+    if [category_codes[c] for c in categories] != list(range(len(categories))):
+        raise ValueError('Category encoding must be 0..n-1 to index the table')
+    if [restaurant_type_codes[r] for r in restaurant_types] != list(range(len(restaurant_types))):
+        raise ValueError('Restaurant type encoding must be 0..n-1 to index the table')
+
+    slots = date_slots(args.all_dates, args.horizon_days)
+    quantities = sorted(set(args.quantities))
+    values_path, meta_path = table_paths(args.models_dir)
+
+    print(f"Materializing {len(slots)} date slots x {len(categories)} categories x "
+          f"{len(restaurant_types)} restaurant types x days {args.days_remaining} x "
+          f"shelf life {args.shelf_life} x {len(quantities)} quantities")
+    start = time.perf_counter()
+    shape = materialize(ml_api.run_models, ml_api.active.feature_builder, categories, restaurant_types, slots,
+                        args.days_remaining, args.shelf_life, quantities, values_path)
+    elapsed = time.perf_counter() - start
+
+    meta = {
+        'outputs': LOOKUP_OUTPUTS,
+        'shape': list(shape),
+        'date_slots': [list(slot) for slot in slots],
+        'categories': categories,
+        'restaurant_types': restaurant_types,
+        'days_remaining': list(args.days_remaining),
+        'shelf_life': list(args.shelf_life),
+        'quantities': quantities,
+        'fused': 'fused_predictor' in ml_api.active.models,
+        'compact': ml_api.USE_COMPACT,
+        'models_signature': models_signature(args.models_dir, ml_api.scoring_models(ml_api.active.models),
+                                             ml_api.MODEL_BACKEND, ml_api.USE_COMPACT),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    print(f"Saved: {values_path} ({os.path.getsize(values_path) / 1e6:.1f} MB, "
+          f"{int(np.prod(shape)) / elapsed:.0f} cells/s)")
+    print(f"Saved: {meta_path}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""
+Per-stage request timing and counters in the Prometheus text format
+
+Each request gets a StageTimer (start()). The hot path marks the end of a
+stage with lap('features'), lap('models') and so on; lap() is a no-op when no
+request is being timed, so shared code can call it from scripts too. Stage
+times are summed per request and recorded into fixed-bucket histograms, per
+endpoint and stage, in one locked update when the request finishes. Together
+with request, error and model-call counters they are rendered for GET /metrics.
+
+Timers live in a context variable, so threaded Flask workers and asyncio
+tasks each see their own. Every process keeps its own registry: under
+gunicorn each scrape reads the worker that answers it.
+"""
+import bisect
+import time
+from contextvars import ContextVar
+from threading import Lock
+
+# Histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_current = ContextVar('ml_stage_timer', default=None)
+
+class StageTimer:
+    """Wall time per stage of one request"""
+
+    __slots__ = ('endpoint', 'start', 'last', 'stages')
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.start = self.last = time.perf_counter()
+        self.stages = {}
+
+    def lap(self, stage):
+        """Charge the time since the previous lap to stage"""
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + now - self.last
+        self.last = now
+
+class Histogram:
+    """Per-bucket counts with sum and count; made cumulative when rendered"""
+
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self, n_buckets):
+        # One slot per bucket plus +Inf
+        self.counts = [0] * (n_buckets + 1)
+        self.sum = 0.0
+        self.count = 0
+
+class MetricsRegistry:
+    """Thread-safe store of stage histograms and counters"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = Lock()
+        self._stages = {}
+        self._requests = {}
+        self._model_calls = {}
+
+    def record(self, timer, status):
+        """Add a finished request: every stage, the total and the status count"""
+        total = time.perf_counter() - timer.start
+        with self._lock:
+            for stage, seconds in list(timer.stages.items()) + [('total', total)]:
+                key = (timer.endpoint, stage)
+                histogram = self._stages.get(key)
+                if histogram is None:
+                    histogram = self._stages[key] = Histogram(len(self.buckets))
+                histogram.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+                histogram.sum += seconds
+                histogram.count += 1
+            key = (timer.endpoint, str(status))
+            self._requests[key] = self._requests.get(key, 0) + 1
+
+    def count_model_calls(self, models, rows):
+        """Count one predict call over rows for each named model"""
+        with self._lock:
+            for model in models:
+                calls = self._model_calls.setdefault(model, [0, 0])
+                calls[0] += 1
+                calls[1] += rows
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._requests.clear()
+            self._model_calls.clear()
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format (version 0.0.4)"""
+        with self._lock:
+            stages = {key: (list(h.counts), h.sum, h.count) for key, h in self._stages.items()}
+            requests = dict(self._requests)
+            model_calls = {name: list(calls) for name, calls in self._model_calls.items()}
+
+        lines = [
+            '# HELP ml_requests_total Requests handled, by endpoint and HTTP status.',
+            '# TYPE ml_requests_total counter',
+        ]
+        for (endpoint, status), count in sorted(requests.items()):
+            lines.append(f'ml_requests_total{{endpoint="{endpoint}",status="{status}"}} {count}')
+
+        lines += [
+            '# HELP ml_request_errors_total Requests answered with a 4xx or 5xx status, by endpoint.',
+            '# TYPE ml_request_errors_total counter',
+        ]
+        errors = {}
+        for (endpoint, status), count in requests.items():
+            if status[:1] in ('4', '5'):
+                errors[endpoint] = errors.get(endpoint, 0) + count
+        for endpoint, count in sorted(errors.items()):
+            lines.append(f'ml_request_errors_total{{endpoint="{endpoint}"}} {count}')
+
+        lines += [
+            '# HELP ml_model_calls_total Model predict calls, by model.',
+            '# TYPE ml_model_calls_total counter',
+        ]
+        lines += [f'ml_model_calls_total{{model="{name}"}} {calls}' for name, (calls, _) in sorted(model_calls.items())]
+        lines += [
+            '# HELP ml_model_rows_total Rows scored by model predict calls, by model.',
+            '# TYPE ml_model_rows_total counter',
+        ]
+        lines += [f'ml_model_rows_total{{model="{name}"}} {rows}' for name, (_, rows) in sorted(model_calls.items())]
+
+        lines += [
+            '# HELP ml_stage_seconds Wall time per request spent in each stage, by endpoint.',
+            '# TYPE ml_stage_seconds histogram',
+        ]
+        for (endpoint, stage), (counts, total, count) in sorted(stages.items()):
+            labels = f'endpoint="{endpoint}",stage="{stage}"'
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'ml_stage_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f'ml_stage_seconds_sum{{{labels}}} {total!r}')
+            lines.append(f'ml_stage_seconds_count{{{labels}}} {count}')
+        return '\n'.join(lines) + '\n'
+
+registry = MetricsRegistry()
+
+# Content type Prometheus expects for the text format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def start(endpoint):
+    """Begin timing a request in the current context"""
+    timer = StageTimer(endpoint)
+    _current.set(timer)
+    return timer
+
+def lap(stage):
+    """End the current stage of the request being timed (no-op outside a request)"""
+    timer = _current.get()
+    if timer is not None:
+        timer.lap(stage)
+
+def finish(status, final_stage=None):
+    """Record the request being timed; final_stage takes the time since the last lap"""
+    timer = _current.get()
+    if timer is None:
+        return
+    if final_stage is not None:
+        timer.lap(final_stage)
+    _current.set(None)
+    registry.record(timer, status)
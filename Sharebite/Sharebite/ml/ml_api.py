@@ -1,522 +1,849 @@
 """
 Flask API to serve ML model predictions
 """
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 import joblib
-import pandas as pd
+import json
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import date
+from threading import Lock
 import os
+import time
+import warnings
 
-app = Flask(__name__)
-CORS(app)  # Enable CORS for React frontend
-
-# Load models
-models = {}
-feature_info = None
-
-# Category mapping (simplified - should match training data)
-CATEGORY_MAPPING = {
-    'Fruits': 0,
-    'Vegetables': 1,
-    'Dairy': 2,
-    'Meat': 3,
-    'Bakery': 4,
-    'Grains': 5,
-    'Beverages': 6,
-    'Prepared Foods': 7,
-    'Frozen Foods': 8,
-    'Canned Goods': 9,
-}
-
-RESTAURANT_TYPE_MAPPING = {
-    'Fast Food': 0,
-    'Fine Dining': 1,
-    'Cafe': 2,
-    'Buffet': 3,
-    'Food Truck': 4,
-    'Bakery': 5,
-}
-
-def load_models():
-    """Load all trained models"""
-    global models, feature_info
+import inventory_queue
+import metrics
+import model_registry
+import ngo_matching
+import postprocess
+from features import DEFAULT_QUANTITY, FeatureBuilder, default_encodings
+from lookup_table import LOOKUP_OUTPUTS, LookupTable
+from model_store import load_model_set
+from prediction_cache import PredictionCache, cache_key
+
+# Models are fitted on DataFrames but served plain arrays in feature_info['feature_columns'] order
+warnings.filterwarnings('ignore', message='X does not have valid feature names')
+
+api = Blueprint('api', __name__)
+
+# Directory training writes to; published versions live under it (model_registry.py)
+MODELS_DIR = os.environ.get('ML_MODELS_DIR', 'models')
+
+# 'compiled' serves the NumPy forest engine when exported arrays exist, 'sklearn' always uses the pickles
+MODEL_BACKEND = os.environ.get('ML_MODEL_BACKEND', 'compiled')
+
+# Memory-map compiled forest arrays so worker processes share them through the page cache
+USE_MMAP = os.environ.get('ML_MMAP', '1') == '1'
+
+# Serve the compacted forests from compact_models.py where they exist (compiled backend only)
+USE_COMPACT = os.environ.get('ML_COMPACT', '0') == '1'
+
+# Load each model on first use instead of at startup (reloads always load everything before the swap)
+LAZY_LOAD = os.environ.get('ML_LAZY_LOAD', '0') == '1'
+
+# Serve every /predict/* endpoint from the fused multi-output forest (train_models.py --fused)
+USE_FUSED = os.environ.get('ML_USE_FUSED', '0') == '1'
+
+# Answer on-grid items from the materialized lookup table (lookup_table.py) when it is present
+USE_LOOKUP = os.environ.get('ML_USE_LOOKUP', '1') == '1'
+
+# Seconds between checks of models/CURRENT for a newly activated version (0 disables the watcher)
+WATCH_INTERVAL = float(os.environ.get('ML_WATCH_MODELS', '0'))
+
+MODEL_NAMES = ['expiration_predictor', 'waste_risk_predictor', 'donation_recommender', 'priority_scorer']
+
+# Model giving each raw output when the fused forest is not served
+OUTPUT_MODELS = dict(zip(['expiration', 'waste_risk', 'donation_probability', 'priority'], MODEL_NAMES))
+
+# Per-item values needed by the post-processing rules
+METADATA_KEYS = ['days_remaining', 'quantity', 'waste_probability', 'is_perishable', 'actual_days_remaining']
+
+# Cached /predict/all results, keyed on the model version, the normalized item and today's date (0 disables the cache)
+prediction_cache = PredictionCache(int(os.environ.get('ML_CACHE_SIZE', '10000')))
+
+# Live items with their predictions, by urgency per restaurant (inventory_queue.py). Inventory
+# scoring skips the prediction cache: the queue keeps the results itself.
+inventory = inventory_queue.InventoryQueue(lambda items, today, serving: score_items(items, today, serving, cache=False))
+_rollover = None
+
+# Worker processes of the server running this app (gunicorn.conf.py sets it in each worker). The
+# inventory queue is one process's memory: with several workers, requests would reach different
+# copies, so the /inventory routes answer 503 instead.
+server_workers = 1
+
+# Items returned by /inventory/urgent without k, and the most it returns
+DEFAULT_TOP_K = 10
+MAX_TOP_K = 1000
+
+# Upper bound on items accepted by /predict/batch in one request
+MAX_BATCH_SIZE = 5000
+
+# Items scored per model call by /predict/stream; results are sent back after every chunk
+STREAM_CHUNK_SIZE = int(os.environ.get('ML_STREAM_CHUNK', '1000'))
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+
+# Items scored through a newly loaded version before it is swapped in
+WARMUP_ITEMS = [
+    {'category': 'Dairy', 'restaurant_type': 'Cafe', 'quantity': 5},
+    {'category': 'Meat', 'restaurant_type': 'Buffet', 'quantity': 60,
+     'purchase_date': '2024-01-01', 'expiry_date': '2024-01-04'},
+    {'category': 'Canned Goods', 'restaurant_type': 'Fine Dining', 'quantity': 20,
+     'purchase_date': '2024-01-01', 'expiry_date': '2025-01-01'},
+]
+
+class ServingModels:
+    """One loaded model version: models, feature pipeline and lookup table, swapped in as a unit"""
+
+    def __init__(self, version, path, models, feature_info, feature_builder, lookup_table):
+        self.version = version
+        self.path = path
+        self.models = models
+        self.feature_info = feature_info
+        self.feature_builder = feature_builder
+        self.lookup_table = lookup_table
+        self.loaded_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+
+    def describe(self):
+        return {
+            'version': self.version,
+            'path': self.path,
+            'loaded_at': self.loaded_at,
+            'models': [name for name in MODEL_NAMES + ['fused_predictor'] if name in self.models],
+            'lookup_table': self.lookup_table is not None,
+        }
+
+# The version being served. Requests read it once and use that object throughout, so a reload
+# replaces it with a single assignment while in-flight requests finish on the old version.
+active = None
+
+# One reload at a time; its outcome is reported by GET /models
+reload_lock = Lock()
+last_reload = None
+_watcher = None
+
+def open_models(version=None, path=None):
+    """Load a model version (default: the active one in MODELS_DIR) without serving it"""
+    if path is None:
+        if version is None:
+            version, path = model_registry.current_version(MODELS_DIR)
+        else:
+            path = model_registry.version_path(MODELS_DIR, version)
+    elif version is None:
+        version = os.path.basename(os.path.normpath(path))
+    feature_info = joblib.load(os.path.join(path, 'feature_info.joblib'))
+    
+    # Optional single multi-output forest replacing the four separate traversals
+    optional = ['fused_predictor'] if USE_FUSED and 'fused_outputs' in feature_info else []
+    # Only the first load may defer model loads; a reload must not swap in models that still have to load
+    models = load_model_set(path, MODEL_NAMES, MODEL_BACKEND, mmap=USE_MMAP, lazy=LAZY_LOAD and active is None,
+                            optional=optional, compact=USE_COMPACT)
+    
+    # Encodings fitted at training time; older artifacts were trained on the alphabetical codes
+    encodings = feature_info.get('encodings')
+    if encodings is None:
+        print("feature_info has no encodings (trained before they were stored), using alphabetical codes")
+        encodings = default_encodings()
+    feature_builder = FeatureBuilder(encodings, feature_info.get('feature_columns'))
+    # Precomputed outputs, only if materialized for exactly these models
+    lookup_table = None
+    if USE_LOOKUP:
+        lookup_table = LookupTable.load(path, feature_builder.feature_columns, scoring_models(models), MODEL_BACKEND,
+                                        USE_COMPACT)
+        if lookup_table is not None:
+            print(f"Lookup table loaded: {lookup_table.shape}")
+    return ServingModels(version, path, models, feature_info, feature_builder, lookup_table)
+
+def warm_up(serving):
+    """Run WARMUP_ITEMS through every model of a loaded version; raises if a prediction is unusable"""
+    if LAZY_LOAD and active is None:
+        # Lazy startup: each model loads with its first request instead
+        return
+    builder = serving.feature_builder
+    features, _ = builder.build_resolved([builder.resolve(item, date.today()) for item in WARMUP_ITEMS])
+    for name, model in serving.models.items():
+        if not np.all(np.isfinite(np.asarray(model.predict(features), dtype=np.float64))):
+            raise ValueError(f'{name} of model version {serving.version!r} returned non-finite predictions')
+    if serving.lookup_table is not None:
+        serving.lookup_table.lookup(features)
+
+def load_models(version=None, path=None):
+    """Load, warm up and start serving a model version (default: the active one); False on failure"""
+    global active
     
     try:
-        models['expiration_predictor'] = joblib.load('models/expiration_predictor.joblib')
-        models['waste_risk_predictor'] = joblib.load('models/waste_risk_predictor.joblib')
-        models['donation_recommender'] = joblib.load('models/donation_recommender.joblib')
-        models['priority_scorer'] = joblib.load('models/priority_scorer.joblib')
-        feature_info = joblib.load('models/feature_info.joblib')
-        print("Models loaded successfully")
-        return True
+        serving = open_models(version, path)
+        warm_up(serving)
     except Exception as e:
         print(f"Error loading models: {e}")
         return False
-
-def prepare_features(data):
-    """Prepare features for prediction - returns both features DataFrame and metadata"""
-    category = data.get('category', 'Fruits')
-    restaurant_type = data.get('restaurant_type', 'Fast Food')
-    quantity = float(data.get('quantity', 10))
-    purchase_date = data.get('purchase_date')
-    expiry_date = data.get('expiry_date')
-    
-    # Get current date
-    now = datetime.now()
-    now_date = now.date()
     
-    # Calculate days remaining from TODAY (not from purchase date)
-    days_remaining = None
-    total_shelf_life = None
-    
-    if purchase_date and expiry_date:
-        try:
-            purchase = pd.to_datetime(purchase_date).date()
-            expiry = pd.to_datetime(expiry_date).date()
-            
-            # Total shelf life (from purchase to expiry)
-            total_shelf_life = (expiry - purchase).days
-            
-            # Days remaining from TODAY
-            days_remaining = (expiry - now_date).days
-        except:
-            total_shelf_life = 7
-            days_remaining = 7
-    else:
-        # Default values if dates not provided
-        total_shelf_life = 7
-        days_remaining = 7
-    
-    # Get current date features
-    month = now.month
-    day_of_week = now.weekday()
-    is_weekend = 1 if day_of_week >= 5 else 0
-    
-    # Category and restaurant type encoding
-    category_encoded = CATEGORY_MAPPING.get(category, 0)
-    restaurant_type_encoded = RESTAURANT_TYPE_MAPPING.get(restaurant_type, 0)
+    # The swap: requests that already hold the previous version keep using it until they finish
+    active = serving
+    # Cache keys include the version; drop the previous version's entries now rather than by LRU
+    prediction_cache.flush()
+    print(f"Models loaded successfully (version {serving.version})")
+    return True
+
+def reload_models(version=None):
+    """Load a version in the calling thread and swap it in; with a version, also make it the active one"""
+    global last_reload
     
-    # Waste probability (matching original training data format)
-    waste_probabilities = {
-        'Fruits': 0.15, 'Vegetables': 0.20, 'Dairy': 0.10, 'Meat': 0.25,
-        'Bakery': 0.30, 'Grains': 0.05, 'Beverages': 0.08,
-        'Prepared Foods': 0.35, 'Frozen Foods': 0.05, 'Canned Goods': 0.02,
+    if not reload_lock.acquire(blocking=False):
+        return None
+    try:
+        previous = active.version if active is not None else None
+        start = time.perf_counter()
+        loaded = load_models(version)
+        if loaded and version is not None:
+            # Other workers follow through their watchers
+            model_registry.activate(MODELS_DIR, version)
+        last_reload = {
+            'success': loaded,
+            'requested_version': version,
+            'previous_version': previous,
+            'version': active.version if active is not None else None,
+            'seconds': time.perf_counter() - start,
+            'finished_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+        return last_reload
+    finally:
+        reload_lock.release()
+
+def _follow_version(version):
+    # A reload through the API may have loaded this version already
+    if active is None or active.version != version:
+        reload_models()
+
+def start_model_watcher(interval=None):
+    """Reload whenever models/CURRENT changes (once per process; call again after fork)"""
+    global _watcher
+    interval = WATCH_INTERVAL if interval is None else interval
+    if interval <= 0 or (_watcher is not None and _watcher.is_alive()):
+        return None
+    version = active.version if active is not None else None
+    _watcher = model_registry.VersionWatcher(MODELS_DIR, _follow_version, interval, version)
+    _watcher.start()
+    return _watcher
+
+def start_inventory_rollover():
+    """Rescore the inventory queue after midnight (once per process; call again after fork)"""
+    global _rollover
+    if server_workers > 1:
+        return None
+    if _rollover is not None and _rollover.is_alive():
+        return _rollover
+    _rollover = inventory_queue.RolloverThread(inventory, lambda: active)
+    _rollover.start()
+    return _rollover
+
+def current_models():
+    """The version serving the current Flask request (fixed when the request starts)"""
+    return g.get('serving') or active
+
+def prepare_features(data, today=None, out=None, serving=None):
+    """Prepare features for prediction - returns a (1, n_features) float64 array and metadata"""
+    feature_builder = (serving or active).feature_builder
+    if out is None:
+        out = feature_builder.empty(1)
+    _, metadata = feature_builder.build_row(data, today=today, out=out[0])
+    metrics.lap('features')
+    return out, metadata
+
+def stack_metadata(metadatas):
+    """Turn a list of per-item metadata dicts into a dict of arrays for post-processing"""
+    return {key: np.array([m[key] for m in metadatas], dtype=np.float64) for key in METADATA_KEYS}
+
+def combine_predictions(ml_outputs, metadata):
+    """Apply the shared post-processing to raw model outputs for a batch of items"""
+    return postprocess.combine_all(
+        ml_outputs,
+        metadata['days_remaining'],
+        metadata['quantity'],
+        metadata['waste_probability'],
+        metadata['is_perishable'],
+        metadata['actual_days_remaining'],
+    )
+
+def prediction_row(combined, i):
+    """Extract the /predict/all result for one item from combined post-processing arrays"""
+    return {
+        'expiration_days': float(combined['expiration_days'][i]),
+        'waste_risk': float(combined['waste_risk'][i]),
+        'should_donate': bool(combined['should_donate'][i]),
+        'donation_probability': float(combined['donation_probability'][i]),
+        'priority_score': float(combined['priority_score'][i]),
+        'waste_risk_level': str(combined['waste_risk_level'][i]),
+        'priority_level': str(combined['priority_level'][i]),
     }
-    waste_probability = waste_probabilities.get(category, 0.15)
-    
-    # Shelf life estimate (use total shelf life for model compatibility)
-    shelf_life = total_shelf_life if total_shelf_life and total_shelf_life > 0 else 7
-    
-    # CRITICAL FIX: Use days_remaining (from today) instead of days_until_expiry (total shelf life)
-    # This matches what the model was trained on
-    days_until_expiry = days_remaining if days_remaining is not None else 7
-    
-    # Enhanced features for better donation prediction
-    perishable_categories = ['Fruits', 'Vegetables', 'Dairy', 'Meat', 'Bakery', 'Prepared Foods']
-    is_perishable = 1 if category in perishable_categories else 0
-    high_quantity = 1 if quantity >= 30 else 0
-    very_high_quantity = 1 if quantity >= 50 else 0
-    
-    # Create feature vector (matching training data format exactly)
-    # CRITICAL: Use days_remaining (from today) not days_until_expiry (total shelf life)
-    features = pd.DataFrame({
-        'category_encoded': [category_encoded],
-        'restaurant_type_encoded': [restaurant_type_encoded],
-        'quantity': [quantity],
-        'days_remaining': [days_remaining],  # FIXED: Use days_remaining from today
-        'shelf_life': [shelf_life],
-        'month': [month],
-        'day_of_week': [day_of_week],
-        'is_weekend': [is_weekend],
-        'waste_probability': [waste_probability],
-    })
-    
-    # Add interaction features
-    features['quantity_expiry_interaction'] = features['quantity'] * features['days_remaining']  # FIXED
-    features['category_waste_interaction'] = features['category_encoded'] * features['waste_probability']
-    
-    # Add enhanced features for donation prediction
-    features['is_perishable'] = [is_perishable]
-    features['high_quantity'] = [high_quantity]
-    features['very_high_quantity'] = [very_high_quantity]
-    features['quantity_perishable_interaction'] = [quantity * is_perishable]
-    
-    # Add urgency features based on days_remaining (matching training)
-    features['is_expired'] = [1 if days_remaining < 0 else 0]
-    features['expiring_today'] = [1 if days_remaining <= 1 else 0]
-    features['expiring_soon'] = [1 if days_remaining <= 7 else 0]
-    
-    # Calculate metadata separately (not in features DataFrame to avoid model issues)
-    # Calculate urgency factor
-    if days_remaining <= 0:
-        urgency_factor = 1.0
-    elif days_remaining <= 1:
-        urgency_factor = 0.95
-    elif days_remaining <= 3:
-        urgency_factor = 0.85
-    elif days_remaining <= 7:
-        urgency_factor = 0.70
-    else:
-        urgency_factor = max(0.1, 1.0 - (days_remaining / 30))
-    
-    quantity_factor = min(1.0, quantity / 100)
+
+def scoring_models(models):
+    """Names of the models run_models scores with"""
+    return ['fused_predictor'] if 'fused_predictor' in models else MODEL_NAMES
+
+def run_models(features, serving=None):
+    """Run each model once over a feature matrix and return the raw outputs as arrays"""
+    serving = serving or active
+    models = serving.models
+    if 'fused_predictor' in models:
+        # One traversal gives every output
+        outputs = models['fused_predictor'].predict(features)
+        ml_outputs = {name: outputs[:, i] for i, name in enumerate(serving.feature_info['fused_outputs'])}
+        ml_outputs['donation_probability'] = np.clip(ml_outputs['donation_probability'], 0, 1)
+        metrics.registry.count_model_calls(['fused_predictor'], len(features))
+        return ml_outputs
+    ml_outputs = {
+        'expiration': models['expiration_predictor'].predict(features),
+        'waste_risk': models['waste_risk_predictor'].predict(features),
+        'donation_probability': models['donation_recommender'].predict_proba(features)[:, 1],
+        'priority': models['priority_scorer'].predict(features),
+    }
+    metrics.registry.count_model_calls(MODEL_NAMES, len(features))
+    return ml_outputs
+
+def model_output(output, features, serving=None):
+    """One raw output of run_models ('expiration', 'waste_risk', 'donation_probability' or 'priority')
+
+    Comes from the same model run_models uses (the fused forest when it is loaded),
+    so single-output endpoints agree with /predict/all on either server.
+    """
+    serving = serving or active
+    models = serving.models
+    if 'fused_predictor' in models:
+        return run_models(features, serving)[output]
+    name = OUTPUT_MODELS[output]
+    model = models[name]
+    values = model.predict_proba(features)[:, 1] if output == 'donation_probability' else model.predict(features)
+    metrics.registry.count_model_calls([name], len(features))
+    return values
+
+def score_models(features, serving=None):
+    """Raw model outputs for a feature matrix, read from the lookup table where the row is on its grid"""
+    serving = serving or active
+    if serving.lookup_table is None:
+        ml_outputs = run_models(features, serving)
+        metrics.lap('models')
+        return ml_outputs
+    outputs, hit = serving.lookup_table.lookup(features)
+    metrics.lap('lookup')
+    misses = ~hit
+    if misses.any():
+        live = run_models(features[misses], serving)
+        for i, name in enumerate(LOOKUP_OUTPUTS):
+            outputs[misses, i] = live[name]
+        metrics.lap('models')
+    return {name: outputs[:, i] for i, name in enumerate(LOOKUP_OUTPUTS)}
+
+def expiration_response(days):
+    return {
+        'success': True,
+        'predicted_days_until_expiry': days,
+        'message': f'Predicted to expire in {days:.1f} days'
+    }
+
+def waste_risk_response(score, level):
+    return {
+        'success': True,
+        'waste_risk_score': score,
+        'risk_level': level,
+        'message': f'Waste risk: {level} ({score:.1f}%)'
+    }
+
+def donation_response(should_donate, probability):
+    return {
+        'success': True,
+        'should_donate': should_donate,
+        'donation_probability': probability,
+        'message': 'Recommended for donation' if should_donate else 'Not recommended for donation'
+    }
+
+def priority_response(score, level):
+    return {
+        'success': True,
+        'priority_score': score,
+        'priority_level': level,
+        'message': f'Priority: {level} ({score:.1f})'
+    }
+
+def score_items(items, today=None, serving=None, cache=True):
+    """/predict/all results for a list of items, one model call per model for all cache misses
+
+    Returns one {'success', 'predictions'} or {'success': False, 'error'} dict per item.
+    All items are scored by one model version (default: the active one). cache=False
+    neither reads nor fills the prediction cache (bulk scoring would only flush it).
+    """
+    serving = serving or active
+    feature_builder = serving.feature_builder
+    results = [None] * len(items)
+    positions = []
+    keys = []
+    resolved = []
+    if today is None:
+        today = date.today()
     
-    # Enhanced waste risk for post-processing
-    adjusted_waste_risk = waste_probability * 100 * (1 + urgency_factor * 0.5) * (1 + quantity_factor * 0.3)
-    adjusted_waste_risk = min(100, max(0, adjusted_waste_risk))
+    # Per-item input errors are reported in place, the rest of the batch is still scored
+    for i, item in enumerate(items):
+        try:
+            if not isinstance(item, dict):
+                raise ValueError('Item must be a JSON object')
+            key = None
+            if cache:
+                key = (serving.version, cache_key(item, today))
+                cached = prediction_cache.get(key, today)
+                if cached is not None:
+                    results[i] = {'success': True, 'predictions': cached}
+                    continue
+            fields = feature_builder.resolve(item, today)
+        except Exception as e:
+            results[i] = {'success': False, 'error': str(e)}
+            continue
+        positions.append(i)
+        keys.append(key)
+        resolved.append(fields)
+    metrics.lap('features')
     
-    # Return both features and metadata
-    metadata = {
-        'days_remaining': days_remaining,
-        'urgency_factor': urgency_factor,
-        'quantity_factor': quantity_factor,
-        'adjusted_waste_risk': adjusted_waste_risk,
+    # Only cache misses go through the feature pipeline and the models, as whole columns
+    if positions:
+        features, metadata = feature_builder.build_resolved(resolved)
+        metrics.lap('features')
+        combined = combine_predictions(score_models(features, serving), metadata)
+        for row, i in enumerate(positions):
+            predictions = prediction_row(combined, row)
+            if cache:
+                prediction_cache.put(keys[row], predictions, today)
+            results[i] = {'success': True, 'predictions': predictions}
+        metrics.lap('postprocess')
+    return results
+
+def score_ndjson(lines, today=None, serving=None):
+    """NDJSON result lines (bytes) for a chunk of NDJSON input lines, one per non-blank line"""
+    items = []
+    errors = {}
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            items.append(json.loads(line))
+        except ValueError as e:
+            # Keep the line's place so results still line up with the input
+            errors[len(items)] = f'Invalid JSON: {e}'
+            items.append(None)
+    results = score_items(items, today, serving, cache=False)
+    for i, error in errors.items():
+        results[i] = {'success': False, 'error': error}
+    return ''.join(json.dumps(result) + '\n' for result in results).encode()
+
+def stream_ndjson(stream, serving=None, chunk_size=STREAM_CHUNK_SIZE, block_size=64 * 1024):
+    """Read NDJSON lines from a file-like stream and yield the scored lines every chunk_size lines"""
+    # One date for the whole stream, even if it runs past midnight
+    today = date.today()
+    lines = []
+    partial = b''
+    while True:
+        # Blocks, not readline(): far fewer calls into the server's input stream
+        block = stream.read(block_size)
+        *complete, partial = (partial + block).split(b'\n')
+        lines.extend(complete)
+        if not block:
+            lines.append(partial)
+        while len(lines) >= chunk_size or (lines and not block):
+            chunk, lines = lines[:chunk_size], lines[chunk_size:]
+            yield score_ndjson(chunk, today, serving)
+        if not block:
+            return
+
+def match_request(data, today=None, serving=None):
+    """(status, payload) for POST /match/donations
+
+    Donations without expiration_days and priority_score are scored first from
+    their item fields, like /predict/batch; one that cannot be scored is
+    reported unmatched with its error.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get('donations'), list) or not isinstance(data.get('ngos'), list):
+        return 400, {'success': False, 'error': 'Request body must be {"donations": [...], "ngos": [...]}'}
+    donations, ngos = data['donations'], data['ngos']
+    if len(donations) > MAX_BATCH_SIZE:
+        return 400, {'success': False, 'error': f'Batch too large: {len(donations)} donations (max {MAX_BATCH_SIZE})'}
+    if not all(isinstance(d, dict) for d in donations + ngos):
+        return 400, {'success': False, 'error': 'Donations and NGOs must be JSON objects'}
+
+    unscored = [i for i, d in enumerate(donations) if d.get('expiration_days') is None or d.get('priority_score') is None]
+    failed = []
+    if unscored:
+        serving = serving or active
+        if not models_loaded(serving):
+            return 500, {'success': False, 'error': 'Models not loaded. Please restart the API server.'}
+        donations = list(donations)
+        for i, result in zip(unscored, score_items([donations[i] for i in unscored], today, serving)):
+            if result['success']:
+                p = result['predictions']
+                donations[i] = {**donations[i], 'expiration_days': p['expiration_days'], 'priority_score': p['priority_score']}
+            else:
+                failed.append({'donation_id': str(donations[i].get('id')), 'reason': 'invalid', 'error': result['error']})
+                donations[i] = None
+        donations = [d for d in donations if d is not None]
+    donations = [d if d.get('quantity') is not None else {**d, 'quantity': DEFAULT_QUANTITY} for d in donations]
+    metrics.lap('features')
+
+    try:
+        matches, unmatched, load = ngo_matching.match_donations(
+            donations, ngos, float(data.get('max_distance_km', ngo_matching.DEFAULT_MAX_DISTANCE_KM)))
+    except (KeyError, TypeError, ValueError) as e:
+        message = f'Missing field: {e}' if isinstance(e, KeyError) else str(e)
+        return 400, {'success': False, 'error': message}
+    metrics.lap('match')
+    return 200, {
+        'success': True,
+        'matched': len(matches),
+        'matches': matches,
+        'unmatched': failed + unmatched,
+        'ngo_load': load,
     }
-    
-    return features, metadata
 
-@app.route('/health', methods=['GET'])
+def inventory_unavailable():
+    """(503, payload) when this process cannot serve the inventory queue, else None"""
+    if server_workers > 1:
+        return 503, {'success': False, 'error': f'The inventory queue needs a single-process server, this one runs '
+                                                f'{server_workers} workers. Serve /inventory from an instance '
+                                                f'started with ML_WORKERS=1 or from the ASGI app.'}
+    return None
+
+def inventory_upsert_request(data, serving=None):
+    """(status, payload) for POST /inventory/items"""
+    unavailable = inventory_unavailable()
+    if unavailable:
+        return unavailable
+    serving = serving or active
+    if not models_loaded(serving):
+        return 500, {'success': False, 'error': 'Models not loaded. Please restart the API server.'}
+    items = data.get('items') if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        return 400, {'success': False, 'error': 'Request body must be a list of items or {"items": [...]}'}
+    if len(items) > MAX_BATCH_SIZE:
+        return 400, {'success': False, 'error': f'Batch too large: {len(items)} items (max {MAX_BATCH_SIZE})'}
+    results = inventory.upsert(items, serving)
+    return 200, {'success': True, 'count': len(results), 'results': results, 'items': len(inventory)}
+
+def inventory_delete_request(data):
+    """(status, payload) for DELETE /inventory/items"""
+    unavailable = inventory_unavailable()
+    if unavailable:
+        return unavailable
+    ids = data.get('ids') if isinstance(data, dict) else None
+    if not isinstance(ids, list):
+        return 400, {'success': False, 'error': 'Request body must be {"ids": [...]}'}
+    return 200, {'success': True, 'deleted': inventory.delete(ids), 'items': len(inventory)}
+
+def inventory_urgent_request(restaurant_id, k=None, serving=None):
+    """(status, payload) for GET /inventory/urgent"""
+    unavailable = inventory_unavailable()
+    if unavailable:
+        return unavailable
+    if not restaurant_id:
+        return 400, {'success': False, 'error': 'restaurant_id is required'}
+    try:
+        k = DEFAULT_TOP_K if k is None else int(k)
+    except ValueError:
+        return 400, {'success': False, 'error': 'k must be an integer'}
+    if not 0 < k <= MAX_TOP_K:
+        return 400, {'success': False, 'error': f'k must be between 1 and {MAX_TOP_K}'}
+    # Normally done by the rollover thread; if a rescore is already running, answer from the previous scores
+    inventory.refresh(serving or active, wait=False)
+    results = inventory.top(restaurant_id, k)
+    return 200, {'success': True, 'restaurant_id': restaurant_id, 'count': len(results), 'results': results}
+
+def inventory_stats_request():
+    """(status, payload) for GET /inventory/stats"""
+    return inventory_unavailable() or (200, {'success': True, 'inventory': inventory.stats()})
+
+def models_loaded(serving=None):
+    """Check that every model needed for scoring is available"""
+    serving = serving or active
+    return serving is not None and all(name in serving.models for name in MODEL_NAMES)
+
+@api.before_request
+def start_request_timer():
+    metrics.start(request.url_rule.rule if request.url_rule else request.path)
+    # Pin the request to the version being served now; a reload during the request does not affect it
+    g.serving = active
+
+@api.after_request
+def record_request_timer(response):
+    serving = g.get('serving')
+    if serving is not None:
+        response.headers['X-Model-Version'] = serving.version
+    # Time since the handler's last stage is response building
+    metrics.finish(response.status_code, 'serialize')
+    return response
+
+@api.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
-    return jsonify({'status': 'healthy', 'models_loaded': len(models) > 0})
+    serving = current_models()
+    return jsonify({
+        'status': 'healthy',
+        # Models not loaded yet under ML_LAZY_LOAD count as available: they load on first use
+        'models_loaded': models_loaded(serving),
+        'model_version': serving.version if serving is not None else None,
+    })
 
-@app.route('/predict/expiration', methods=['POST'])
+@api.route('/predict/expiration', methods=['POST'])
 def predict_expiration():
     """Predict days until expiration from TODAY"""
     try:
+        serving = current_models()
         data = request.json
-        features, metadata = prepare_features(data)
-        
-        # CRITICAL FIX: Always use actual calculation if expiry_date is provided
-        # The ML model now predicts days_remaining from today, but actual calculation is always more accurate
-        if data.get('expiry_date'):
-            try:
-                expiry = pd.to_datetime(data.get('expiry_date')).date()
-                now = datetime.now().date()
-                actual_days_remaining = (expiry - now).days
-                prediction = float(actual_days_remaining)
-            except:
-                # Fallback to ML prediction (which now also predicts days_remaining)
-                prediction = float(models['expiration_predictor'].predict(features)[0])
-        else:
-            # If no expiry date, use ML model prediction (which predicts days_remaining from today)
-            prediction = float(models['expiration_predictor'].predict(features)[0])
-        
-        return jsonify({
-            'success': True,
-            'predicted_days_until_expiry': prediction,
-            'message': f'Predicted to expire in {prediction:.1f} days'
-        })
+        metrics.lap('parse')
+        features, metadata = prepare_features(data, serving=serving)
+        
+        # Always use the actual calculation if the expiry date is known, the ML model
+        # (which predicts days_remaining from today) is only the fallback
+        actual_days_remaining = metadata['actual_days_remaining']
+        ml_expiration = np.nan
+        if np.isnan(actual_days_remaining):
+            ml_expiration = model_output('expiration', features, serving)[0]
+            metrics.lap('models')
+        prediction = float(postprocess.expiration_days(ml_expiration, actual_days_remaining))
+        metrics.lap('postprocess')
+        
+        return jsonify(expiration_response(prediction))
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 400
 
-@app.route('/predict/waste-risk', methods=['POST'])
+@api.route('/predict/waste-risk', methods=['POST'])
 def predict_waste_risk():
     """Predict waste risk (0-100)"""
     try:
+        serving = current_models()
         data = request.json
-        features, metadata = prepare_features(data)
+        metrics.lap('parse')
+        features, metadata = prepare_features(data, serving=serving)
         
-        # Get ML model prediction
-        ml_prediction = models['waste_risk_predictor'].predict(features)[0]
-        ml_prediction = max(0, min(100, ml_prediction))  # Clamp to 0-100
-        
-        # Get metadata
-        days_remaining = metadata['days_remaining']
-        adjusted_risk = metadata['adjusted_waste_risk']
+        ml_prediction = model_output('waste_risk', features, serving)
+        metrics.lap('models')
         
         # Combine ML prediction with rule-based adjustments
-        # Weight: 70% ML prediction, 30% rule-based adjustment
-        combined_risk = (ml_prediction * 0.7) + (adjusted_risk * 0.3)
-        
-        # CRITICAL FIX: Adjust based on actual days remaining (critical factor)
-        # The model should already account for this, but we add safety adjustments
-        if days_remaining < 0:
-            # Already expired - maximum risk
-            final_risk = 100
-        elif days_remaining <= 0:
-            final_risk = 100
-        elif days_remaining <= 1:
-            # Expiring today/tomorrow - very high risk
-            final_risk = min(100, max(combined_risk, 80))  # At least 80% risk
-        elif days_remaining <= 3:
-            # Expiring within 3 days - high risk
-            final_risk = min(100, max(combined_risk * 1.3, 60))  # At least 60% risk
-        elif days_remaining <= 7:
-            # Expiring within 7 days - medium-high risk
-            final_risk = min(100, max(combined_risk * 1.2, 40))  # At least 40% risk
-        else:
-            final_risk = combined_risk
-        
-        final_risk = max(0, min(100, final_risk))
+        days_remaining = metadata['days_remaining']
+        urgency = postprocess.urgency_factor(days_remaining)
+        adjusted_risk = postprocess.adjusted_waste_risk(metadata['waste_probability'], urgency, metadata['quantity'])
+        final_risk = postprocess.waste_risk(ml_prediction, adjusted_risk, days_remaining)
         
-        risk_level = 'Low' if final_risk < 30 else 'Medium' if final_risk < 70 else 'High'
+        risk_level = str(postprocess.waste_risk_level(final_risk)[0])
+        final_risk = float(final_risk[0])
+        metrics.lap('postprocess')
         
-        return jsonify({
-            'success': True,
-            'waste_risk_score': float(final_risk),
-            'risk_level': risk_level,
-            'message': f'Waste risk: {risk_level} ({final_risk:.1f}%)'
-        })
+        return jsonify(waste_risk_response(final_risk, risk_level))
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 400
 
-@app.route('/predict/donation', methods=['POST'])
+@api.route('/predict/donation', methods=['POST'])
 def predict_donation():
     """Recommend if item should be donated"""
     try:
+        serving = current_models()
         data = request.json
-        features, metadata = prepare_features(data)
-        
-        # Get ML model prediction
-        ml_prediction = models['donation_recommender'].predict(features)[0]
-        ml_probability = models['donation_recommender'].predict_proba(features)[0][1]
-        
-        # Get key factors
-        days_remaining = metadata['days_remaining']
-        quantity = float(data.get('quantity', 10))
-        category = data.get('category', 'Fruits')
-        
-        # Enhanced rule-based donation recommendation logic
-        donation_score = 0.0
+        metrics.lap('parse')
+        features, metadata = prepare_features(data, serving=serving)
         
-        # CRITICAL: Expired items should be donated if still safe (within 1-2 days of expiry)
-        if days_remaining < 0:
-            # Expired items: high donation score if recently expired (still safe)
-            if days_remaining >= -2:  # Expired within last 2 days - still potentially safe
-                donation_score = 0.90
-            else:
-                donation_score = 0.70  # Expired longer ago - still recommend but lower
-        elif days_remaining <= 0:
-            donation_score = 1.0
-        elif days_remaining <= 1:
-            donation_score = 0.95
-        elif days_remaining <= 3 and quantity >= 10:
-            donation_score = 0.85
-        elif days_remaining <= 7 and quantity >= 20:
-            donation_score = 0.75
+        ml_probability = model_output('donation_probability', features, serving)
+        metrics.lap('models')
         
-        # Enhanced: High quantity items with good shelf life can also be donated
-        # This addresses the issue where new items with many days left should still be considered
-        perishable_categories = ['Fruits', 'Vegetables', 'Dairy', 'Meat', 'Bakery', 'Prepared Foods']
-        is_perishable = category in perishable_categories
+        # Combine ML prediction with rule-based donation logic
+        combined_probability, should_donate = postprocess.donation_probability(
+            ml_probability, metadata['days_remaining'], metadata['quantity'], metadata['is_perishable']
+        )
+        should_donate = bool(should_donate[0])
+        metrics.lap('postprocess')
         
-        # High quantity perishable items are good donation candidates even with many days left
-        if quantity >= 50:  # Very high quantity
-            donation_score = max(donation_score, 0.65)
-        elif quantity >= 30 and is_perishable and days_remaining >= 5:
-            # Items with good shelf life but high quantity and perishable nature
-            donation_score = max(donation_score, 0.55)
-        elif quantity >= 20 and is_perishable and days_remaining >= 7:
-            # Moderate quantity perishable items with good shelf life
-            donation_score = max(donation_score, 0.50)
-        
-        # Category-based adjustments for perishable items
-        if is_perishable and days_remaining <= 7:
-            donation_score = max(donation_score, 0.60)
-        
-        # Combine ML prediction with rule-based logic
-        # Trust ML more (80%) since we fixed the training, but keep rules for edge cases
-        combined_probability = (ml_probability * 0.80) + (donation_score * 0.20)
-        
-        # Lower threshold for donation recommendation (0.45 instead of 0.5)
-        # This makes the system more proactive about donations
-        should_donate = combined_probability >= 0.45
-        
-        return jsonify({
-            'success': True,
-            'should_donate': bool(should_donate),
-            'donation_probability': float(combined_probability),
-            'message': 'Recommended for donation' if should_donate else 'Not recommended for donation'
-        })
+        return jsonify(donation_response(should_donate, float(combined_probability[0])))
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 400
 
-@app.route('/predict/priority', methods=['POST'])
+@api.route('/predict/priority', methods=['POST'])
 def predict_priority():
     """Predict priority score (0-100)"""
     try:
+        serving = current_models()
         data = request.json
-        features, metadata = prepare_features(data)
+        metrics.lap('parse')
+        features, metadata = prepare_features(data, serving=serving)
         
-        # Get ML model prediction
-        ml_prediction = models['priority_scorer'].predict(features)[0]
-        ml_prediction = max(0, min(100, ml_prediction))  # Clamp to 0-100
+        ml_prediction = model_output('priority', features, serving)
+        metrics.lap('models')
         
-        # Get key factors
+        # Expired items get maximum priority, the ML prediction is used when more time is available
         days_remaining = metadata['days_remaining']
-        quantity = float(data.get('quantity', 10))
-        urgency_factor = metadata['urgency_factor']
-        
-        # CRITICAL FIX: Calculate priority based on actual days remaining
-        # Expired items should have maximum priority
-        if days_remaining < 0:
-            # Already expired - maximum priority
-            priority_score = 100
-        elif days_remaining <= 0:
-            priority_score = 100
-        elif days_remaining <= 1:
-            # Expiring today/tomorrow - very high priority
-            priority_score = 90 + min(10, quantity / 10)
-        elif days_remaining <= 3:
-            # Expiring within 3 days - high priority
-            priority_score = 75 + min(15, quantity / 10)
-        elif days_remaining <= 7:
-            # Expiring within 7 days - medium-high priority
-            priority_score = 60 + min(15, quantity / 10)
-        else:
-            # More time available - use ML prediction adjusted by urgency
-            priority_score = (ml_prediction * 0.8) + (urgency_factor * 100 * 0.2)
-            priority_score += min(10, quantity / 20)
-        
-        priority_score = max(0, min(100, priority_score))
+        urgency = postprocess.urgency_factor(days_remaining)
+        priority_score = postprocess.priority_score(ml_prediction, days_remaining, metadata['quantity'], urgency)
         
-        priority_level = 'Low' if priority_score < 40 else 'Medium' if priority_score < 70 else 'High'
+        priority_level = str(postprocess.priority_level(priority_score)[0])
+        priority_score = float(priority_score[0])
+        metrics.lap('postprocess')
         
-        return jsonify({
-            'success': True,
-            'priority_score': float(priority_score),
-            'priority_level': priority_level,
-            'message': f'Priority: {priority_level} ({priority_score:.1f})'
-        })
+        return jsonify(priority_response(priority_score, priority_level))
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 400
 
-@app.route('/predict/all', methods=['POST'])
+@api.route('/predict/all', methods=['POST'])
 def predict_all():
     """Get all predictions at once"""
     try:
         # Ensure models are loaded
-        if not models or 'waste_risk_predictor' not in models:
+        serving = current_models()
+        if not models_loaded(serving):
             return jsonify({'success': False, 'error': 'Models not loaded. Please restart the API server.'}), 500
         data = request.json
-        features, metadata = prepare_features(data)
-        
-        # Get days remaining
-        days_remaining = metadata['days_remaining']
-        
-        # Calculate expiration days from TODAY
-        if data.get('expiry_date'):
-            try:
-                expiry = pd.to_datetime(data.get('expiry_date')).date()
-                now = datetime.now().date()
-                expiration_days = (expiry - now).days
-            except:
-                expiration_days = float(models['expiration_predictor'].predict(features)[0])
-        else:
-            expiration_days = float(models['expiration_predictor'].predict(features)[0])
-        
-        # Get waste risk
-        try:
-            ml_waste_risk = models['waste_risk_predictor'].predict(features)[0]
-            ml_waste_risk = max(0, min(100, ml_waste_risk))
-        except Exception as e:
-            raise Exception(f"Error predicting waste risk: {str(e)}. Features shape: {features.shape}, Columns: {list(features.columns)}")
-        adjusted_risk = metadata['adjusted_waste_risk']
-        
-        combined_risk = (ml_waste_risk * 0.7) + (adjusted_risk * 0.3)
-        if days_remaining < 0:
-            # Already expired - maximum risk
-            waste_risk = 100
-        elif days_remaining <= 0:
-            waste_risk = 100
-        elif days_remaining <= 1:
-            waste_risk = min(100, max(combined_risk * 1.3, 80))  # At least 80% risk
-        elif days_remaining <= 3:
-            waste_risk = min(100, max(combined_risk * 1.3, 60))  # At least 60% risk
-        elif days_remaining <= 7:
-            waste_risk = min(100, max(combined_risk * 1.2, 40))  # At least 40% risk
-        else:
-            waste_risk = combined_risk
-        waste_risk = max(0, min(100, waste_risk))
-        
-        # Get donation recommendation
-        ml_donate = models['donation_recommender'].predict(features)[0]
-        ml_donate_prob = models['donation_recommender'].predict_proba(features)[0][1]
-        quantity = float(data.get('quantity', 10))
-        category = data.get('category', 'Fruits')
-        
-        # Enhanced donation logic (same as in /predict/donation endpoint)
-        donation_score = 0.0
-        if days_remaining < 0:
-            # Expired items: high donation score if recently expired (still safe)
-            if days_remaining >= -2:
-                donation_score = 0.90
-            else:
-                donation_score = 0.70
-        elif days_remaining <= 0:
-            donation_score = 1.0
-        elif days_remaining <= 1:
-            donation_score = 0.95
-        elif days_remaining <= 3 and quantity >= 10:
-            donation_score = 0.85
-        elif days_remaining <= 7 and quantity >= 20:
-            donation_score = 0.75
-        
-        perishable_categories = ['Fruits', 'Vegetables', 'Dairy', 'Meat', 'Bakery', 'Prepared Foods']
-        is_perishable = category in perishable_categories
-        
-        # High quantity items with good shelf life
-        if quantity >= 50:
-            donation_score = max(donation_score, 0.65)
-        elif quantity >= 30 and is_perishable and days_remaining >= 5:
-            donation_score = max(donation_score, 0.55)
-        elif quantity >= 20 and is_perishable and days_remaining >= 7:
-            donation_score = max(donation_score, 0.50)
-        
-        if is_perishable and days_remaining <= 7:
-            donation_score = max(donation_score, 0.60)
+        metrics.lap('parse')
+        today = date.today()
+        key = (serving.version, cache_key(data, today))
+        predictions = prediction_cache.get(key, today)
+        metrics.lap('cache')
+        
+        if predictions is None:
+            features, metadata = prepare_features(data, today=today, serving=serving)
+            combined = combine_predictions(score_models(features, serving), stack_metadata([metadata]))
+            predictions = prediction_row(combined, 0)
+            prediction_cache.put(key, predictions, today)
+            metrics.lap('postprocess')
         
-        combined_donate_prob = (ml_donate_prob * 0.80) + (donation_score * 0.20)
-        should_donate = combined_donate_prob >= 0.45
-        
-        # Get priority score
-        ml_priority = models['priority_scorer'].predict(features)[0]
-        ml_priority = max(0, min(100, ml_priority))
-        urgency_factor = metadata['urgency_factor']
-        
-        if days_remaining < 0:
-            # Already expired - maximum priority
-            priority_score = 100
-        elif days_remaining <= 0:
-            priority_score = 100
-        elif days_remaining <= 1:
-            priority_score = 90 + min(10, quantity / 10)
-        elif days_remaining <= 3:
-            priority_score = 75 + min(15, quantity / 10)
-        elif days_remaining <= 7:
-            priority_score = 60 + min(15, quantity / 10)
-        else:
-            priority_score = (ml_priority * 0.8) + (urgency_factor * 100 * 0.2) + min(10, quantity / 20)
-        priority_score = max(0, min(100, priority_score))
-        
-        results = {
-            'expiration_days': float(expiration_days),
-            'waste_risk': float(waste_risk),
-            'should_donate': bool(should_donate),
-            'donation_probability': float(combined_donate_prob),
-            'priority_score': float(priority_score),
-        }
+        return jsonify({
+            'success': True,
+            'predictions': predictions
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+@api.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    """Get all predictions for a list of items with one model call per model"""
+    try:
+        serving = current_models()
+        if not models_loaded(serving):
+            return jsonify({'success': False, 'error': 'Models not loaded. Please restart the API server.'}), 500
+        data = request.json
+        metrics.lap('parse')
+        items = data.get('items') if isinstance(data, dict) else data
+        if not isinstance(items, list):
+            return jsonify({'success': False, 'error': 'Request body must be a list of items or {"items": [...]}'}), 400
+        if len(items) > MAX_BATCH_SIZE:
+            return jsonify({'success': False, 'error': f'Batch too large: {len(items)} items (max {MAX_BATCH_SIZE})'}), 400
         
-        # Add risk and priority levels
-        results['waste_risk_level'] = 'Low' if waste_risk < 30 else 'Medium' if waste_risk < 70 else 'High'
-        results['priority_level'] = 'Low' if priority_score < 40 else 'Medium' if priority_score < 70 else 'High'
+        results = score_items(items, serving=serving)
         
         return jsonify({
             'success': True,
-            'predictions': results
+            'count': len(results),
+            'results': results
         })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 400
 
+@api.route('/predict/stream', methods=['POST'])
+def predict_stream():
+    """Score newline-delimited JSON items as they arrive, streaming one JSON result line back per item"""
+    serving = current_models()
+    if not models_loaded(serving):
+        return jsonify({'success': False, 'error': 'Models not loaded. Please restart the API server.'}), 500
+    # The body is read line by line while results are sent, so neither side is held in memory
+    return Response(stream_with_context(stream_ndjson(request.stream, serving)), content_type=NDJSON_CONTENT_TYPE)
+
+@api.route('/match/donations', methods=['POST'])
+def match_donations():
+    """Assign donations to NGOs by urgency, distance, capacity and rating (see ngo_matching.py)"""
+    data = request.get_json(silent=True)
+    metrics.lap('parse')
+    status, payload = match_request(data, serving=current_models())
+    return jsonify(payload), status
+
+@api.route('/inventory/items', methods=['POST'])
+def inventory_upsert():
+    """Add or update live items (each with id and restaurant_id) in the inventory queue, scoring them once"""
+    data = request.get_json(silent=True)
+    metrics.lap('parse')
+    status, payload = inventory_upsert_request(data, current_models())
+    return jsonify(payload), status
+
+@api.route('/inventory/items', methods=['DELETE'])
+def inventory_delete():
+    """Remove items ({"ids": [...]}) from the inventory queue"""
+    status, payload = inventory_delete_request(request.get_json(silent=True))
+    return jsonify(payload), status
+
+@api.route('/inventory/urgent', methods=['GET'])
+def inventory_urgent():
+    """The k most urgent live items of a restaurant (?restaurant_id=...&k=10), without rescoring"""
+    status, payload = inventory_urgent_request(request.args.get('restaurant_id'), request.args.get('k'),
+                                               current_models())
+    return jsonify(payload), status
+
+@api.route('/inventory/stats', methods=['GET'])
+def inventory_stats():
+    """Inventory queue size and the date and model version of its scores"""
+    status, payload = inventory_stats_request()
+    return jsonify(payload), status
+
+@api.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """Prediction cache counters"""
+    return jsonify({'success': True, 'cache': prediction_cache.stats()})
+
+@api.route('/cache/flush', methods=['POST'])
+def cache_flush():
+    """Drop all cached predictions"""
+    prediction_cache.flush()
+    return jsonify({'success': True, 'cache': prediction_cache.stats()})
+
+@api.route('/models', methods=['GET'])
+def models_status():
+    """Version being served, published versions and the outcome of the last reload"""
+    serving = current_models()
+    return jsonify({
+        'success': True,
+        'active': serving.describe() if serving is not None else None,
+        'versions': model_registry.list_versions(MODELS_DIR),
+        'last_reload': last_reload,
+        'reloading': reload_lock.locked(),
+    })
+
+@api.route('/models/reload', methods=['POST'])
+def models_reload():
+    """Load a model version ({"version": ...}, default: the one in models/CURRENT), warm it up and swap it in"""
+    data = request.get_json(silent=True) or {}
+    result = reload_models(data.get('version'))
+    if result is None:
+        return jsonify({'success': False, 'error': 'A reload is already in progress'}), 409
+    if not result['success']:
+        # The previous version is still being served
+        return jsonify({'success': False, 'error': 'Failed to load models', 'reload': result}), 500
+    return jsonify({'success': True, 'reload': result})
+
+@api.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Stage timings, request, error and model-call counters in the Prometheus text format"""
+    return Response(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
+def create_app(load=True):
+    """Application factory: builds the Flask app and loads models unless they are already loaded"""
+    app = Flask(__name__)
+    CORS(app, expose_headers=['X-Model-Version'])  # Enable CORS for React frontend
+    app.register_blueprint(api)
+    
+    # Under gunicorn with preload_app this runs once in the master, before workers fork
+    if load and not models_loaded():
+        print("Loading ML models...")
+        if not load_models():
+            raise RuntimeError("Failed to load models. Please train models first.")
+    # Under gunicorn the threads are started again in each worker (gunicorn.conf.py post_fork)
+    start_model_watcher()
+    start_inventory_rollover()
+    return app
+
 if __name__ == '__main__':
-    print("Loading ML models...")
-    if load_models():
+    try:
+        app = create_app()
+    except RuntimeError as e:
+        print(e)
+    else:
         print("Starting Flask API server...")
         app.run(host='0.0.0.0', port=5000, debug=True)
-    else:
-        print("Failed to load models. Please train models first.")
-
-
@@ -0,0 +1,148 @@
+"""
+Versioned model artifact directories
+
+Training writes its artifacts to models/ as before. `publish` snapshots the
+complete set (pickles, compiled and compact forests, lookup table,
+feature_info) into models/versions/<version>/ and points models/CURRENT at
+it. ml_api.py serves the version named in CURRENT, or models/ itself when
+nothing has been published yet. Both steps are atomic (the snapshot is
+renamed into place and CURRENT is replaced, never rewritten), so a server
+reloading at any moment sees either the old version or the complete new one.
+
+Usage (from ml/, after training):
+    python model_registry.py publish [--version 2024-06-01] [--no-activate]
+    python model_registry.py activate <version>
+    python model_registry.py list
+"""
+import argparse
+import os
+import shutil
+import threading
+import time
+
+VERSIONS_DIR = 'versions'
+CURRENT_FILE = 'CURRENT'
+
+# Version reported when models/ is served directly
+UNVERSIONED = 'unversioned'
+
+def versions_path(models_dir):
+    return os.path.join(models_dir, VERSIONS_DIR)
+
+def version_path(models_dir, version):
+    """Artifact directory of a published version"""
+    if not version or version.startswith('.') or os.sep in version or (os.altsep and os.altsep in version):
+        raise ValueError(f'Invalid model version: {version!r}')
+    return os.path.join(versions_path(models_dir), version)
+
+def list_versions(models_dir):
+    """Published versions, oldest first"""
+    root = versions_path(models_dir)
+    if not os.path.isdir(root):
+        return []
+    return sorted(name for name in os.listdir(root)
+                  if not name.startswith('.') and os.path.isdir(os.path.join(root, name)))
+
+def current_version(models_dir):
+    """(version, artifact directory) to serve: the version in CURRENT, else models_dir itself"""
+    try:
+        with open(os.path.join(models_dir, CURRENT_FILE)) as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return UNVERSIONED, models_dir
+    return version, version_path(models_dir, version)
+
+def activate(models_dir, version):
+    """Point CURRENT at a published version"""
+    if not os.path.isdir(version_path(models_dir, version)):
+        raise FileNotFoundError(f'Model version {version!r} is not published in {models_dir}')
+    current = os.path.join(models_dir, CURRENT_FILE)
+    tmp = f'{current}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        f.write(version + '\n')
+    os.replace(tmp, current)
+
+def publish(models_dir, version=None, activate_version=True):
+    """Copy the artifacts in models_dir into a new version directory; returns the version"""
+    version = version or time.strftime('%Y%m%d-%H%M%S')
+    target = version_path(models_dir, version)
+    if os.path.exists(target):
+        raise FileExistsError(f'Model version {version!r} already exists')
+    if not os.path.exists(os.path.join(models_dir, 'feature_info.joblib')):
+        raise FileNotFoundError(f'No trained models in {models_dir}')
+
+    # Copy into a hidden directory and rename it into place once complete. Copies, not hard links:
+    # training overwrites the files in models_dir in place. copy2 keeps the mtimes the lookup
+    # table's signature was computed from.
+    staging = os.path.join(versions_path(models_dir), f'.{version}.tmp')
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    for name in sorted(os.listdir(models_dir)):
+        if name in (VERSIONS_DIR, CURRENT_FILE) or name.endswith('.tmp'):
+            continue
+        source = os.path.join(models_dir, name)
+        if os.path.isdir(source):
+            shutil.copytree(source, os.path.join(staging, name))
+        else:
+            shutil.copy2(source, staging)
+    os.rename(staging, target)
+
+    if activate_version:
+        activate(models_dir, version)
+    return version
+
+class VersionWatcher(threading.Thread):
+    """Daemon thread calling on_change(version) when CURRENT names a different version"""
+
+    def __init__(self, models_dir, on_change, interval=5.0, version=None):
+        super().__init__(name='model-version-watcher', daemon=True)
+        self.models_dir = models_dir
+        self.on_change = on_change
+        self.interval = interval
+        self.version = version
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                version, _ = current_version(self.models_dir)
+            except (OSError, ValueError) as e:
+                print(f"Model watcher: {e}")
+                continue
+            if version != self.version:
+                # Remember the version even if loading it fails, so a broken one is tried once
+                self.version = version
+                self.on_change(version)
+
+    def stop(self):
+        self._stop_event.set()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Publish and activate versions of the trained models')
+    parser.add_argument('--models-dir', default='models')
+    commands = parser.add_subparsers(dest='command', required=True)
+    publish_parser = commands.add_parser('publish', help='snapshot the trained models as a new version')
+    publish_parser.add_argument('--version', help='version name (default: a timestamp)')
+    publish_parser.add_argument('--no-activate', action='store_true', help='publish without serving it')
+    activate_parser = commands.add_parser('activate', help='serve a published version')
+    activate_parser.add_argument('version')
+    commands.add_parser('list', help='list published versions')
+    args = parser.parse_args(argv)
+
+    if args.command == 'publish':
+        version = publish(args.models_dir, args.version, not args.no_activate)
+        print(f"Published: {version_path(args.models_dir, version)}")
+        if not args.no_activate:
+            print(f"Active version: {version}")
+    elif args.command == 'activate':
+        activate(args.models_dir, args.version)
+        print(f"Active version: {args.version}")
+    else:
+        active, _ = current_version(args.models_dir)
+        for version in list_versions(args.models_dir):
+            print(f"{'*' if version == active else ' '} {version}")
+        if active == UNVERSIONED:
+            print(f"Serving {args.models_dir}/ directly (nothing published)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Model artifact loading: compiled forests are memory-mapped, pickles are the fallback
+
+With mmap the forest arrays live in the OS page cache, so every worker process
+serving the same files shares one copy. LazyModels defers each load until the
+model is first used. With compact=True the compacted forests written by
+compact_models.py are preferred where they exist.
+"""
+import os
+from threading import Lock
+
+import joblib
+
+from forest_engine import CompiledForest, compact_path, compiled_path
+
+def artifact_path(models_dir, name, backend='compiled', compact=False):
+    """The artifact model_loader serves for one model, or None if there is none"""
+    candidates = []
+    if backend == 'compiled':
+        path = compiled_path(models_dir, name)
+        candidates = ([compact_path(models_dir, name)] if compact else []) + [path, f'{path}.npz']
+    candidates.append(os.path.join(models_dir, f'{name}.joblib'))
+    return next((c for c in candidates if os.path.exists(c)), None)
+
+def model_loader(models_dir, name, backend='compiled', mmap=True, compact=False):
+    """Return a zero-argument function that loads one model, or None if no artifact exists"""
+    mmap_mode = 'r' if mmap else None
+    path = artifact_path(models_dir, name, backend, compact)
+    if path is None:
+        return None
+    if path.endswith('.joblib'):
+        # Uncompressed joblib pickles can map their numpy buffers too
+        return lambda: joblib.load(path, mmap_mode=mmap_mode)
+    if path.endswith('.npz'):
+        return lambda: CompiledForest.load(path)
+    return lambda: CompiledForest.load(path, mmap_mode=mmap_mode)
+
+class LazyModels(dict):
+    """Dict of models that loads each entry on first access"""
+
+    def __init__(self, loaders):
+        super().__init__()
+        self._loaders = dict(loaders)
+        self._lock = Lock()
+
+    def __contains__(self, name):
+        return name in self._loaders or super().__contains__(name)
+
+    def __missing__(self, name):
+        if name not in self._loaders:
+            raise KeyError(name)
+        with self._lock:
+            if not super().__contains__(name):
+                self[name] = self._loaders[name]()
+        return super().__getitem__(name)
+
+    def load_all(self):
+        """Load every model now (e.g. before forking workers)"""
+        for name in self._loaders:
+            self[name]
+        return self
+
+def load_model_set(models_dir, names, backend='compiled', mmap=True, lazy=False, optional=(), compact=False):
+    """Load the named models (optional ones only if present); lazily if requested"""
+    loaders = {}
+    for name in list(names) + list(optional):
+        loader = model_loader(models_dir, name, backend, mmap, compact)
+        if loader is None:
+            if name in optional:
+                continue
+            raise FileNotFoundError(f'No artifact for model {name!r} in {models_dir}')
+        loaders[name] = loader
+    models = LazyModels(loaders)
+    return models if lazy else models.load_all()
@@ -0,0 +1,160 @@
+"""
+Matching of donations to NGOs by urgency, distance, capacity and rating
+
+Donations are taken in expiry order from a heap (fewest expiration_days
+first, then highest priority_score, then largest quantity), so the most
+urgent food gets the first pick of NGOs. Each donation goes to the NGO with
+the lowest cost that is within reach and still has capacity for its quantity:
+
+    cost = distance_km * (1 + RATING_WEIGHT * (5 - rating) / 4)
+
+so a 5-star NGO is preferred over a 1-star one up to RATING_WEIGHT times the
+distance. NGO locations are held in a haversine ball tree. The nearest
+CANDIDATES NGOs of every donation are found in one batched query. Only when
+none of them can take a donation, or a farther NGO could still cost less, is
+the donation compared with every NGO that still has room for it. The result
+is the same as comparing every donation with every NGO, without the items x
+NGOs distance matrix and with most donations settled by their candidates.
+
+Inputs are plain dicts. NGOs need id, latitude and longitude; capacity (in
+quantity units, default unlimited), rating (1-5, default 3) and
+max_distance_km are optional. The app stores an NGO's location as free text,
+so callers must geocode it first. Donations need id, latitude, longitude,
+quantity, priority_score and expiration_days, the values /predict/all
+returns. ml_api.py serves this as POST /match/donations.
+"""
+import heapq
+
+import numpy as np
+from sklearn.neighbors import BallTree
+
+from postprocess import SAFE_DAYS_PAST_EXPIRY
+
+EARTH_RADIUS_KM = 6371.0
+
+# Reach of an NGO without its own max_distance_km
+DEFAULT_MAX_DISTANCE_KM = 25.0
+
+# Rating used when an NGO has none yet
+DEFAULT_RATING = 3.0
+
+# Extra cost factor of a 1-star NGO over a 5-star one
+RATING_WEIGHT = 0.5
+
+# Nearest NGOs fetched per donation in the batched query
+CANDIDATES = 16
+
+# Other feasible NGOs reported with each match
+ALTERNATIVES = 3
+
+def _coordinates(records):
+    """(n, 2) array of [latitude, longitude] in radians"""
+    coords = np.array([[float(r['latitude']), float(r['longitude'])] for r in records], dtype=np.float64)
+    if coords.size and (np.abs(coords[:, 0]).max() > 90 or np.abs(coords[:, 1]).max() > 180):
+        raise ValueError('latitude must be within [-90, 90] and longitude within [-180, 180]')
+    return np.radians(coords.reshape(-1, 2))
+
+def _haversine_km(point, coords):
+    """Distances in km from one [latitude, longitude] point to each row of coords, all in radians"""
+    dlat = coords[:, 0] - point[0]
+    dlon = coords[:, 1] - point[1]
+    a = np.sin(dlat / 2) ** 2 + np.cos(point[0]) * np.cos(coords[:, 0]) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def _optional(records, key, default):
+    return np.array([default if r.get(key) is None else float(r[key]) for r in records], dtype=np.float64)
+
+class NGOIndex:
+    """Ball tree over NGO locations with the capacity each NGO has left"""
+
+    def __init__(self, ngos, max_distance_km=DEFAULT_MAX_DISTANCE_KM):
+        self.ids = [str(ngo['id']) for ngo in ngos]
+        self.coords = _coordinates(ngos)
+        self.tree = BallTree(self.coords, metric='haversine') if ngos else None
+        self.remaining = _optional(ngos, 'capacity', np.inf)
+        self.reach_km = _optional(ngos, 'max_distance_km', max_distance_km)
+        ratings = np.clip(_optional(ngos, 'rating', DEFAULT_RATING), 1, 5)
+        self.cost_factor = 1 + RATING_WEIGHT * (5 - ratings) / 4
+
+    def __len__(self):
+        return len(self.ids)
+
+    def nearest(self, points, k):
+        """(distances in km, NGO indexes) of the k nearest NGOs of each point, nearest first"""
+        distances, indexes = self.tree.query(points, k=min(k, len(self)))
+        return distances * EARTH_RADIUS_KM, indexes
+
+    def with_room(self, point, quantity):
+        """(distances in km, NGO indexes) of every NGO with capacity left for quantity"""
+        ngo = np.flatnonzero(self.remaining >= quantity)
+        return _haversine_km(point, self.coords[ngo]), ngo
+
+def _pick(index, distance_km, ngo, quantity):
+    """Candidates able to take quantity, cheapest first, as (cost, distance, NGO index) arrays"""
+    feasible = (distance_km <= index.reach_km[ngo]) & (index.remaining[ngo] >= quantity)
+    cost = distance_km[feasible] * index.cost_factor[ngo[feasible]]
+    order = np.argsort(cost, kind='stable')
+    return cost[order], distance_km[feasible][order], ngo[feasible][order]
+
+def match_donations(donations, ngos, max_distance_km=DEFAULT_MAX_DISTANCE_KM, candidates=CANDIDATES,
+                    alternatives=ALTERNATIVES, safe_days_past_expiry=SAFE_DAYS_PAST_EXPIRY):
+    """Assign each donation to one NGO; returns (matches, unmatched, quantity assigned per NGO)
+
+    Donations more than safe_days_past_expiry days past expiry are left
+    unmatched as expired (by default the cutoff postprocess.donation_score uses).
+    """
+    index = NGOIndex(ngos, max_distance_km)
+    matches = []
+    unmatched = []
+    if not donations:
+        return matches, unmatched, {}
+    if not len(index):
+        return matches, [{'donation_id': str(d['id']), 'reason': 'no_ngos'} for d in donations], {}
+
+    points = _coordinates(donations)
+    quantity = np.array([float(d['quantity']) for d in donations], dtype=np.float64)
+    expiration_days = np.array([float(d['expiration_days']) for d in donations], dtype=np.float64)
+    priority_score = np.array([float(d['priority_score']) for d in donations], dtype=np.float64)
+    first_distances, first_ngos = index.nearest(points, candidates)
+    all_candidates = candidates >= len(index)
+
+    heap = [(expiration_days[i], -priority_score[i], -quantity[i], i) for i in range(len(donations))]
+    heapq.heapify(heap)
+    assigned = np.zeros(len(index), dtype=np.float64)
+    while heap:
+        days, _, _, i = heapq.heappop(heap)
+        donation_id = str(donations[i]['id'])
+        if days < -safe_days_past_expiry:
+            unmatched.append({'donation_id': donation_id, 'reason': 'expired'})
+            continue
+
+        distance_km, ngo = first_distances[i], first_ngos[i]
+        cost, cand_distance, cand_ngo = _pick(index, distance_km, ngo, quantity[i])
+        # Every other NGO is at least distance_km[-1] away, so costs at least that much
+        if not all_candidates and not (len(cost) and cost[0] <= distance_km[-1]):
+            distance_km, ngo = index.with_room(points[i], quantity[i])
+            cost, cand_distance, cand_ngo = _pick(index, distance_km, ngo, quantity[i])
+            if not len(cost):
+                # Full NGOs were left out; report whether any NGO at all was in reach
+                distance_km = _haversine_km(points[i], index.coords)
+                ngo = np.arange(len(index))
+
+        if not len(cost):
+            in_reach = (distance_km <= index.reach_km[ngo]).any()
+            unmatched.append({'donation_id': donation_id, 'reason': 'no_capacity' if in_reach else 'no_ngo_in_range'})
+            continue
+        best = cand_ngo[0]
+        index.remaining[best] -= quantity[i]
+        assigned[best] += quantity[i]
+        matches.append({
+            'donation_id': donation_id,
+            'ngo_id': index.ids[best],
+            'distance_km': float(cand_distance[0]),
+            'expiration_days': float(days),
+            'priority_score': float(priority_score[i]),
+            'quantity': float(quantity[i]),
+            'alternatives': [{'ngo_id': index.ids[n], 'distance_km': float(d)}
+                             for n, d in zip(cand_ngo[1:alternatives + 1], cand_distance[1:alternatives + 1])],
+        })
+    load = {index.ids[n]: float(assigned[n]) for n in np.flatnonzero(assigned)}
+    return matches, unmatched, load
@@ -0,0 +1,144 @@
+"""
+Vectorized rule-based post-processing shared by all prediction endpoints
+
+Every function works on NumPy arrays (one element per item), so a single item
+and a whole batch go through exactly the same code path.
+"""
+import numpy as np
+
+PERISHABLE_CATEGORIES = ['Fruits', 'Vegetables', 'Dairy', 'Meat', 'Bakery', 'Prepared Foods']
+
+# Days past expiry an item is still considered safe to donate
+SAFE_DAYS_PAST_EXPIRY = 2
+
+def _as_float(values):
+    return np.asarray(values, dtype=np.float64)
+
+def urgency_factor(days_remaining):
+    """Urgency factor (0.1-1.0) from days remaining"""
+    days = _as_float(days_remaining)
+    return np.select(
+        [days <= 0, days <= 1, days <= 3, days <= 7],
+        [1.0, 0.95, 0.85, 0.70],
+        default=np.maximum(0.1, 1.0 - (days / 30)),
+    )
+
+def adjusted_waste_risk(waste_probability, urgency, quantity):
+    """Rule-based waste risk (0-100) from category waste probability, urgency and quantity"""
+    quantity_factor = np.minimum(1.0, _as_float(quantity) / 100)
+    risk = _as_float(waste_probability) * 100 * (1 + _as_float(urgency) * 0.5) * (1 + quantity_factor * 0.3)
+    return np.clip(risk, 0, 100)
+
+def waste_risk(ml_waste_risk, adjusted_risk, days_remaining):
+    """Final waste risk (0-100): 70% ML prediction, 30% rules, with floors by days remaining"""
+    days = _as_float(days_remaining)
+    ml_risk = np.clip(_as_float(ml_waste_risk), 0, 100)
+    combined = (ml_risk * 0.7) + (_as_float(adjusted_risk) * 0.3)
+
+    # Expired items get maximum risk, items close to expiry get a minimum risk
+    risk = np.select(
+        [days <= 0, days <= 1, days <= 3, days <= 7],
+        [
+            100.0,
+            np.minimum(100, np.maximum(combined * 1.3, 80)),  # At least 80% risk
+            np.minimum(100, np.maximum(combined * 1.3, 60)),  # At least 60% risk
+            np.minimum(100, np.maximum(combined * 1.2, 40)),  # At least 40% risk
+        ],
+        default=combined,
+    )
+    return np.clip(risk, 0, 100)
+
+def donation_score(days_remaining, quantity, is_perishable):
+    """Rule-based donation score (0-1)"""
+    days = _as_float(days_remaining)
+    quantity = _as_float(quantity)
+    is_perishable = np.asarray(is_perishable, dtype=bool)
+
+    # Expired items are still worth donating if recently expired (still safe)
+    score = np.select(
+        [
+            days < 0,
+            days <= 0,
+            days <= 1,
+            (days <= 3) & (quantity >= 10),
+            (days <= 7) & (quantity >= 20),
+        ],
+        [np.where(days >= -SAFE_DAYS_PAST_EXPIRY, 0.90, 0.70), 1.0, 0.95, 0.85, 0.75],
+        default=0.0,
+    )
+
+    # High quantity items are good donation candidates even with many days left
+    quantity_floor = np.select(
+        [
+            quantity >= 50,
+            (quantity >= 30) & is_perishable & (days >= 5),
+            (quantity >= 20) & is_perishable & (days >= 7),
+        ],
+        [0.65, 0.55, 0.50],
+        default=0.0,
+    )
+    score = np.maximum(score, quantity_floor)
+
+    # Perishable items close to expiry
+    return np.where(is_perishable & (days <= 7), np.maximum(score, 0.60), score)
+
+def donation_probability(ml_probability, days_remaining, quantity, is_perishable):
+    """Combined donation probability (80% ML, 20% rules) and the should-donate decision"""
+    probability = (_as_float(ml_probability) * 0.80) + (donation_score(days_remaining, quantity, is_perishable) * 0.20)
+    # Threshold is 0.45 rather than 0.5 to be proactive about donations
+    return probability, probability >= 0.45
+
+def priority_score(ml_priority, days_remaining, quantity, urgency):
+    """Final priority score (0-100) from days remaining, quantity and the ML prediction"""
+    days = _as_float(days_remaining)
+    quantity = _as_float(quantity)
+    ml_priority = np.clip(_as_float(ml_priority), 0, 100)
+
+    # Items with more time available use the ML prediction adjusted by urgency
+    score = np.select(
+        [days <= 0, days <= 1, days <= 3, days <= 7],
+        [
+            100.0,
+            90 + np.minimum(10, quantity / 10),
+            75 + np.minimum(15, quantity / 10),
+            60 + np.minimum(15, quantity / 10),
+        ],
+        default=(ml_priority * 0.8) + (_as_float(urgency) * 100 * 0.2) + np.minimum(10, quantity / 20),
+    )
+    return np.clip(score, 0, 100)
+
+def expiration_days(ml_expiration, actual_days_remaining):
+    """Days until expiry: the actual value where the expiry date is known, otherwise the ML prediction"""
+    actual = _as_float(actual_days_remaining)
+    return np.where(np.isnan(actual), _as_float(ml_expiration), actual)
+
+def waste_risk_level(risk):
+    """Low / Medium / High label for waste risk scores"""
+    risk = _as_float(risk)
+    return np.select([risk < 30, risk < 70], ['Low', 'Medium'], default='High')
+
+def priority_level(score):
+    """Low / Medium / High label for priority scores"""
+    score = _as_float(score)
+    return np.select([score < 40, score < 70], ['Low', 'Medium'], default='High')
+
+def combine_all(ml_outputs, days_remaining, quantity, waste_probability, is_perishable, actual_days_remaining):
+    """Apply every post-processing rule to raw model outputs; returns a dict of arrays"""
+    urgency = urgency_factor(days_remaining)
+    adjusted_risk = adjusted_waste_risk(waste_probability, urgency, quantity)
+
+    risk = waste_risk(ml_outputs['waste_risk'], adjusted_risk, days_remaining)
+    probability, should_donate = donation_probability(
+        ml_outputs['donation_probability'], days_remaining, quantity, is_perishable
+    )
+    priority = priority_score(ml_outputs['priority'], days_remaining, quantity, urgency)
+
+    return {
+        'expiration_days': expiration_days(ml_outputs['expiration'], actual_days_remaining),
+        'waste_risk': risk,
+        'should_donate': should_donate,
+        'donation_probability': probability,
+        'priority_score': priority,
+        'waste_risk_level': waste_risk_level(risk),
+        'priority_level': priority_level(priority),
+    }
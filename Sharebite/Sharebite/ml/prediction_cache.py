@@ -0,0 +1,104 @@
+"""
+In-process LRU cache for prediction results
+
+Every prediction depends only on the item's category, restaurant type,
+quantity and dates plus today's date, so results are keyed on those values.
+Entries from a previous day can never be returned and are dropped at the
+first lookup after midnight.
+"""
+from collections import OrderedDict
+from threading import Lock
+
+from features import parse_date
+
+def _normalize_date(value):
+    if not value:
+        return None
+    try:
+        return parse_date(value).isoformat()
+    except (TypeError, ValueError):
+        # Unparseable dates fall back to defaults in the feature builder; keep them distinct
+        return ('invalid', str(value))
+
+def cache_key(data, today):
+    """Normalized cache key for one prediction request; raises if the item is not valid"""
+    return (
+        data.get('category', 'Fruits'),
+        data.get('restaurant_type', 'Fast Food'),
+        float(data.get('quantity', 10)),
+        _normalize_date(data.get('purchase_date')),
+        _normalize_date(data.get('expiry_date')),
+        today.isoformat(),
+    )
+
+class PredictionCache:
+    """Thread-safe LRU cache with hit/miss/eviction counters"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self._day = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.flushes = 0
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def _roll_day(self, today):
+        # Called with the lock held: a new day makes every entry stale
+        if today != self._day:
+            self.expirations += len(self._entries)
+            self._entries.clear()
+            self._day = today
+
+    def get(self, key, today):
+        """Cached value for key, or None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._roll_day(today)
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, today):
+        """Store value, evicting the least recently used entries beyond max_size"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._roll_day(today)
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def flush(self):
+        """Drop every entry (e.g. after models are reloaded)"""
+        with self._lock:
+            self._entries.clear()
+            self.flushes += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'flushes': self.flushes,
+            }
@@ -15,6 +15,8 @@ echo.
 echo === Training Complete ===
 echo Models are ready in the 'models/' directory
 echo Start the API server with: python ml_api.py
+echo Production: gunicorn -c gunicorn.conf.py wsgi:app
+echo Micro-batching ASGI server: uvicorn asgi_app:app --port 5000
 
 pause
 
@@ -0,0 +1,201 @@
+"""
+Offline batch scoring of inventory files
+
+Scores a CSV or Parquet export (or a generate_dataset.py shard directory)
+with the columns generate_dataset.py writes: category, restaurant_type,
+quantity, purchase_date and expiry_date. Other columns are copied to the
+output. No HTTP server is involved: the file is read in chunks that a pool of
+worker processes scores in parallel. Each worker loads the served models once
+(ml_api.load_models, with the same ML_* settings and model version as the
+API) and runs the /predict/all pipeline on whole columns: the shared
+features, lookup table, models and post-processing rules. Results are written
+in input order as predicted_* columns, in the output format given by its
+extension, followed by a throughput summary.
+
+Usage (from ml/, after training):
+    python score.py inventory.parquet [-o inventory_scored.parquet] [--workers 4] [--chunk-rows 50000]
+    python score.py inventory.csv --today 2024-06-01 --report score_report.json
+"""
+import argparse
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from dataset_io import dataset_files
+from features import DEFAULT_CATEGORY, DEFAULT_RESTAURANT_TYPE
+
+# /predict/all result fields, written as predicted_<field>
+PREDICTION_FIELDS = ['expiration_days', 'waste_risk', 'waste_risk_level', 'should_donate',
+                     'donation_probability', 'priority_score', 'priority_level']
+
+def read_chunks(path, chunk_rows, columns=None):
+    """DataFrames of up to chunk_rows rows from a CSV file, Parquet file or shard directory"""
+    if path.endswith('.csv'):
+        yield from pd.read_csv(path, chunksize=chunk_rows, usecols=columns)
+        return
+    import pyarrow.parquet as pq
+    for f in dataset_files(path):
+        for batch in pq.ParquetFile(f, memory_map=True).iter_batches(batch_size=chunk_rows, columns=columns):
+            yield batch.to_pandas()
+
+def date_column(values):
+    """datetime64[D] array with NaT for missing or unparseable dates (time of day and offsets are dropped)"""
+    dates = pd.to_datetime(values, errors='coerce', format='ISO8601')
+    if getattr(dates.dt, 'tz', None) is not None:
+        # Keep the local calendar date, as the API does for timestamps with an offset
+        dates = dates.dt.tz_localize(None)
+    return dates.to_numpy(dtype='datetime64[D]')
+
+def name_column(values, default):
+    """Names with missing values replaced by default; categoricals stay categorical"""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        if not values.isna().any():
+            return values
+        if default not in values.cat.categories:
+            values = values.cat.add_categories([default])
+    return values.fillna(default)
+
+def score_frame(df, today, serving=None):
+    """/predict/all results for every row of df, as a DataFrame of PREDICTION_FIELDS columns"""
+    import ml_api
+    serving = serving or ml_api.active
+    builder = serving.feature_builder
+
+    def column(name):
+        # A missing column is treated like items without that field: the API's defaults apply
+        return df[name] if name in df else pd.Series(None, index=df.index, dtype=object)
+
+    resolved = builder.resolve_columns(
+        name_column(column('category'), DEFAULT_CATEGORY),
+        name_column(column('restaurant_type'), DEFAULT_RESTAURANT_TYPE),
+        pd.to_numeric(column('quantity'), errors='coerce'),
+        date_column(column('purchase_date')),
+        date_column(column('expiry_date')),
+        today,
+    )
+    features, metadata = builder.build_columns(*resolved)
+    combined = ml_api.combine_predictions(ml_api.score_models(features, serving), metadata)
+    return pd.DataFrame({field: np.asarray(combined[field]) for field in PREDICTION_FIELDS}, index=df.index)
+
+def init_worker():
+    """Pool initializer: load the models once per worker process"""
+    import ml_api
+    if not ml_api.load_models():
+        raise RuntimeError('Failed to load models')
+
+def score_chunk(df, today, keep=None):
+    """(scored chunk, model version, seconds) for one input chunk"""
+    import ml_api
+    start = time.perf_counter()
+    predictions = score_frame(df, today).add_prefix('predicted_')
+    kept = df if keep is None else df[[column for column in keep if column in df]]
+    return pd.concat([kept, predictions], axis=1), ml_api.active.version, time.perf_counter() - start
+
+class ChunkWriter:
+    """Appends scored chunks to one CSV or Parquet file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        self._parquet = None
+        self._schema = None
+
+    def write(self, df):
+        if self.path.endswith('.csv'):
+            df.to_csv(self.path, mode='w' if self.rows == 0 else 'a', header=self.rows == 0, index=False)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._parquet is None:
+                self._schema = table.schema
+                self._parquet = pq.ParquetWriter(self.path, self._schema)
+            # Later chunks can infer narrower types (e.g. dictionary indices); store them as the first one
+            self._parquet.write_table(table.cast(self._schema))
+        self.rows += len(df)
+
+    def close(self):
+        if self._parquet is not None:
+            self._parquet.close()
+
+def default_output(path):
+    base, ext = os.path.splitext(os.path.normpath(path))
+    return f'{base}_scored{ext or ".parquet"}'
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Score an inventory file offline with the served models')
+    parser.add_argument('input', help='CSV file, Parquet file or Parquet shard directory')
+    parser.add_argument('-o', '--output', help='.csv or .parquet (default: <input>_scored with the same format)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='scoring processes (1: score in this process)')
+    parser.add_argument('--chunk-rows', type=int, default=50_000, help='rows per chunk handed to a worker')
+    parser.add_argument('--today', type=date.fromisoformat, default=date.today(),
+                        help='date to score as of (default: today)')
+    parser.add_argument('--keep', type=lambda s: [c for c in s.split(',') if c],
+                        help='input columns to copy to the output (default: all)')
+    parser.add_argument('--report', help='write the throughput summary to this JSON file')
+    args = parser.parse_args(argv)
+
+    output = args.output or default_output(args.input)
+    writer = ChunkWriter(output)
+    chunks = read_chunks(args.input, args.chunk_rows)
+    versions = set()
+    worker_seconds = 0.0
+    start = time.perf_counter()
+
+    def collect(result):
+        nonlocal worker_seconds
+        scored, version, seconds = result
+        writer.write(scored)
+        versions.add(version)
+        worker_seconds += seconds
+        elapsed = time.perf_counter() - start
+        print(f"{writer.rows:12,d} rows  {writer.rows / elapsed:10,.0f} rows/s")
+
+    try:
+        if args.workers <= 1:
+            init_worker()
+            for df in chunks:
+                collect(score_chunk(df, args.today, args.keep))
+        else:
+            with ProcessPoolExecutor(args.workers, initializer=init_worker) as pool:
+                # A bounded window of chunks in flight keeps memory flat and the output in input order
+                pending = deque()
+                for df in chunks:
+                    pending.append(pool.submit(score_chunk, df, args.today, args.keep))
+                    if len(pending) >= 2 * args.workers:
+                        collect(pending.popleft().result())
+                while pending:
+                    collect(pending.popleft().result())
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    summary = {
+        'input': args.input,
+        'output': output,
+        'rows': writer.rows,
+        'seconds': elapsed,
+        'rows_per_s': writer.rows / elapsed if elapsed else None,
+        'worker_seconds': worker_seconds,
+        'workers': args.workers,
+        'chunk_rows': args.chunk_rows,
+        'today': args.today.isoformat(),
+        'model_versions': sorted(versions),
+    }
+    print(f"Scored {writer.rows:,d} rows in {elapsed:.1f} s ({summary['rows_per_s'] or 0:,.0f} rows/s, "
+          f"{args.workers} workers, model version {', '.join(sorted(versions)) or '-'})")
+    print(f"Saved: {output}")
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(summary, f, indent=2)
+        print(f"Saved: {args.report}")
+
+if __name__ == '__main__':
+    main()
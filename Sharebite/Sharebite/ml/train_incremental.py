@@ -0,0 +1,131 @@
+"""
+Out-of-core training for datasets larger than memory
+
+Streams a Parquet dataset (generate_dataset.py --shards N) one chunk (row
+group) at a time. Each chunk grows every forest by a few trees with
+warm_start, so a tree only ever sees the chunk in memory and the finished
+forest is an ensemble over the whole dataset. The last shard (or the last
+chunk of a single file) is held out and streamed again for evaluation.
+The saved artifacts are the same as train_models.py writes, so ml_api serves
+them unchanged.
+
+Usage (from ml/):
+    python generate_dataset.py --rows 50000000 --shards 16
+    python train_incremental.py --data food_waste_dataset [--trees 100]
+"""
+import argparse
+import math
+import time
+
+import joblib
+import numpy as np
+
+from dataset_io import dataset_chunks, find_dataset, read_chunk
+from train_models import (CLASSIFIERS, DATASET_COLUMNS, TARGET_COLUMNS, build_model, dataset_encodings,
+                          prepare_features, save_models)
+
+def split_chunks(chunks):
+    """(training chunks, held-out chunks): the last shard is held out, or the last chunk of a single file"""
+    files = list(dict.fromkeys(f for f, _ in chunks))
+    held_out_file = files[-1] if len(files) > 1 else None
+    if held_out_file is None:
+        return chunks[:-1], chunks[-1:]
+    return [c for c in chunks if c[0] != held_out_file], [c for c in chunks if c[0] == held_out_file]
+
+def new_models():
+    # Same settings as train_models.py, grown from zero trees
+    return {name: build_model(name).set_params(n_estimators=0, warm_start=True) for name in TARGET_COLUMNS}
+
+def fit_chunk(models, X, df, trees):
+    """Add `trees` trees fitted on this chunk to every model"""
+    for name, model in models.items():
+        y = df[TARGET_COLUMNS[name]]
+        if name in CLASSIFIERS and model.n_estimators and not np.array_equal(np.unique(y), model.classes_):
+            raise ValueError(f'Chunk is missing a {name} class; regenerate with larger chunks')
+        model.n_estimators += trees
+        model.fit(X, y)
+
+def evaluate(models, held_out, columns, encodings):
+    """MAE/RMSE (regressors) or accuracy (classifier) streamed over the held-out chunks"""
+    sums = {name: {'abs': 0.0, 'sq': 0.0, 'correct': 0} for name in models}
+    n = 0
+    for chunk in held_out:
+        df = read_chunk(chunk, columns)
+        X = prepare_features(df, encodings)
+        n += len(df)
+        for name, model in models.items():
+            y = df[TARGET_COLUMNS[name]].to_numpy()
+            pred = model.predict(X)
+            if name in CLASSIFIERS:
+                sums[name]['correct'] += int((pred == y).sum())
+            else:
+                sums[name]['abs'] += float(np.abs(pred - y).sum())
+                sums[name]['sq'] += float(((pred - y) ** 2).sum())
+    report = {}
+    for name, s in sums.items():
+        if name in CLASSIFIERS:
+            report[name] = {'accuracy': s['correct'] / n}
+        else:
+            report[name] = {'mae': s['abs'] / n, 'rmse': math.sqrt(s['sq'] / n)}
+    return report, n
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Train the models chunk by chunk from a Parquet dataset')
+    parser.add_argument('--data', default=None, help='Parquet file or shard directory (default: as train_models.py)')
+    parser.add_argument('--trees', type=int, default=100, help='approximate trees per model in total')
+    parser.add_argument('--models-dir', default='models')
+    args = parser.parse_args(argv)
+
+    path = find_dataset(args.data)
+    if path is None or path.endswith('.csv'):
+        print("Parquet dataset not found. Please run generate_dataset.py (--shards N for large datasets) first.")
+        return
+    chunks = dataset_chunks(path)
+    if len(chunks) < 2:
+        print("Need at least two chunks (one is held out); regenerate with --shards or a smaller --chunk-rows.")
+        return
+    training, held_out = split_chunks(chunks)
+    trees = max(1, round(args.trees / len(training)))
+    print(f"Training on {len(training)} chunks ({trees} trees per model each), "
+          f"{len(held_out)} held-out chunks from {path}")
+
+    models = new_models()
+    feature_columns = None
+    encodings = None
+    start = time.perf_counter()
+    for i, chunk in enumerate(training):
+        chunk_start = time.perf_counter()
+        df = read_chunk(chunk, DATASET_COLUMNS)
+        # Codes are fitted once (every chunk's categoricals carry all categories) and reused
+        if encodings is None:
+            encodings = dataset_encodings(df)
+        X = prepare_features(df, encodings)
+        feature_columns = X.columns.tolist()
+        fit_chunk(models, X, df, trees)
+        print(f"  chunk {i + 1}/{len(training)}: {len(df)} rows in {time.perf_counter() - chunk_start:.1f}s")
+        # Only one chunk is held in memory
+        del df, X
+    print(f"Trained {models['priority_scorer'].n_estimators} trees per model in {time.perf_counter() - start:.1f}s")
+
+    report, n_held_out = evaluate(models, held_out, DATASET_COLUMNS, encodings)
+    print(f"\n=== Held-out evaluation ({n_held_out} rows) ===")
+    for name, metrics in report.items():
+        print(f"{name:22s} " + '  '.join(f'{k}: {v:.4f}' for k, v in metrics.items()))
+
+    # Served like the in-memory models; warm_start is only a training setting
+    for model in models.values():
+        model.set_params(warm_start=False)
+    print("\n=== Saving Models ===")
+    save_models(models, args.models_dir)
+    feature_info = {
+        'feature_columns': feature_columns,
+        'encodings': encodings,
+        'category_mapping': {code: name for name, code in encodings['category'].items()},
+    }
+    joblib.dump(feature_info, f'{args.models_dir}/feature_info.joblib')
+    print(f"Saved: {args.models_dir}/feature_info.joblib")
+
+    print("\n=== Training Complete ===")
+
+if __name__ == '__main__':
+    main()
@@ -8,185 +8,297 @@ from sklearn.ensemble import RandomForestRegressor, RandomForestClassifier
 from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import mean_absolute_error, mean_squared_error, accuracy_score, classification_report
 import joblib
+import argparse
+import json
 import os
+import shutil
+import time
 
-def load_dataset():
-    """Load the generated dataset"""
-    if not os.path.exists('food_waste_dataset.csv'):
+from dataset_io import find_dataset, read_dataset
+from features import FeatureBuilder, fit_encodings
+from forest_engine import compact_path, compile_forest, compiled_path
+
+# Dataset column each model is trained on
+TARGET_COLUMNS = {
+    'expiration_predictor': 'days_remaining',
+    'waste_risk_predictor': 'waste_risk',
+    'donation_recommender': 'should_donate',
+    'priority_scorer': 'priority_score',
+}
+
+# Outputs of the fused multi-output forest, in column order, and the model each one replaces
+FUSED_OUTPUTS = {
+    'expiration': 'expiration_predictor',
+    'waste_risk': 'waste_risk_predictor',
+    'priority': 'priority_scorer',
+    'donation_probability': 'donation_recommender',
+}
+
+# Dataset columns read for training: the raw inputs of the shared feature pipeline and the targets
+DATASET_COLUMNS = list(dict.fromkeys([
+    'category',
+    'restaurant_type',
+    'quantity',
+    'days_remaining',
+    'shelf_life',
+    'month',
+    'day_of_week',
+] + list(TARGET_COLUMNS.values())))
+
+def load_dataset(path=None, columns=DATASET_COLUMNS):
+    """Load the generated dataset (Parquet file or shard directory, or legacy CSV)"""
+    path = find_dataset(path)
+    if path is None:
         print("Dataset not found. Please run generate_dataset.py first.")
         return None
-    return pd.read_csv('food_waste_dataset.csv', parse_dates=['purchase_date', 'expiry_date'])
-
-def prepare_features(df):
-    """Prepare features for ML models"""
-    # CRITICAL: Use days_remaining (from today) instead of days_until_expiry (total shelf life)
-    # This is what we actually need for real-time predictions
-    
-    # Feature columns
-    feature_cols = [
-        'category_encoded',
-        'restaurant_type_encoded',
-        'quantity',
-        'days_remaining',  # CHANGED: Use days_remaining from today, not days_until_expiry
-        'shelf_life',  # Keep shelf_life as additional context
-        'month',
-        'day_of_week',
-        'is_weekend',
-        'waste_probability',
-    ]
-    
-    X = df[feature_cols].copy()
-    
-    # Add interaction features
-    X['quantity_expiry_interaction'] = X['quantity'] * X['days_remaining']  # CHANGED
-    X['category_waste_interaction'] = X['category_encoded'] * X['waste_probability']
-    
-    # Add enhanced features for better donation prediction
-    perishable_categories = ['Fruits', 'Vegetables', 'Dairy', 'Meat', 'Bakery', 'Prepared Foods']
-    X['is_perishable'] = df['category'].isin(perishable_categories).astype(int)
-    X['high_quantity'] = (X['quantity'] >= 30).astype(int)
-    X['very_high_quantity'] = (X['quantity'] >= 50).astype(int)
-    X['quantity_perishable_interaction'] = X['quantity'] * X['is_perishable']
-    
-    # Add urgency features based on days_remaining
-    X['is_expired'] = (X['days_remaining'] < 0).astype(int)
-    X['expiring_today'] = (X['days_remaining'] <= 1).astype(int)
-    X['expiring_soon'] = (X['days_remaining'] <= 7).astype(int)
-    
-    return X
-
-def train_expiration_predictor(X, y):
-    """Train model to predict days until expiration"""
-    print("\n=== Training Expiration Predictor ===")
-    
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42
-    )
-    
-    # Train Random Forest Regressor
-    model = RandomForestRegressor(
-        n_estimators=100,
-        max_depth=15,
-        min_samples_split=5,
-        random_state=42,
-        n_jobs=-1
-    )
-    
-    model.fit(X_train, y_train)
-    
-    # Evaluate
-    y_pred = model.predict(X_test)
-    mae = mean_absolute_error(y_test, y_pred)
-    rmse = np.sqrt(mean_squared_error(y_test, y_pred))
-    
-    print(f"MAE: {mae:.2f} days")
-    print(f"RMSE: {rmse:.2f} days")
-    print(f"Feature importance (top 5):")
-    feature_importance = pd.Series(model.feature_importances_, index=X.columns)
-    print(feature_importance.nlargest(5))
-    
-    return model
+    print(f"Reading {path}")
+    return read_dataset(path, columns=columns)
 
-def train_waste_risk_predictor(X, y):
-    """Train model to predict waste risk (0-100)"""
-    print("\n=== Training Waste Risk Predictor ===")
-    
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42
-    )
-    
-    # Train Random Forest Regressor
-    model = RandomForestRegressor(
-        n_estimators=100,
-        max_depth=15,
-        min_samples_split=5,
-        random_state=42,
-        n_jobs=-1
+def dataset_encodings(df):
+    """Category and restaurant type codes fitted on the dataset (stored in feature_info)"""
+    return fit_encodings(df['category'], df['restaurant_type'])
+
+def prepare_features(df, encodings=None):
+    """Prepare features for ML models with the pipeline ml_api.py serves with (features.FeatureBuilder)"""
+    # CRITICAL: days_remaining is counted from today, not the total shelf life (days_until_expiry);
+    # this is what we actually need for real-time predictions
+    builder = FeatureBuilder(encodings or dataset_encodings(df))
+    X = builder.build_matrix(
+        category=df['category'],
+        restaurant_type=df['restaurant_type'],
+        quantity=df['quantity'],
+        days_remaining=df['days_remaining'],
+        shelf_life=df['shelf_life'],
+        month=df['month'],
+        day_of_week=df['day_of_week'],
     )
-    
-    model.fit(X_train, y_train)
-    
-    # Evaluate
+    return pd.DataFrame(X, columns=builder.feature_columns, index=df.index)
+
+# Settings shared by every forest
+FOREST_PARAMS = {
+    'n_estimators': 100,
+    'max_depth': 15,
+    'min_samples_split': 5,
+    'random_state': 42,
+}
+
+# Section title and MAE unit printed for each model
+MODEL_TITLES = {
+    'expiration_predictor': ('Expiration Predictor', ' days'),
+    'waste_risk_predictor': ('Waste Risk Predictor', ''),
+    'donation_recommender': ('Donation Recommender', ''),
+    'priority_scorer': ('Priority Scorer', ''),
+}
+
+CLASSIFIERS = {'donation_recommender'}
+
+def build_model(name, n_jobs=-1):
+    """Untrained forest for one model"""
+    forest = RandomForestClassifier if name in CLASSIFIERS else RandomForestRegressor
+    return forest(n_jobs=n_jobs, **FOREST_PARAMS)
+
+def split_indices(n_rows):
+    """Train/test row indices; the same split train_test_split(X, y, test_size=0.2, random_state=42) gives"""
+    return train_test_split(np.arange(n_rows), test_size=0.2, random_state=42)
+
+def evaluation_report(name, model, X_test, y_test, feature_names):
+    """Held-out metrics and top features as printable text, plus the metrics as a dict"""
+    title, unit = MODEL_TITLES[name]
     y_pred = model.predict(X_test)
-    mae = mean_absolute_error(y_test, y_pred)
-    rmse = np.sqrt(mean_squared_error(y_test, y_pred))
-    
-    print(f"MAE: {mae:.2f}")
-    print(f"RMSE: {rmse:.2f}")
-    print(f"Feature importance (top 5):")
-    feature_importance = pd.Series(model.feature_importances_, index=X.columns)
-    print(feature_importance.nlargest(5))
+    lines = [f"\n=== Training {title} ==="]
+    if name in CLASSIFIERS:
+        metrics = {'accuracy': float(accuracy_score(y_test, y_pred))}
+        lines.append(f"Accuracy: {metrics['accuracy']:.4f}")
+        lines.append("\nClassification Report:")
+        lines.append(classification_report(y_test, y_pred))
+        lines.append(f"\nFeature importance (top 5):")
+    else:
+        metrics = {
+            'mae': float(mean_absolute_error(y_test, y_pred)),
+            'rmse': float(np.sqrt(mean_squared_error(y_test, y_pred))),
+        }
+        lines.append(f"MAE: {metrics['mae']:.2f}{unit}")
+        lines.append(f"RMSE: {metrics['rmse']:.2f}{unit}")
+        lines.append(f"Feature importance (top 5):")
+    feature_importance = pd.Series(model.feature_importances_, index=feature_names)
+    lines.append(str(feature_importance.nlargest(5)))
+    return '\n'.join(lines), metrics
+
+def fit_shared(name, X_path, n_train, y, feature_names, n_jobs):
+    """Worker: fit one model on the shared memory-mapped matrix; returns (model, report text, metrics, timings)"""
+    # Training rows come first, so both halves are views of the mapped file and nothing is copied
+    X = np.load(X_path, mmap_mode='r')
+    X_train, X_test = X[:n_train], X[n_train:]
+    
+    start = time.perf_counter()
+    model = build_model(name, n_jobs)
+    model.fit(X_train, y[:n_train])
+    fit_s = time.perf_counter() - start
+    # Same fitted attributes as a fit on the DataFrame
+    model.feature_names_in_ = np.array(feature_names, dtype=object)
+    
+    start = time.perf_counter()
+    text, metrics = evaluation_report(name, model, X_test, y[n_train:], feature_names)
+    return model, text, metrics, {'fit_s': fit_s, 'evaluate_s': time.perf_counter() - start}
+
+def train_all(X, df, jobs=None):
+    """Train the four models concurrently from one feature matrix and one split
+
+    X is written once as a float32 memmap (the dtype the forests train on)
+    ordered training rows first; every worker process maps the same file.
+    Workers split the cores between them for their own tree building.
+    """
+    from joblib import Parallel, delayed
+    import tempfile
+    
+    jobs = jobs or os.cpu_count()
+    workers = max(1, min(jobs, len(TARGET_COLUMNS)))
+    threads_per_model = max(1, jobs // workers)
+    train_idx, test_idx = split_indices(len(X))
+    order = np.concatenate([train_idx, test_idx])
+    feature_names = X.columns.tolist()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        X_path = os.path.join(tmp, 'X.npy')
+        np.save(X_path, np.ascontiguousarray(X.to_numpy(dtype=np.float32)[order]))
+        
+        start = time.perf_counter()
+        results = Parallel(n_jobs=workers)(
+            delayed(fit_shared)(name, X_path, len(train_idx), df[target].to_numpy()[order], feature_names,
+                                threads_per_model)
+            for name, target in TARGET_COLUMNS.items()
+        )
+        wall_s = time.perf_counter() - start
     
-    return model
+    models = {}
+    report = {'jobs': jobs, 'workers': workers, 'threads_per_model': threads_per_model, 'models': {}}
+    for name, (model, text, metrics, timings) in zip(TARGET_COLUMNS, results):
+        print(text)
+        models[name] = model
+        report['models'][name] = dict(metrics, **timings)
+    report['wall_s'] = wall_s
+    
+    print("\n=== Training Times ===")
+    for name, entry in report['models'].items():
+        print(f"{name:22s} fit {entry['fit_s']:7.2f}s  evaluate {entry['evaluate_s']:6.2f}s")
+    print(f"Wall clock: {wall_s:.2f}s for {len(models)} models "
+          f"({workers} workers x {threads_per_model} threads)")
+    return models, report
 
-def train_donation_recommender(X, y):
-    """Train model to recommend if item should be donated"""
-    print("\n=== Training Donation Recommender ===")
+def train_fused_predictor(X, targets):
+    """Train one multi-output forest for all four targets"""
+    print("\n=== Training Fused Predictor ===")
     
     X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42
+        X, targets, test_size=0.2, random_state=42
     )
     
-    # Train Random Forest Classifier
-    model = RandomForestClassifier(
-        n_estimators=100,
-        max_depth=15,
-        min_samples_split=5,
-        random_state=42,
-        n_jobs=-1
-    )
+    # Standardize targets so the shared split criterion weighs them equally
+    target_mean = y_train.mean().to_numpy(dtype=np.float64)
+    target_scale = y_train.std().to_numpy(dtype=np.float64, copy=True)
+    target_scale[target_scale == 0] = 1.0
     
-    model.fit(X_train, y_train)
+    # The same FOREST_PARAMS as the separate forests, so tuned settings apply to it too
+    model = build_model('fused_predictor')
     
-    # Evaluate
-    y_pred = model.predict(X_test)
-    accuracy = accuracy_score(y_test, y_pred)
+    model.fit(X_train, (y_train.values - target_mean) / target_scale)
     
-    print(f"Accuracy: {accuracy:.4f}")
-    print("\nClassification Report:")
-    print(classification_report(y_test, y_pred))
-    print(f"\nFeature importance (top 5):")
-    feature_importance = pd.Series(model.feature_importances_, index=X.columns)
-    print(feature_importance.nlargest(5))
+    # Fold the scaling back into the leaf values so predictions come out in target units
+    compiled = compile_forest(model)
+    compiled.value = compiled.value * target_scale + target_mean
     
-    return model
+    return compiled
 
-def train_priority_scorer(X, y):
-    """Train model to predict priority score"""
-    print("\n=== Training Priority Scorer ===")
-    
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42
-    )
+def measure_latency(predict, X, repeats):
+    """Median wall time in milliseconds of predict(X)"""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        predict(X)
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+def compare_fused(X, targets, compiled_models, fused):
+    """Compare accuracy and latency of the fused forest against the four separate forests"""
+    print("\n=== Fused vs Separate Models ===")
     
-    # Train Random Forest Regressor
-    model = RandomForestRegressor(
-        n_estimators=100,
-        max_depth=15,
-        min_samples_split=5,
-        random_state=42,
-        n_jobs=-1
+    _, X_test, _, y_test = train_test_split(
+        X, targets, test_size=0.2, random_state=42
     )
+    X_test = X_test.values
+    fused_pred = fused.predict(X_test)
+    
+    report = {'accuracy': {}, 'latency_ms': {}}
+    for i, (output, name) in enumerate(FUSED_OUTPUTS.items()):
+        y_true = y_test[TARGET_COLUMNS[name]].values
+        if name == 'donation_recommender':
+            separate_pred = compiled_models[name].predict(X_test)
+            fused_label = (fused_pred[:, i] >= 0.5).astype(int)
+            metric = 'accuracy'
+            separate_score = accuracy_score(y_true, separate_pred)
+            fused_score = accuracy_score(y_true, fused_label)
+        else:
+            metric = 'mae'
+            separate_score = mean_absolute_error(y_true, compiled_models[name].predict(X_test))
+            fused_score = mean_absolute_error(y_true, fused_pred[:, i])
+        report['accuracy'][output] = {
+            'metric': metric,
+            'separate': float(separate_score),
+            'fused': float(fused_score),
+        }
+        print(f"{output}: {metric} separate={separate_score:.4f} fused={fused_score:.4f}")
+    
+    def predict_separate(rows):
+        for name in FUSED_OUTPUTS.values():
+            compiled_models[name].predict(rows)
+    
+    for label, rows, repeats in [('single_row', X_test[:1], 200), ('batch_1000', X_test[:1000], 5)]:
+        separate_ms = measure_latency(predict_separate, rows, repeats)
+        fused_ms = measure_latency(fused.predict, rows, repeats)
+        report['latency_ms'][label] = {'separate': separate_ms, 'fused': fused_ms}
+        print(f"{label} latency: separate={separate_ms:.3f} ms fused={fused_ms:.3f} ms")
+    
+    report['nodes'] = {
+        'separate': int(sum(len(compiled_models[name].feature) for name in FUSED_OUTPUTS.values())),
+        'fused': int(len(fused.feature)),
+    }
+    return report
+
+def save_models(models, models_dir='models'):
+    """Write each model as a joblib pickle and as a compiled forest, dropping its stale compact forest"""
+    os.makedirs(models_dir, exist_ok=True)
     
-    model.fit(X_train, y_train)
-    
-    # Evaluate
-    y_pred = model.predict(X_test)
-    mae = mean_absolute_error(y_test, y_pred)
-    rmse = np.sqrt(mean_squared_error(y_test, y_pred))
-    
-    print(f"MAE: {mae:.2f}")
-    print(f"RMSE: {rmse:.2f}")
-    print(f"Feature importance (top 5):")
-    feature_importance = pd.Series(model.feature_importances_, index=X.columns)
-    print(feature_importance.nlargest(5))
-    
-    return model
+    for name, model in models.items():
+        model_path = os.path.join(models_dir, f'{name}.joblib')
+        joblib.dump(model, model_path)
+        print(f"Saved: {model_path}")
+        
+        # Flat-array export served by the NumPy inference engine
+        compiled_model_path = compiled_path(models_dir, name)
+        compile_forest(model).save(compiled_model_path)
+        print(f"Saved: {compiled_model_path}")
+        
+        # ML_COMPACT=1 serves the compact forest whenever it exists; one compacted from the
+        # previous training would no longer match the new forest (rerun compact_models.py)
+        compact_model_path = compact_path(models_dir, name)
+        if os.path.isdir(compact_model_path):
+            shutil.rmtree(compact_model_path)
+            print(f"Removed stale: {compact_model_path}")
 
-def main():
+def main(argv=None):
     """Main training function"""
+    parser = argparse.ArgumentParser(description='Train food waste ML models')
+    parser.add_argument('--fused', action='store_true',
+                        help='also train one multi-output forest for all targets and write a comparison report')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='CPU cores shared by the four concurrent fits (default: all)')
+    parser.add_argument('--data', default=None,
+                        help='dataset file or shard directory (default: food_waste_dataset.parquet, '
+                             'food_waste_dataset/ or food_waste_dataset.csv)')
+    args = parser.parse_args(argv)
+    
     print("Loading dataset...")
-    df = load_dataset()
+    df = load_dataset(args.data)
     
     if df is None:
         return
@@ -195,52 +307,40 @@ def main():
     
     # Prepare features
     print("\nPreparing features...")
-    X = prepare_features(df)
-    
-    # Train models
-    models = {}
-    
-    # 1. Expiration predictor - predict days_remaining from today
-    y_expiry = df['days_remaining']  # CHANGED: Predict days_remaining, not days_until_expiry
-    models['expiration_predictor'] = train_expiration_predictor(X, y_expiry)
-    
-    # 2. Waste risk predictor - use improved waste_risk calculation
-    y_waste_risk = df['waste_risk']
-    models['waste_risk_predictor'] = train_waste_risk_predictor(X, y_waste_risk)
+    encodings = dataset_encodings(df)
+    X = prepare_features(df, encodings)
     
-    # 3. Donation recommender
-    y_donate = df['should_donate']
-    models['donation_recommender'] = train_donation_recommender(X, y_donate)
-    
-    # 4. Priority scorer
-    y_priority = df['priority_score']
-    models['priority_scorer'] = train_priority_scorer(X, y_priority)
+    # Train all four models at once: expiration predicts days_remaining from today (not
+    # days_until_expiry), waste risk uses the improved waste_risk calculation
+    models, training_report = train_all(X, df, args.jobs)
     
     # Save models
     print("\n=== Saving Models ===")
-    os.makedirs('models', exist_ok=True)
+    save_models(models)
+    with open('models/training_report.json', 'w') as f:
+        json.dump(training_report, f, indent=2)
+    print("Saved: models/training_report.json")
     
-    for name, model in models.items():
-        model_path = f'models/{name}.joblib'
-        joblib.dump(model, model_path)
-        print(f"Saved: {model_path}")
-    
-    # Save feature columns for API
+    # Save feature columns and encodings for the API (category_mapping kept for older readers)
     feature_info = {
         'feature_columns': X.columns.tolist(),
+        'encodings': encodings,
+        'category_mapping': {code: name for name, code in encodings['category'].items()},
     }
     
-    # Get category mapping if category column exists
-    if 'category' in df.columns:
-        if df['category'].dtype.name == 'category':
-            category_mapping = dict(enumerate(df['category'].cat.categories))
-        else:
-            # Convert to categorical or get unique values
-            unique_categories = df['category'].unique()
-            category_mapping = dict(enumerate(unique_categories))
-        feature_info['category_mapping'] = category_mapping
-    else:
-        feature_info['category_mapping'] = {}
+    if args.fused:
+        targets = df[[TARGET_COLUMNS[name] for name in FUSED_OUTPUTS.values()]]
+        fused = train_fused_predictor(X, targets)
+        fused_path = compiled_path('models', 'fused_predictor')
+        fused.save(fused_path)
+        print(f"Saved: {fused_path}")
+        feature_info['fused_outputs'] = list(FUSED_OUTPUTS)
+        
+        compiled_models = {name: compile_forest(model) for name, model in models.items()}
+        report = compare_fused(X, targets, compiled_models, fused)
+        with open('models/fused_report.json', 'w') as f:
+            json.dump(report, f, indent=2)
+        print("Saved: models/fused_report.json")
     
     joblib.dump(feature_info, 'models/feature_info.joblib')
     print("Saved: models/feature_info.joblib")
@@ -0,0 +1,279 @@
+"""
+Hyperparameter search for the four forests: accuracy against serving latency
+
+Samples forest size, depth and leaf settings for each target and runs
+successive halving: every candidate is fitted on a small slice of the
+training rows, the survivors of each rung get eta times more rows, and the
+last rung uses the whole training split. Survivors are the candidates on the
+error/latency Pareto front first, then the most accurate, so fast models
+are not pruned for being slightly less accurate. --strategy random fits every
+candidate on all rows instead.
+
+Candidates are scored on a validation slice of the training split. Latency
+is the compiled forest's per-row time in a batch (proportional to the
+traversal work; single-row time, mostly fixed overhead, is reported too),
+measured one model at a time. The final Pareto front is also scored on the held-out test
+split train_models.py uses, and the current settings are always included for
+comparison.
+
+The feature matrix is built once per dataset and feature pipeline and cached as .npy files that
+the parallel workers memory-map.
+
+Usage (from ml/):
+    python tune_models.py [--candidates 24] [--eta 3] [--jobs 4] [--output models/tuning_report.json]
+"""
+import argparse
+import hashlib
+import inspect
+import json
+import math
+import os
+import time
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.metrics import accuracy_score, mean_absolute_error
+
+import features
+from dataset_io import find_dataset, read_dataset
+from forest_engine import compile_forest
+from train_models import (CLASSIFIERS, DATASET_COLUMNS, FOREST_PARAMS, TARGET_COLUMNS, build_model,
+                          measure_latency, prepare_features, split_indices)
+
+SEARCH_SPACE = {
+    'n_estimators': [5, 10, 20, 30, 50, 100],
+    'max_depth': [4, 6, 8, 10, 12, 15],
+    'min_samples_leaf': [1, 2, 5, 10, 20],
+    'max_features': [1.0, 0.5, 'sqrt'],
+}
+
+# Share of the training split used to score candidates
+VALIDATION_FRACTION = 0.2
+
+# Smallest number of training rows a rung fits on
+MIN_RUNG_ROWS = 1000
+
+def current_params():
+    """The settings train_models.py uses today"""
+    return {key: FOREST_PARAMS[key] for key in ('n_estimators', 'max_depth', 'min_samples_split')}
+
+def sample_candidates(n, seed):
+    """n distinct random parameter sets plus the current settings"""
+    rng = np.random.default_rng(seed)
+    candidates = [current_params()]
+    seen = set()
+    for _ in range(n * 20):
+        if len(candidates) > n:
+            break
+        params = {key: values[rng.integers(len(values))] for key, values in SEARCH_SPACE.items()}
+        params = {key: value.item() if isinstance(value, np.generic) else value for key, value in params.items()}
+        key = json.dumps(params, sort_keys=True)
+        if key not in seen:
+            seen.add(key)
+            candidates.append(params)
+    return candidates
+
+def dataset_signature(path):
+    files = [os.path.join(path, f) for f in sorted(os.listdir(path))] if os.path.isdir(path) else [path]
+    return [[os.path.basename(f), os.path.getsize(f), int(os.path.getmtime(f))] for f in files]
+
+def pipeline_signature():
+    """Hash of the feature pipeline's code (features.py and prepare_features) and columns"""
+    digest = hashlib.sha256()
+    for source in (inspect.getsource(features), inspect.getsource(prepare_features), json.dumps(features.FEATURE_COLUMNS)):
+        digest.update(source.encode())
+    return digest.hexdigest()
+
+def cached_features(data_path, cache_dir, max_rows=None):
+    """Cache metadata for the feature matrix and targets, built once per dataset and reused
+
+    X is stored as float32 (what the forests train on) with the training rows
+    first, so training, validation and test slices are contiguous views. The
+    cache is rebuilt when the dataset, max_rows or the feature code changes.
+    """
+    meta_path = os.path.join(cache_dir, 'meta.json')
+    signature = dataset_signature(data_path)
+    pipeline = pipeline_signature()
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta['signature'] == signature and meta['max_rows'] == max_rows and meta.get('pipeline') == pipeline:
+            print(f"Using cached features in {cache_dir}")
+            return meta
+        if meta.get('pipeline') != pipeline:
+            print("Feature pipeline changed since the cache was built")
+
+    print(f"Building features from {data_path}")
+    df = read_dataset(data_path, columns=DATASET_COLUMNS)
+    if max_rows and len(df) > max_rows:
+        df = df.sample(n=max_rows, random_state=42).reset_index(drop=True)
+    X = prepare_features(df)
+    train_idx, test_idx = split_indices(len(X))
+    order = np.concatenate([train_idx, test_idx])
+
+    os.makedirs(cache_dir, exist_ok=True)
+    np.save(os.path.join(cache_dir, 'X.npy'), np.ascontiguousarray(X.to_numpy(dtype=np.float32)[order]))
+    for name, target in TARGET_COLUMNS.items():
+        np.save(os.path.join(cache_dir, f'y_{name}.npy'), df[target].to_numpy()[order])
+    meta = {
+        'dataset': data_path,
+        'signature': signature,
+        'pipeline': pipeline,
+        'max_rows': max_rows,
+        'rows': len(X),
+        'n_train': len(train_idx),
+        'feature_columns': X.columns.tolist(),
+    }
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+def error(name, y_true, y_pred):
+    """Lower is better for every target: MAE, or 1 - accuracy for the classifier"""
+    if name in CLASSIFIERS:
+        return 1.0 - accuracy_score(y_true, y_pred)
+    return mean_absolute_error(y_true, y_pred)
+
+def fit_candidate(name, params, cache_dir, n_fit, n_train):
+    """Worker: fit one candidate on the first n_fit training rows and score it on the validation slice"""
+    X = np.load(os.path.join(cache_dir, 'X.npy'), mmap_mode='r')
+    y = np.load(os.path.join(cache_dir, f'y_{name}.npy'), mmap_mode='r')
+    n_val = int(n_train * VALIDATION_FRACTION)
+    val_start = n_train - n_val
+
+    start = time.perf_counter()
+    model = build_model(name, n_jobs=1).set_params(**params)
+    model.fit(X[:min(n_fit, val_start)], y[:min(n_fit, val_start)])
+    fit_s = time.perf_counter() - start
+    return {
+        'params': params,
+        'rows': min(n_fit, val_start),
+        'validation_error': float(error(name, y[val_start:n_train], model.predict(X[val_start:n_train]))),
+        'fit_s': fit_s,
+        'forest': compile_forest(model),
+    }
+
+def measure_serving(result, X_rows):
+    """Add single-row and batch latency of the compiled forest to a candidate result"""
+    forest = result.pop('forest')
+    predict = forest.predict_proba if forest.is_classifier else forest.predict
+    result['single_row_ms'] = measure_latency(predict, X_rows[:1], 50)
+    result['batch_us_per_row'] = measure_latency(predict, X_rows, 3) * 1000 / len(X_rows)
+    result['nodes'] = int(len(forest.feature))
+    return forest
+
+def pareto_front(results, keys=('validation_error', 'batch_us_per_row')):
+    """Results not dominated on every key (lower is better), ordered by the first key"""
+    ordered = sorted(results, key=lambda r: tuple(r[k] for k in keys))
+    front = []
+    best_second = math.inf
+    for result in ordered:
+        if result[keys[1]] < best_second:
+            front.append(result)
+            best_second = result[keys[1]]
+    return front
+
+def survivors(results, keep):
+    """The whole Pareto front, topped up with the most accurate others to keep candidates"""
+    front = pareto_front(results)
+    rest = sorted((r for r in results if r not in front), key=lambda r: r['validation_error'])
+    return front + rest[:max(0, keep - len(front))]
+
+def halving_rungs(n_candidates, eta):
+    """Number of rungs that leaves at least eta candidates for the full-data rung"""
+    rungs = 1
+    while math.ceil(n_candidates / eta) >= eta:
+        n_candidates = math.ceil(n_candidates / eta)
+        rungs += 1
+    return rungs
+
+def tune_target(name, candidates, meta, cache_dir, strategy, eta, jobs, X_rows):
+    """Search one target; returns every full-data result, the Pareto front and the rung history"""
+    n_train = meta['n_train']
+    n_fit_max = n_train - int(n_train * VALIDATION_FRACTION)
+    if strategy == 'halving':
+        n_rungs = halving_rungs(len(candidates), eta)
+        rung_rows = [max(MIN_RUNG_ROWS, int(n_fit_max / eta ** (n_rungs - 1 - k))) for k in range(n_rungs)]
+    else:
+        rung_rows = [n_fit_max]
+
+    history = []
+    active = [c['params'] for c in candidates]
+    for rung, rows in enumerate(rung_rows):
+        start = time.perf_counter()
+        results = Parallel(n_jobs=jobs)(
+            delayed(fit_candidate)(name, params, cache_dir, rows, n_train) for params in active
+        )
+        for result in results:
+            measure_serving(result, X_rows)
+        history.append({'rung': rung, 'rows': min(rows, n_fit_max), 'candidates': len(results),
+                        'seconds': time.perf_counter() - start})
+        print(f"  rung {rung}: {len(results)} candidates on {min(rows, n_fit_max)} rows "
+              f"in {history[-1]['seconds']:.1f}s")
+        if rung < len(rung_rows) - 1:
+            active = [r['params'] for r in survivors(results, max(1, math.ceil(len(results) / eta)))]
+    return results, pareto_front(results), history
+
+def test_error(name, params, meta, cache_dir):
+    """Refit on the whole training split and score on the held-out test split"""
+    X = np.load(os.path.join(cache_dir, 'X.npy'), mmap_mode='r')
+    y = np.load(os.path.join(cache_dir, f'y_{name}.npy'), mmap_mode='r')
+    n_train = meta['n_train']
+    model = build_model(name, n_jobs=1).set_params(**params)
+    model.fit(X[:n_train], y[:n_train])
+    return float(error(name, y[n_train:], model.predict(X[n_train:])))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Search forest hyperparameters for accuracy vs serving latency')
+    parser.add_argument('--data', default=None, help='dataset (default: as train_models.py)')
+    parser.add_argument('--models', default=','.join(TARGET_COLUMNS),
+                        type=lambda s: [name for name in s.split(',') if name])
+    parser.add_argument('--strategy', choices=['halving', 'random'], default='halving')
+    parser.add_argument('--candidates', type=int, default=24, help='random candidates per model')
+    parser.add_argument('--eta', type=int, default=3, help='halving: keep 1/eta candidates per rung')
+    parser.add_argument('--jobs', type=int, default=-1, help='parallel candidate fits (default: all cores)')
+    parser.add_argument('--max-rows', type=int, default=None, help='subsample the dataset to this many rows')
+    parser.add_argument('--cache-dir', default='.tune_cache')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='models/tuning_report.json')
+    args = parser.parse_args(argv)
+
+    data_path = find_dataset(args.data)
+    if data_path is None:
+        print("Dataset not found. Please run generate_dataset.py first.")
+        return
+    meta = cached_features(data_path, args.cache_dir, args.max_rows)
+    X = np.load(os.path.join(args.cache_dir, 'X.npy'), mmap_mode='r')
+    # Latency is measured on validation rows as served: float64 feature rows
+    X_rows = np.array(X[meta['n_train'] - 1000:meta['n_train']], dtype=np.float64)
+
+    report = {'dataset': data_path, 'rows': meta['rows'], 'strategy': args.strategy, 'models': {}}
+    for name in args.models:
+        print(f"\n=== Tuning {name} ({TARGET_COLUMNS[name]}) ===")
+        candidates = [{'params': params} for params in sample_candidates(args.candidates, args.seed)]
+        results, front, history = tune_target(name, candidates, meta, args.cache_dir, args.strategy,
+                                              args.eta, args.jobs, X_rows)
+        for result in front:
+            result['test_error'] = test_error(name, result['params'], meta, args.cache_dir)
+
+        metric = '1 - accuracy' if name in CLASSIFIERS else 'MAE'
+        print(f"Pareto front ({metric} vs batched latency per row):")
+        for result in front:
+            current = '  (current)' if result['params'] == current_params() else ''
+            print(f"  error {result['validation_error']:8.4f} (test {result['test_error']:8.4f})  "
+                  f"{result['batch_us_per_row']:7.2f} us/row batched  {result['single_row_ms']:7.3f} ms single row  "
+                  f"{result['nodes']:8d} nodes  {result['params']}{current}")
+        report['models'][name] = {
+            'metric': metric,
+            'pareto_front': front,
+            'final_rung': sorted(results, key=lambda r: r['validation_error']),
+            'rungs': history,
+        }
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved: {args.output}")
+
+if __name__ == '__main__':
+    main()
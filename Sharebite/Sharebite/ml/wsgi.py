@@ -0,0 +1,8 @@
+"""
+WSGI entry point for production serving
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+from ml_api import create_app
+
+app = create_app()